@@ -0,0 +1,285 @@
+"""
+Benchmark suite for the function app routes.
+
+Imports function_app and drives its routes with FastAPI requests,
+with Cosmos DB and Azure OpenAI served by the stand-ins in fakes.py. Each
+catalog size runs in its own process, so module-level caches start cold
+and peak memory is per size. For every scenario it reports p50/p95/p99
+latency, throughput, errors and the request units the fake Cosmos DB
+container charged. For every catalog size it also reports the cold catalog
+load (first /getmovies), with its traced peak allocation and the process's
+peak RSS.
+
+The "getmovies expiring" scenario spreads its requests over time with a
+catalog TTL of --expiring-ttl, so the cached catalog expires many times
+during the run; run it with CATALOG_MAX_STALE_SECONDS=0 to compare against
+requests waiting for every reload. "searchmovies expiring" does the same
+for searches while the search index catches up with each reloaded catalog.
+
+Catalog sizes are a comma-separated list of row counts; "csv" stands for
+scripts/data/movies.csv. Synthetic catalogs are laid out exactly as
+seed_data.py writes them in the --layout chosen (year documents by default),
+with cover URLs, plus the catalog snapshot manifest and chunks. With
+--synthetic-key they are stored as in a container migrated to the synthetic
+/pk partition key.
+
+Requirements:
+- The packages in movie-api/requirements.txt and scripts/ (azure-cosmos)
+
+Example usage:
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --sizes csv,100000,1000000 --requests 100
+    python benchmarks/benchmark.py --json results.json  # save for comparing runs
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from fakes import http_request
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCHMARKS_DIR.parent / 'scripts'
+CSV_PATH = SCRIPTS_DIR / 'data' / 'movies.csv'
+
+
+def csv_movies(path=CSV_PATH):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [
+            {"title": row['Title'], "genre": row['Genre'], "year": int(row['Year'])}
+            for row in csv.DictReader(f)
+        ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def scenarios(movies, rng, batch_size):
+    """name -> (function name, function(i) -> (method, params, body), untimed priming requests)"""
+    years = sorted({movie['year'] for movie in movies})
+    titles = [movie['title'] for movie in movies]
+    genres = sorted({movie['genre'] for movie in movies})
+    # Each cold summary request asks for a movie nobody asked for before
+    cold = rng.sample(titles, len(titles))
+    warm = titles[:10]
+
+    def decade(start):
+        return "GET", {"from": str(start), "to": str(start + 9)}, None
+
+    return {
+        "getmovies": ("get_movies", lambda i: ("GET", {}, None), 0),
+        "getmovies filtered": ("get_movies", lambda i: (
+            "GET", {"genre": rng.choice(genres), "limit": "50"}, None), 0),
+        "getmoviesbyyear": ("get_movies_by_year", lambda i: (
+            "GET", {"year": str(rng.choice(years))}, None), 0),
+        "getmoviesbyyears": ("get_movies_by_years", lambda i: decade(rng.choice(years)), 0),
+        "searchmovies": ("search_movies", lambda i: (
+            "GET", {"q": rng.choice(titles)[:rng.randint(3, 10)]}, None), 1),
+        "getmoviesummary cold": ("get_movie_summary", lambda i: (
+            "GET", {"title": cold[i % len(cold)]}, None), 0),
+        "getmoviesummary warm": ("get_movie_summary", lambda i: (
+            "GET", {"title": warm[i % len(warm)]}, None), len(warm)),
+        "getmoviesummaries": ("get_movie_summaries", lambda i: (
+            "POST", {}, {"movies": rng.sample(titles, min(batch_size, len(titles)))}), 0),
+    }
+
+
+async def run_scenario(handler, route, build, requests, concurrency, containers, interval=0.0):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    charge_before = sum(container.request_charge for container in containers)
+
+    async def one(i):
+        nonlocal errors
+        method, params, body = build(i)
+        req = http_request(method, route, params, body)
+        # Paced scenarios start request i at i * interval
+        await asyncio.sleep(i * interval)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await handler(req)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": requests / elapsed,
+        "ru": sum(container.request_charge for container in containers) - charge_before,
+        "errors": errors
+    }
+
+
+async def child(args):
+    """Runs in a fresh process for one catalog size and prints its results as JSON"""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    from catalog_snapshot import build_snapshot
+    from fakes import (FakeContainer, FakeOpenAIServer, configure_environment, install_container,
+                       synthetic_movies, user_function, year_documents)
+
+    openai = await FakeOpenAIServer(latency=args.openai_latency).start()
+    # Keep the Cosmos DB summary tier so its request units are counted
+    os.environ["SUMMARY_CACHE_PERSIST"] = "true"
+    configure_environment(openai.url)
+
+    import function_app
+    from catalog import catalog_cache
+    from cosmos_provider import cosmos
+    from openai_client import openai_client
+
+    movies = csv_movies() if args.child == "csv" else synthetic_movies(int(args.child))
+    documents = year_documents(movies, args.layout, args.synthetic_key)
+    if not args.no_snapshot:
+        documents.extend(build_snapshot(documents, synthetic=args.synthetic_key))
+    movies_container = FakeContainer(
+        documents, latency=args.cosmos_latency, partition_key_path="/pk" if args.synthetic_key else "/year"
+    )
+    summaries_container = FakeContainer(latency=args.cosmos_latency)
+    install_container(cosmos, movies_container, summaries_container)
+    containers = (movies_container, summaries_container)
+
+    # Cold catalog load, then a second, traced load for its allocation peak (tracing slows it down)
+    handler = user_function(function_app.get_movies)
+    load = await run_scenario(handler, "getmovies", lambda i: ("GET", {}, None), 1, 1, containers)
+    catalog_cache.invalidate()
+    tracemalloc.start()
+    await handler(http_request('GET', 'getmovies'))
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {}
+    rng = random.Random(42)
+    only = set(args.only.split(',')) if args.only else None
+    for name, (function_name, build, prime) in scenarios(movies, rng, args.batch_size).items():
+        route = name.split()[0]
+        if only and name not in only and route not in only:
+            continue
+        handler = user_function(getattr(function_app, function_name))
+        if prime:
+            await run_scenario(handler, route, build, prime, args.concurrency, containers)
+        results[name] = await run_scenario(
+            handler, route, build, args.requests, args.concurrency, containers
+        )
+
+    # Catalog reads across cache expiries: one request every 5 ms while the catalog keeps expiring
+    if not only or "getmovies expiring" in only or "getmovies" in only:
+        ttl = catalog_cache.ttl
+        catalog_cache.ttl = args.expiring_ttl
+        results["getmovies expiring"] = await run_scenario(
+            user_function(function_app.get_movies), "getmovies", lambda i: ("GET", {}, None),
+            args.requests, args.concurrency, containers, interval=0.005
+        )
+        await catalog_cache.wait_for_refresh()
+        catalog_cache.ttl = ttl
+
+    # Searches while every catalog refresh makes the search index catch up
+    if not only or "searchmovies expiring" in only or "searchmovies" in only:
+        ttl = catalog_cache.ttl
+        catalog_cache.ttl = args.expiring_ttl
+        results["searchmovies expiring"] = await run_scenario(
+            user_function(function_app.search_movies), "searchmovies",
+            lambda i: ("GET", {"q": rng.choice(movies)['title'][:rng.randint(3, 10)]}, None),
+            args.requests, args.concurrency, containers, interval=0.005
+        )
+        await catalog_cache.wait_for_refresh()
+        catalog_cache.ttl = ttl
+
+    await openai_client.close()
+    await openai.stop()
+
+    print(json.dumps({
+        "size": len(movies),
+        "catalog_load": {"ms": load["p50_ms"], "ru": load["ru"], "traced_peak_mb": traced_peak / 2 ** 20},
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scenarios": results
+    }))
+
+
+def run_size(size, args):
+    command = [
+        sys.executable, str(Path(__file__).resolve()), "--child", size,
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--openai-latency", str(args.openai_latency), "--cosmos-latency", str(args.cosmos_latency),
+        "--batch-size", str(args.batch_size), "--layout", args.layout,
+        "--expiring-ttl", str(args.expiring_ttl)
+    ]
+    if args.only:
+        command += ["--only", args.only]
+    if args.no_snapshot:
+        command.append("--no-snapshot")
+    if args.synthetic_key:
+        command.append("--synthetic-key")
+    result = subprocess.run(command, cwd=BENCHMARKS_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark for size {size} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def print_report(report):
+    load = report["catalog_load"]
+    print(f"\n=== {report['size']} movies ===")
+    print(f"cold catalog load: {load['ms']:.1f} ms, {load['ru']:.1f} RU, "
+          f"{load['traced_peak_mb']:.1f} MB traced peak; process peak RSS {report['peak_rss_mb']:.0f} MB")
+    print(f"{'scenario':<22} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'req/s':>9} {'RU/req':>8} {'errors':>7}")
+    for name, row in report["scenarios"].items():
+        print(f"{name:<22} {row['requests']:>8} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+              f"{row['p99_ms']:>8.2f} {row['rps']:>9.1f} {row['ru'] / row['requests']:>8.2f} {row['errors']:>7}")
+
+
+def main(args):
+    reports = []
+    for size in args.sizes.split(','):
+        report = run_size(size.strip(), args)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default="csv,10000,100000", help="Comma-separated catalog sizes (csv = movies.csv)")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight per scenario")
+    parser.add_argument('--openai-latency', type=float, default=0.2, help="Seconds the OpenAI stub waits")
+    parser.add_argument('--cosmos-latency', type=float, default=0.005, help="Seconds per fake Cosmos call")
+    parser.add_argument('--batch-size', type=int, default=10, help="Movies per getmoviesummaries request")
+    parser.add_argument('--only', help="Comma-separated scenarios or routes to run (e.g. getmovies,searchmovies)")
+    parser.add_argument('--no-snapshot', action='store_true', help="Leave out the catalog snapshot document")
+    parser.add_argument('--expiring-ttl', type=float, default=0.1,
+                        help="Catalog TTL in seconds during the getmovies expiring scenario")
+    parser.add_argument('--layout', choices=("year", "letter", "movie"), default="year",
+                        help="Document layout of the catalog (see scripts/document_layout.py)")
+    parser.add_argument('--synthetic-key', action='store_true',
+                        help="Partition the catalog by the synthetic /pk key instead of /year")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args))
+    else:
+        main(args)
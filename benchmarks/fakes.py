@@ -0,0 +1,339 @@
+"""
+In-process stand-ins for Cosmos DB and Azure OpenAI used by the benchmarks.
+
+FakeContainer mimics the parts of azure.cosmos.aio's ContainerProxy the
+function app uses, with a configurable per-call latency. FakeOpenAIServer is
+a local aiohttp server answering chat/completions, so the real client code
+(session, keep-alive, JSON parsing) is exercised end to end.
+
+Synthetic movies carry cover URLs shaped like the ones upload_covers.py
+writes, and FakeContainer rejects items over the 2 MB Cosmos DB limit, so
+benchmarks only run against documents that could exist in production.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import string
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+MOVIE_API_DIR = Path(__file__).resolve().parent.parent / 'movie-api'
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'scripts'
+GENRES = ["Action", "Animation", "Comedy", "Drama", "Fantasy", "Romance", "Thriller"]
+POSTER_BASE = "https://moviesstorage.blob.core.windows.net/movie-images/posters/"
+# Share of synthetic movies OMDB has a poster for
+COVER_RATE = 0.9
+MAX_ITEM_BYTES = 2 * 1024 * 1024
+
+
+def synthetic_cover(title):
+    """Cover fields as upload_covers.py writes them, for a poster with a made-up content hash"""
+    digest = hashlib.sha256(title.encode('utf-8')).hexdigest()
+    return {
+        "coverURL": f"{POSTER_BASE}{digest}.jpg",
+        "coverURLs": {name: f"{POSTER_BASE}{digest}-{name}.webp" for name in ("thumb", "medium")}
+    }
+
+
+def synthetic_movies(count, seed=42):
+    """Generate count movies with unique titles spread over 1950-2024, most with covers"""
+    rng = random.Random(seed)
+    movies = []
+    for i in range(count):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        movie = {
+            "title": f"{word.capitalize()} {i}",
+            "genre": rng.choice(GENRES),
+            "year": rng.randint(1950, 2024)
+        }
+        if rng.random() < COVER_RATE:
+            movie.update(synthetic_cover(movie['title']))
+        movies.append(movie)
+    return movies
+
+
+def year_documents(movies, layout="year", synthetic=False):
+    """
+    Lay movies out as seed_data.py does: one document per year (split when
+    it would be too large), or the items of the letter or movie layout,
+    carrying their synthetic partition key if asked to
+    """
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    from document_layout import build_items
+    by_year = defaultdict(list)
+    for movie in movies:
+        by_year[movie['year']].append(movie)
+    return [
+        item for year, year_movies in by_year.items()
+        for item in build_items(year, year_movies, layout, synthetic=synthetic)
+    ]
+
+
+class NotFound(Exception):
+    status_code = 404
+
+
+class _Pager:
+    """Async iterator over a list, like azure.core's AsyncItemPaged"""
+
+    def __init__(self, items, latency):
+        self._items = items
+        self._latency = latency
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self._latency)
+        for item in self._items:
+            yield item
+
+
+class _ClientConnection:
+    def __init__(self):
+        self.last_response_headers = {}
+
+
+class FakeContainer:
+    """Dictionary-backed container that charges RUs the way Cosmos DB roughly would"""
+
+    def __init__(self, documents=(), latency=0.005, partition_key_path="/year"):
+        for doc in documents:
+            _check_size(doc)
+        self.partition_key_path = partition_key_path
+        self.items = {(doc['id'], self._partition(doc)): doc for doc in documents}
+        self.latency = latency
+        self.request_charge = 0.0
+        self.calls = defaultdict(int)
+        self.client_connection = _ClientConnection()
+
+    def _charge(self, operation, ru, response_hook=None, result=None):
+        self.calls[operation] += 1
+        self.request_charge += ru
+        self.client_connection.last_response_headers = {
+            'x-ms-request-charge': str(ru),
+            'etag': str(sum(self.calls.values()))
+        }
+        if response_hook is not None:
+            response_hook(self.client_connection.last_response_headers, result)
+
+    def _partition(self, doc):
+        # Items without the key field (the summaries) are keyed by id
+        return doc.get(self.partition_key_path.lstrip('/'), doc['id'])
+
+    async def read(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        self._charge('read', 1.0, kwargs.get('response_hook'))
+        return {"partitionKey": {"paths": [self.partition_key_path], "kind": "Hash"}}
+
+    async def read_item(self, item, partition_key, **kwargs):
+        await asyncio.sleep(self.latency)
+        self._charge('read_item', 1.0, kwargs.get('response_hook'))
+        try:
+            return json.loads(json.dumps(self.items[(item, partition_key)]))
+        except KeyError:
+            raise _not_found(item)
+
+    async def upsert_item(self, body, **kwargs):
+        await asyncio.sleep(self.latency)
+        _check_size(body)
+        self._charge('upsert_item', 10.0, kwargs.get('response_hook'), body)
+        self.items[(body['id'], self._partition(body))] = body
+        return body
+
+    def query_items(self, query, **kwargs):
+        # Only the partition key and a @year parameter narrow the result; the query text itself is not evaluated
+        parameters = {parameter['name']: parameter['value'] for parameter in kwargs.get('parameters') or []}
+        if 'partition_key' in kwargs:
+            documents = [doc for (_, partition), doc in self.items.items() if partition == kwargs['partition_key']]
+        elif '@year' in parameters:
+            documents = [doc for doc in self.items.values() if doc.get('year') == parameters['@year']]
+        else:
+            documents = list(self.items.values())
+        size_kb = len(json.dumps(documents)) / 1024
+        self._charge('query_items', 2.5 + size_kb * 0.1, kwargs.get('response_hook'))
+        return _Pager(documents, self.latency)
+
+    def query_items_change_feed(self, **kwargs):
+        self._charge('query_items_change_feed', 1.0, kwargs.get('response_hook'))
+        return _Pager([], self.latency)
+
+
+def _check_size(body):
+    """Reject items Cosmos DB would refuse as too large"""
+    size = len(json.dumps(body).encode('utf-8'))
+    if size > MAX_ITEM_BYTES:
+        raise _too_large(body['id'], size)
+
+
+def _too_large(item, size):
+    message = f"{item} is {size} bytes, over the {MAX_ITEM_BYTES} byte item limit"
+    try:
+        from azure.cosmos.exceptions import CosmosHttpResponseError
+        return CosmosHttpResponseError(status_code=413, message=message)
+    except ImportError:
+        return ValueError(message)
+
+
+def _not_found(item):
+    # Raise the real SDK error when it is installed so the app's except clauses match
+    try:
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+        return CosmosResourceNotFoundError(message=f"{item} not found")
+    except ImportError:
+        return NotFound(f"{item} not found")
+
+
+class FakeOpenAIServer:
+    """Local chat/completions endpoint with a configurable response delay"""
+
+    def __init__(self, latency=0.5):
+        self.latency = latency
+        self.requests = 0
+        self._runner = None
+        self.url = None
+
+    async def _completions(self, request):
+        from aiohttp import web
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        prompt = payload['messages'][-1]['content']
+        content = f"Summary of: {prompt[:60]}"
+        if payload.get('stream'):
+            return await self._stream(request, content)
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 60, "completion_tokens": 40, "total_tokens": 100}
+        })
+
+    async def _stream(self, request, content):
+        from aiohttp import web
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b'data: {"choices": [], "prompt_filter_results": []}\n\n')
+        for word in content.split(' '):
+            chunk = {"choices": [{"delta": {"content": word + ' '}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        # Imported here so startup.py can measure the app's own aiohttp import
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post('/openai/deployments/{deployment}/chat/completions', self._completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def configure_environment(openai_url):
+    """Point the function app at the stand-ins and make it importable"""
+    os.environ.setdefault("COSMOSDB_CONNECTION_STRING", "AccountEndpoint=https://localhost:8081/;AccountKey=fake;")
+    os.environ["OPENAI_API_ENDPOINT"] = openai_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    os.environ.setdefault("OPENAI_DEPLOYMENT_NAME", "gpt-35-turbo-16k")
+    os.environ.setdefault("OPENAI_API_VERSION", "2024-08-01-preview")
+    os.environ.setdefault("SUMMARY_CACHE_PERSIST", "false")
+    if str(MOVIE_API_DIR) not in sys.path:
+        sys.path.insert(0, str(MOVIE_API_DIR))
+
+
+def install_container(provider, movies_container, summaries_container=None):
+    """Make a CosmosProvider hand out fake containers instead of connecting"""
+    containers = {
+        provider.container_name: movies_container,
+        provider.summary_container_name: summaries_container or FakeContainer(latency=movies_container.latency)
+    }
+
+    async def get_container(name=None):
+        return containers[name or provider.container_name]
+
+    provider.get_container = get_container
+    return containers
+
+
+class _FakeDatabase:
+    def __init__(self, containers):
+        self._containers = containers
+
+    def get_container_client(self, name):
+        return self._containers[name]
+
+
+class FakeCosmosClient:
+    """Stands in for azure.cosmos.aio.CosmosClient, handing out fake containers"""
+
+    def __init__(self, containers):
+        self._containers = containers
+
+    def get_database_client(self, name):
+        return _FakeDatabase(self._containers)
+
+    async def close(self):
+        pass
+
+
+def install_client(provider, movies_container, summaries_container=None):
+    """
+    Like install_container(), but keeps the provider's lazy client creation:
+    the first call still imports the Cosmos DB SDK, as it would in Azure.
+    """
+    containers = {
+        provider.container_name: movies_container,
+        provider.summary_container_name: summaries_container or FakeContainer(latency=movies_container.latency)
+    }
+
+    def create_client():
+        # Imported only for their cost, as CosmosProvider's real client creation pays it
+        import aiohttp  # noqa: F401
+        import azure.cosmos.aio  # noqa: F401
+        import azure.core.pipeline.transport  # noqa: F401
+        return FakeCosmosClient(containers)
+
+    provider._create_client = create_client
+    return containers
+
+
+def http_request(method, route, params=None, body=None, headers=None):
+    """
+    FastAPI request like the ones the Functions HTTP streams proxy hands the
+    app; body is JSON-encoded when given
+    """
+    from urllib.parse import urlencode
+    from starlette.requests import Request
+
+    content = json.dumps(body).encode('utf-8') if body is not None else b''
+
+    async def receive():
+        return {"type": "http.request", "body": content, "more_body": False}
+
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": f"/api/{route}",
+        "query_string": urlencode(params or {}).encode('utf-8'),
+        "headers": [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in (headers or {}).items()]
+    }, receive)
+
+
+def user_function(route):
+    """Unwrap a function registered with @app.route into the plain handler"""
+    if hasattr(route, 'build'):
+        return route.build().get_user_function()
+    return route
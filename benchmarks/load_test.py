@@ -0,0 +1,70 @@
+"""
+Local load test for the async function app routes.
+
+Drives /getmoviesummary with every Cosmos DB and Azure OpenAI call served by
+the stand-ins in fakes.py, at increasing concurrency on a single event loop.
+Every request targets a different movie so each one waits on the (slow)
+OpenAI stub. With the previous blocking handlers a worker thread served one
+such request at a time, which is the concurrency=1 row; the other rows show
+how many the async worker overlaps.
+
+Requirements:
+- The packages in movie-api/requirements.txt
+
+Example usage:
+    python benchmarks/load_test.py --requests 200 --openai-latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from fakes import (FakeContainer, FakeOpenAIServer, configure_environment, http_request, install_container,
+                   synthetic_movies, user_function, year_documents)
+
+
+async def run_level(handler, titles, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+
+    async def one(title):
+        async with semaphore:
+            response = await handler(http_request('GET', 'getmoviesummary', {'title': title}))
+            statuses.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(title) for title in titles))
+    elapsed = time.perf_counter() - start
+    return elapsed, statuses
+
+
+async def main(args):
+    openai = await FakeOpenAIServer(latency=args.openai_latency).start()
+    configure_environment(openai.url)
+
+    import function_app
+    from cosmos_provider import cosmos
+    from openai_client import openai_client
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    movies = synthetic_movies(args.requests * len(levels))
+    install_container(cosmos, FakeContainer(year_documents(movies), latency=args.cosmos_latency))
+    handler = user_function(function_app.get_movie_summary)
+
+    print(f"{'concurrency':>12} {'requests':>9} {'seconds':>9} {'req/s':>9} {'errors':>7}")
+    for i, concurrency in enumerate(levels):
+        titles = [movie['title'] for movie in movies[i * args.requests:(i + 1) * args.requests]]
+        elapsed, statuses = await run_level(handler, titles, concurrency)
+        errors = sum(1 for status in statuses if status != 200)
+        print(f"{concurrency:>12} {len(titles):>9} {elapsed:>9.2f} {len(titles) / elapsed:>9.1f} {errors:>7}")
+
+    await openai_client.close()
+    await openai.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument('--concurrency', default="1,10,50,100", help="Comma-separated concurrency levels")
+    parser.add_argument('--openai-latency', type=float, default=0.5, help="Seconds the OpenAI stub waits")
+    parser.add_argument('--cosmos-latency', type=float, default=0.005, help="Seconds per fake Cosmos call")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,166 @@
+"""
+Cold-start benchmark for the function app.
+
+Reports two things:
+- import time of function_app.py and of each module it imports directly,
+  from `python -X importtime`
+- for every route, the time a fresh worker process takes to import the app
+  and answer its first request, and how long the second request takes
+
+Every cold measurement runs in a new Python process. Cosmos DB is served by
+the stand-ins in fakes.py through the provider's normal lazy client creation
+(so the Cosmos DB SDK import still lands on the first request), and Azure
+OpenAI by a FakeOpenAIServer in this process.
+
+Requirements:
+- The packages in movie-api/requirements.txt
+
+Example usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 5 --warmup --idle 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from fakes import MOVIE_API_DIR, FakeOpenAIServer
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+CATALOG_SIZE = 1000
+
+# route -> (function name, method, params, body)
+ROUTES = {
+    "getmovies": ("get_movies", "GET", {}, None),
+    "getmoviesbyyear": ("get_movies_by_year", "GET", {"year": "2000"}, None),
+    "getmoviesbyyears": ("get_movies_by_years", "GET", {"from": "1990", "to": "1999"}, None),
+    "searchmovies": ("search_movies", "GET", {"q": "star"}, None),
+    "getmoviesummary": ("get_movie_summary", "GET", {"title": None}, None),
+    "getmoviesummaries": ("get_movie_summaries", "POST", {}, {"movies": None}),
+    "getcachestats": ("get_cache_stats", "GET", {}, None),
+}
+
+
+def import_profile(env):
+    """[(depth, cumulative_us, module)] from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import function_app"],
+        cwd=MOVIE_API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    profile = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile.append((depth, int(cumulative), name.strip()))
+    return profile
+
+
+def print_import_profile(profile):
+    index = next(i for i, (depth, cumulative, name) in enumerate(profile) if name == "function_app")
+    app_depth, total, _ = profile[index]
+
+    # importtime lists a module after everything it imported, one level deeper
+    direct = []
+    for depth, cumulative, name in reversed(profile[:index]):
+        if depth <= app_depth:
+            break
+        if depth == app_depth + 1:
+            direct.append((cumulative, name))
+    direct.sort(reverse=True)
+
+    print(f"import function_app: {total / 1000:.1f} ms")
+    for cumulative, name in direct:
+        print(f"  {name:<32} {cumulative / 1000:>8.1f} ms")
+
+
+def child(route, openai_url, idle):
+    """Runs in a fresh process: import the app, then time two requests to one route"""
+    from fakes import (FakeContainer, configure_environment, http_request, install_client, synthetic_movies,
+                       user_function, year_documents)
+    configure_environment(openai_url)
+
+    started = time.perf_counter()
+    import function_app
+    import_seconds = time.perf_counter() - started
+
+    from cosmos_provider import cosmos
+    from openai_client import openai_client
+
+    movies = synthetic_movies(CATALOG_SIZE)
+    install_client(cosmos, FakeContainer(year_documents(movies), latency=0.005))
+
+    function_name, method, params, body = ROUTES[route]
+    if "title" in params:
+        params = {"title": movies[0]["title"]}
+    if body is not None:
+        body = {"movies": [movie["title"] for movie in movies[:5]]}
+    handler = user_function(getattr(function_app, function_name))
+
+    async def run():
+        # Time between the worker loading the app and the first request reaching it
+        await asyncio.sleep(idle)
+        timings = []
+        for _ in range(2):
+            req = http_request(method, route, params, body)
+            request_started = time.perf_counter()
+            response = await handler(req)
+            timings.append((time.perf_counter() - request_started, response.status_code))
+        await openai_client.close()
+        return timings
+
+    (first, status), (second, _) = asyncio.run(run())
+    print(json.dumps({"import": import_seconds, "first": first, "second": second, "status": status}))
+
+
+async def measure_route(route, openai_url, idle, env):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(Path(__file__).resolve()), "--child", route, "--openai-url", openai_url,
+        "--idle", str(idle),
+        cwd=BENCHMARKS_DIR, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    return json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+async def main(args):
+    env = dict(os.environ, WARMUP_ON_START="true" if args.warmup else "false")
+    env.setdefault("COSMOSDB_CONNECTION_STRING", "AccountEndpoint=https://localhost:8081/;AccountKey=fake;")
+
+    print_import_profile(import_profile(env))
+    print()
+
+    openai = await FakeOpenAIServer(latency=args.openai_latency).start()
+    print(f"{'route':<20} {'import ms':>10} {'first ms':>10} {'to first ms':>12} {'second ms':>10} {'status':>7}")
+    for route in ROUTES:
+        # Sequential runs, so processes don't compete for CPU while importing
+        runs = [await measure_route(route, openai.url, args.idle, env) for _ in range(args.runs)]
+        imported = statistics.median(run["import"] for run in runs) * 1000
+        first = statistics.median(run["first"] for run in runs) * 1000
+        second = statistics.median(run["second"] for run in runs) * 1000
+        print(f"{route:<20} {imported:>10.1f} {first:>10.1f} {imported + first:>12.1f} "
+              f"{second:>10.1f} {runs[-1]['status']:>7}")
+    await openai.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help="Cold processes per route (the median is reported)")
+    parser.add_argument('--warmup', action='store_true', help="Start workers with WARMUP_ON_START=true")
+    parser.add_argument('--idle', type=float, default=0.0,
+                        help="Seconds between loading the app and the first request (lets --warmup finish)")
+    parser.add_argument('--openai-latency', type=float, default=0.05, help="Seconds the OpenAI stub waits")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--openai-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.openai_url, args.idle)
+    else:
+        asyncio.run(main(args))
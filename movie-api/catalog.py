@@ -0,0 +1,512 @@
+"""
+In-process movie catalog cache.
+
+The catalog only changes when scripts/seed_data.py or scripts/upload_covers.py
+run, so the flattened, deduped and sorted movie list is built once per worker
+and kept together with the already-encoded /getmovies response body and its
+ETag. The cache refreshes when its TTL expires, or earlier when the Cosmos DB
+change feed reports documents newer than the last continuation token.
+
+Refreshes are stale-while-revalidate: once the TTL expires (or a change feed
+poll is due) requests keep getting the loaded catalog immediately while a
+single background task polls the change feed or reloads it. Only a catalog
+older than TTL + max staleness, or none at all, makes a request wait for the
+load. A failed refresh keeps the old catalog until that bound.
+
+The catalog is loaded from the columnar snapshot that
+scripts/catalog_snapshot.py precomputes at seed time: a point read of its
+manifest, then parallel point reads of the chunks it lists. Only when the
+snapshot is missing are the year documents queried and flattened.
+
+A year is stored either as one year_{year} document or, when seeded with a
+split layout (scripts/document_layout.py), as letter-group or per-movie items
+in the same /year partition (or, in a container migrated to the synthetic
+/pk key, under "{year}_{group}" keys, so reading a split year is a
+cross-partition query there). Split items keep the letter-group shape, so
+extract_movies reads all of them; resolve_layouts drops the split items of a
+year that still has its year document while it is being migrated.
+YearLayouts remembers which years were found split or empty, so a split year
+costs one query rather than a missed point read followed by a query.
+
+Compressed and compact encodings of the /getmovies body (see encoding.py) are
+produced on first request and cached on the snapshot, so each is built once
+per catalog version.
+
+Optional Environment Variables:
+- CATALOG_TTL_SECONDS: Max age of the cached catalog (default: 300)
+- CATALOG_CHANGE_FEED_INTERVAL: Seconds between change feed polls (default: 30)
+- CATALOG_MAX_STALE_SECONDS: How long past its TTL the catalog is still served while refreshing (default: 3600)
+- CATALOG_HTTP_MAX_AGE: max-age of catalog responses' Cache-Control header (default: 60)
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+
+from cosmos_provider import collect, cosmos, not_found_error
+from encoding import FORMAT_TAGS, JSON, VARY, compress, negotiate_encoding, negotiate_format, serialize
+from telemetry import telemetry
+
+# Written by scripts/catalog_snapshot.py into the otherwise unused year 0 partition:
+# a manifest with this id, plus the chunk items it lists
+SNAPSHOT_ID = "catalog_snapshot"
+SNAPSHOT_PARTITION = 0
+# Partition key path of a container migrated by scripts/migrate_layout.py --target.
+# Year documents and the snapshot keep their year as key there, so point reads are unchanged.
+SYNTHETIC_KEY_PATH = "/pk"
+
+
+def extract_movies(doc):
+    """Return the movies from every letter group of a year document or split item"""
+    movies = []
+    for key, value in doc.items():
+        if isinstance(value, dict) and 'movies' in value:
+            movies.extend(value['movies'])
+    return movies
+
+
+def is_year_document(doc):
+    return doc['id'] == f"year_{doc['year']}"
+
+
+def resolve_layouts(documents):
+    """Drop split items of years that still have a year document (mid-migration)"""
+    documents = list(documents)
+    whole_years = {doc['year'] for doc in documents if is_year_document(doc)}
+    return [doc for doc in documents if is_year_document(doc) or doc['year'] not in whole_years]
+
+
+async def year_query_options(provider, year):
+    """query_items options reading every item of a year: its partition, or all of them under the synthetic key"""
+    if await provider.partition_key_path() == SYNTHETIC_KEY_PATH:
+        return {}
+    return {"partition_key": year}
+
+
+class YearLayouts:
+    """
+    What the last read of each year found, so later reads skip round trips
+    that would come back empty: a year stored as split items is queried
+    straight away, and a year with no movies at all needs only the point read
+    for its year document until max_age has passed (the catalog's own
+    staleness bound).
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age if max_age is not None else float(os.environ.get("CATALOG_TTL_SECONDS", 300))
+        self.split = set()
+        self.empty = {}
+
+    def is_empty(self, year):
+        found = self.empty.get(year)
+        return found is not None and time.monotonic() - found < self.max_age
+
+    def record(self, year, documents):
+        self.empty.pop(year, None)
+        self.split.discard(year)
+        if not documents:
+            self.empty[year] = time.monotonic()
+        elif not any(is_year_document(doc) for doc in documents):
+            self.split.add(year)
+
+
+year_layouts = YearLayouts()
+
+
+async def read_year_documents(provider, year, layouts=year_layouts):
+    """
+    The documents holding a year's movies: a point read of the year document,
+    or, when there is none, a query for the split items.
+    Years last found split go straight to the query. Empty if the year has no
+    movies.
+    """
+    if year == SNAPSHOT_PARTITION:
+        return []
+
+    if year not in layouts.split:
+        try:
+            doc = await provider.run(lambda container: container.read_item(
+                item="year_" + str(year),
+                partition_key=year
+            ))
+            layouts.record(year, [doc])
+            return [doc]
+        except not_found_error():
+            if layouts.is_empty(year):
+                return []
+
+    options = await year_query_options(provider, year)
+    documents = resolve_layouts(await provider.run(lambda container: collect(
+        container.query_items(
+            query="SELECT * FROM c WHERE c.year = @year",
+            parameters=[{"name": "@year", "value": year}],
+            **options
+        )
+    )))
+    layouts.record(year, documents)
+    return documents
+
+
+def all_movies_in(documents):
+    """Return the movies from every document, duplicates included"""
+    all_movies = []
+    for doc in documents:
+        all_movies.extend(extract_movies(doc))
+    return all_movies
+
+
+def dedupe_and_sort(all_movies):
+    """Title-sorted list without duplicate titles"""
+    unique_movies = {movie['title']: movie for movie in all_movies}.values()
+    return sorted(unique_movies, key=lambda x: x['title'])
+
+
+def release_key(movie):
+    return (movie['title'], movie['year'])
+
+
+def sort_releases(all_movies):
+    """Every release, remakes included, sorted by title and then year"""
+    return sorted(all_movies, key=release_key)
+
+
+def normalize_title(title):
+    """Case- and Unicode-insensitive key used for title lookups"""
+    return " ".join(unicodedata.normalize('NFKC', title).casefold().split())
+
+
+class TitleIndex:
+    """Hash lookups by normalized title, and by (title, year) to tell remakes apart"""
+
+    def __init__(self, movies):
+        self.by_title = {}
+        self.by_title_year = {}
+        for movie in movies:
+            key = normalize_title(movie['title'])
+            self.by_title.setdefault(key, []).append(movie)
+            self.by_title_year.setdefault((key, int(movie['year'])), movie)
+
+        # Most recent release first when a title has several years
+        for matches in self.by_title.values():
+            matches.sort(key=lambda m: m['year'], reverse=True)
+
+    def find(self, title, year=None):
+        """Return the movie matching title (and year, if given) or None"""
+        key = normalize_title(title)
+        if year is not None:
+            return self.by_title_year.get((key, int(year)))
+        matches = self.by_title.get(key)
+        return matches[0] if matches else None
+
+
+def find_in_documents(documents, title):
+    """Linear search of a single year's documents, used for point-read lookups"""
+    key = normalize_title(title)
+    for movie in all_movies_in(documents):
+        if normalize_title(movie['title']) == key:
+            return movie
+    return None
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog plus its encoded /getmovies response"""
+
+    @classmethod
+    def from_documents(cls, documents):
+        all_movies = all_movies_in(resolve_layouts(documents))
+        return cls(dedupe_and_sort(all_movies), TitleIndex(all_movies), sort_releases(all_movies))
+
+    @classmethod
+    def from_chunks(cls, manifest, chunks):
+        """Build from the precomputed snapshot: its manifest and columnar chunks"""
+        genres = manifest['genres']
+        base = manifest.get('posterBase') or ""
+        rendition_format = manifest.get('renditionFormat')
+        rendition_names = manifest.get('renditionNames') or []
+        all_movies = []
+        for chunk in sorted(chunks, key=lambda chunk: chunk['index']):
+            columns = chunk['columns']
+            for title, genre, year, poster, renditions in zip(
+                    columns['title'], columns['genre'], columns['year'],
+                    columns['poster'], columns['renditions']):
+                movie = {"title": title, "genre": genres[genre], "year": year}
+                if poster:
+                    # Posters under posterBase are stored by file name, others by full URL
+                    movie['coverURL'] = poster if '://' in poster else base + poster
+                if renditions == 1:
+                    stem = poster.rsplit('.', 1)[0]
+                    movie['coverURLs'] = {
+                        name: base + rendition_format.format(stem=stem, name=name) for name in rendition_names
+                    }
+                elif renditions:
+                    movie['coverURLs'] = renditions
+                all_movies.append(movie)
+        # Already in (title, year) order, which keeps the sort linear
+        return cls(dedupe_and_sort(all_movies), TitleIndex(all_movies), sort_releases(all_movies))
+
+    def __init__(self, movies, title_index=None, releases=None):
+        self.movies = movies
+        # Built from the un-deduped movies so remakes sharing a title stay reachable
+        self.titles = title_index if title_index is not None else TitleIndex(movies)
+        # What filtered /getmovies queries run over, so they match the un-deduped Cosmos DB path
+        self.releases = releases if releases is not None else sort_releases(movies)
+        self.body = json.dumps({
+            "movies": movies,
+            "total": len(movies)
+        }).encode('utf-8')
+        self.version = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{self.version}"'
+        self.loaded_at = time.monotonic()
+        self._variants = {}
+
+    def variant(self, accept=None, accept_encoding=None):
+        """
+        Body, media type and headers of the representation a request negotiates.
+        Each representation gets its own ETag, derived from the catalog version.
+        """
+        media_type = negotiate_format(accept)
+        encoding = negotiate_encoding(accept_encoding)
+        key = (media_type, encoding)
+        if key not in self._variants:
+            if media_type == JSON:
+                body = self.body
+            else:
+                body = serialize({"movies": self.movies, "total": len(self.movies)}, media_type)
+            body, applied = compress(body, encoding)
+
+            tag = self.version
+            if media_type != JSON:
+                tag += f"-{FORMAT_TAGS[media_type]}"
+            if applied:
+                tag += f"-{applied}"
+            headers = {"ETag": f'"{tag}"', "Vary": VARY}
+            if applied:
+                headers["Content-Encoding"] = applied
+            self._variants[key] = (body, media_type, headers)
+        return self._variants[key]
+
+    def matches(self, if_none_match, etag=None):
+        """True if an If-None-Match header value covers this snapshot (or one of its variants)"""
+        if not if_none_match:
+            return False
+        etag = etag or self.etag
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+
+class CatalogCache:
+    """Process-wide cache of the catalog, refreshed on TTL or change feed activity"""
+
+    def __init__(self, provider, ttl=None, change_feed_interval=None, max_stale=None):
+        self.provider = provider
+        self.ttl = ttl if ttl is not None else float(os.environ.get("CATALOG_TTL_SECONDS", 300))
+        self.change_feed_interval = (
+            change_feed_interval if change_feed_interval is not None
+            else float(os.environ.get("CATALOG_CHANGE_FEED_INTERVAL", 30))
+        )
+        self.max_stale = (
+            max_stale if max_stale is not None
+            else float(os.environ.get("CATALOG_MAX_STALE_SECONDS", 3600))
+        )
+        self.http_max_age = int(os.environ.get("CATALOG_HTTP_MAX_AGE", 60))
+
+        self._lock = asyncio.Lock()
+        self._snapshot = None
+        self._continuation = None
+        self._last_poll = 0.0
+        self._refresh_task = None
+        self.stats = {"loads": 0, "stale_served": 0, "refreshes": 0, "refresh_failures": 0}
+
+    async def _load_documents(self):
+        return await self.provider.run(lambda container: collect(
+            container.query_items(
+                query="SELECT * FROM c WHERE c.year != @snapshot_partition",
+                parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}]
+            )
+        ))
+
+    async def _read_snapshot(self):
+        """
+        Point-read the snapshot manifest, then its chunks in parallel.
+        None if there is no usable manifest.
+        """
+        def read(item):
+            return self.provider.run(lambda container: container.read_item(
+                item=item,
+                partition_key=SNAPSHOT_PARTITION
+            ))
+
+        try:
+            manifest = await read(SNAPSHOT_ID)
+        except not_found_error():
+            return None
+        if 'chunks' not in manifest:
+            logging.warning("Catalog snapshot predates chunking; rebuild it with scripts/catalog_snapshot.py")
+            return None
+        chunks = await asyncio.gather(*(read(chunk_id) for chunk_id in manifest['chunks']))
+        return manifest, chunks
+
+    async def _load(self):
+        """
+        Point reads of the snapshot manifest and chunks, or a full query if
+        there is no snapshot. The snapshot is built on a worker thread so
+        requests served from the previous catalog keep running meanwhile.
+        """
+        snapshot = None
+        for attempt in range(2):
+            try:
+                snapshot = await self._read_snapshot()
+                break
+            except not_found_error():
+                # A newer snapshot replaced the chunks after the manifest was read; read it again
+                continue
+
+        if snapshot is not None:
+            with telemetry.phase("catalog_build"):
+                return await asyncio.to_thread(CatalogSnapshot.from_chunks, *snapshot)
+
+        logging.warning("No catalog snapshot, flattening year documents")
+        documents = await self._load_documents()
+        with telemetry.phase("catalog_build"):
+            return await asyncio.to_thread(CatalogSnapshot.from_documents, documents)
+
+    def _read_continuation(self, container):
+        """Continuation token of the change feed as of now"""
+        return container.client_connection.last_response_headers.get('etag')
+
+    async def _start_change_feed(self):
+        """Record the current change feed position so later polls only see new writes"""
+        async def start(container):
+            async for _ in container.query_items_change_feed(is_start_from_beginning=False):
+                pass
+            return self._read_continuation(container)
+
+        try:
+            self._continuation = await self.provider.run(start)
+        except Exception as e:
+            logging.warning(f"Could not read catalog change feed: {str(e)}")
+            self._continuation = None
+        self._last_poll = time.monotonic()
+
+    async def _has_changes(self):
+        """Poll the change feed from the stored continuation token"""
+        if self._continuation is None:
+            # The feed could not be started at load time: retry (which also
+            # restarts the poll interval) and rely on the TTL for writes before
+            await self._start_change_feed()
+            return False
+
+        async def poll(container):
+            changed = False
+            async for _ in container.query_items_change_feed(continuation=self._continuation):
+                changed = True
+            return changed, self._read_continuation(container)
+
+        try:
+            changed, continuation = await self.provider.run(poll)
+        except Exception as e:
+            logging.warning(f"Catalog change feed poll failed: {str(e)}")
+            return False
+        finally:
+            self._last_poll = time.monotonic()
+
+        if continuation and continuation != self._continuation:
+            self._continuation = continuation
+        return changed
+
+    async def _is_stale(self, snapshot):
+        now = time.monotonic()
+        if now - snapshot.loaded_at >= self.ttl:
+            return True
+        if now - self._last_poll >= self.change_feed_interval:
+            return await self._has_changes()
+        return False
+
+    def _servable(self, snapshot):
+        """True while a snapshot may still be served, fresh or stale"""
+        return snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl + self.max_stale
+
+    async def _reload(self):
+        logging.info("Loading movie catalog from Cosmos DB")
+        await self._start_change_feed()
+        self._snapshot = await self._load()
+        self.stats["loads"] += 1
+
+    async def _refresh(self):
+        """Background revalidation: poll the change feed or reload, keeping the old snapshot on failure"""
+        try:
+            async with self._lock:
+                snapshot = self._snapshot
+                if snapshot is not None and await self._is_stale(snapshot):
+                    await self._reload()
+                    self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["refresh_failures"] += 1
+            logging.warning(f"Background catalog refresh failed, serving the previous catalog: {str(e)}")
+
+    def _schedule_refresh(self):
+        """Start the background refresh unless one is already running"""
+        if self._refresh_task is None or self._refresh_task.done():
+            # A fresh context keeps the refresh's Cosmos DB calls out of the triggering request's telemetry
+            self._refresh_task = asyncio.get_running_loop().create_task(
+                self._refresh(), context=contextvars.Context()
+            )
+
+    async def get(self):
+        """Return the current snapshot, revalidating it in the background once it is stale"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - snapshot.loaded_at < self.ttl \
+                and now - self._last_poll < self.change_feed_interval:
+            telemetry.set(catalog_cache="hit")
+            return snapshot
+
+        if self._servable(snapshot):
+            self._schedule_refresh()
+            self.stats["stale_served"] += 1
+            telemetry.set(catalog_cache="stale")
+            return snapshot
+
+        # Nothing servable: concurrent requests wait for a single reload instead of each querying Cosmos DB
+        async with self._lock:
+            if not self._servable(self._snapshot):
+                await self._reload()
+                telemetry.set(catalog_cache="load")
+            else:
+                telemetry.set(catalog_cache="hit")
+            return self._snapshot
+
+    async def wait_for_refresh(self):
+        """Wait for a running background refresh, if any"""
+        if self._refresh_task is not None:
+            await asyncio.shield(self._refresh_task)
+
+    def cache_control(self):
+        """Cache-Control for catalog responses, letting clients revalidate in the background as this cache does"""
+        cache_control = f"public, max-age={self.http_max_age}"
+        if self.max_stale > 0:
+            cache_control += f", stale-while-revalidate={int(self.max_stale)}"
+        return cache_control
+
+    def snapshot_stats(self):
+        snapshot = self._snapshot
+        return {
+            **self.stats,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot is not None else None,
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done()
+        }
+
+    def current(self):
+        """Return the loaded snapshot without refreshing it (None if not loaded yet)"""
+        return self._snapshot
+
+    def invalidate(self):
+        """Force the next get() to reload the catalog"""
+        self._snapshot = None
+
+
+catalog_cache = CatalogCache(cosmos)
@@ -0,0 +1,182 @@
+"""
+Shared Cosmos DB client for the function app.
+
+Creating a CosmosClient per request pays for a TLS handshake, the account
+metadata lookup and the partition map fetch every time. This module keeps a
+single async client (and its container handles) per worker process and hands
+it out to every invocation.
+
+Optional Environment Variables:
+- COSMOS_DATABASE_NAME: Database name (default: moviedb)
+- COSMOS_CONTAINER_NAME: Container name (default: movies)
+- COSMOS_SUMMARY_CONTAINER_NAME: Container for cached summaries (default: summaries)
+- COSMOS_POOL_SIZE: Max pooled connections per host (default: 20)
+- COSMOS_RETRY_TOTAL: Max retries for throttled/failed requests (default: 5)
+- COSMOS_RETRY_BACKOFF_MAX: Max backoff between retries in seconds (default: 10)
+- COSMOS_CONNECTION_TIMEOUT: Connect timeout in seconds (default: 5)
+"""
+import asyncio
+import logging
+import os
+
+from telemetry import telemetry
+
+# aiohttp and the Azure SDK take a few hundred milliseconds to import, so they
+# are imported on first use rather than on every cold start of the worker.
+
+
+def connection_errors():
+    """Errors raised when a pooled connection has gone stale or the socket broke"""
+    import aiohttp
+    from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+    return (ServiceRequestError, ServiceResponseError, ConnectionError, aiohttp.ClientError)
+
+
+def not_found_error():
+    """
+    The SDK's 404 error class. Used as `except not_found_error():`, which is
+    only evaluated once something has been raised, by which point the SDK
+    has long been imported.
+    """
+    from azure.cosmos.exceptions import CosmosResourceNotFoundError
+    return CosmosResourceNotFoundError
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logging.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+
+class _MeteredContainer:
+    """
+    Container proxy that passes a response_hook to every call, so each
+    response's RU charge is added to the request that made it
+    """
+
+    def __init__(self, container, record):
+        self._container = container
+        self._record = record
+
+    def _hook(self, headers, result):
+        charge = headers.get('x-ms-request-charge')
+        self._record.add(cosmos_requests=1, cosmos_ru=float(charge) if charge else 0.0)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._container, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            kwargs.setdefault("response_hook", self._hook)
+            return attribute(*args, **kwargs)
+        return call
+
+
+class CosmosProvider:
+    """Lazily creates and caches the Cosmos client and container handles"""
+
+    def __init__(self, connection_string_env="COSMOSDB_CONNECTION_STRING"):
+        self.connection_string_env = connection_string_env
+        self.database_name = os.environ.get("COSMOS_DATABASE_NAME", "moviedb")
+        self.container_name = os.environ.get("COSMOS_CONTAINER_NAME", "movies")
+        self.summary_container_name = os.environ.get("COSMOS_SUMMARY_CONTAINER_NAME", "summaries")
+        self.pool_size = _env_int("COSMOS_POOL_SIZE", 20)
+        self.retry_total = _env_int("COSMOS_RETRY_TOTAL", 5)
+        self.retry_backoff_max = _env_int("COSMOS_RETRY_BACKOFF_MAX", 10)
+        self.connection_timeout = _env_int("COSMOS_CONNECTION_TIMEOUT", 5)
+
+        self._lock = asyncio.Lock()
+        self._client = None
+        self._containers = {}
+        self._key_paths = {}
+
+    def _create_client(self):
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.cosmos.aio import CosmosClient
+
+        # Size the aiohttp connection pool so concurrent invocations share sockets
+        # instead of opening (and exhausting) new outbound connections
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=self.pool_size, keepalive_timeout=60)
+        )
+
+        return CosmosClient.from_connection_string(
+            os.environ[self.connection_string_env],
+            transport=AioHttpTransport(session=session, session_owner=True),
+            retry_total=self.retry_total,
+            retry_backoff_max=self.retry_backoff_max,
+            connection_timeout=self.connection_timeout,
+        )
+
+    async def get_container(self, name=None):
+        """Return the shared container client, creating it on first use"""
+        name = name or self.container_name
+        container = self._containers.get(name)
+        if container is not None:
+            return container
+
+        async with self._lock:
+            if self._client is None:
+                logging.info("Creating shared Cosmos DB client")
+                self._client = self._create_client()
+            if name not in self._containers:
+                database = self._client.get_database_client(self.database_name)
+                self._containers[name] = database.get_container_client(name)
+            return self._containers[name]
+
+    async def partition_key_path(self, container_name=None):
+        """The container's partition key path, read from its properties on first use"""
+        name = container_name or self.container_name
+        path = self._key_paths.get(name)
+        if path is None:
+            properties = await self.run(lambda container: container.read(), name)
+            path = self._key_paths[name] = properties['partitionKey']['paths'][0]
+        return path
+
+    async def reset(self):
+        """Drop the cached client so the next call builds a fresh one"""
+        async with self._lock:
+            client, self._client, self._containers = self._client, None, {}
+
+        if client is not None:
+            try:
+                await client.close()
+            except Exception as e:
+                logging.warning(f"Error closing Cosmos DB client: {str(e)}")
+
+    async def run(self, operation, container_name=None):
+        """
+        Await operation(container), rebuilding the client once if the pooled
+        connection turns out to be stale or broken.
+        """
+        record = telemetry.current()
+
+        def metered(container):
+            return container if record is None else _MeteredContainer(container, record)
+
+        with telemetry.phase("cosmos"):
+            try:
+                result = await operation(metered(await self.get_container(container_name)))
+            except connection_errors() as e:
+                logging.warning(f"Cosmos DB connection error, recreating client: {str(e)}")
+                await self.reset()
+                result = await operation(metered(await self.get_container(container_name)))
+
+        if record is not None:
+            if isinstance(result, list):
+                record.add(cosmos_documents=len(result))
+            elif isinstance(result, dict):
+                record.add(cosmos_documents=1)
+        return result
+
+
+async def collect(items):
+    """Drain an async item pager into a list"""
+    return [item async for item in items]
+
+
+cosmos = CosmosProvider()
@@ -0,0 +1,126 @@
+"""
+Content negotiation for the catalog endpoints.
+
+Accept-Encoding picks br (when the brotli package is installed) or gzip.
+Accept picks the representation:
+- application/json (default): {"movies": [{...}, ...], "total": N}
+- application/vnd.movies.columnar+json: parallel arrays, so the per-row keys
+  title/genre/year are not repeated and genres are interned; a fields=
+  projection only gets the columns it asked for
+- application/msgpack (when the msgpack package is installed): the default
+  shape, binary encoded
+
+The catalog snapshot caches every variant it has produced, so serialization
+and compression run once per catalog version rather than once per request.
+"""
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.movies.columnar+json"
+MSGPACK = "application/msgpack"
+# Short names used in per-representation ETags
+FORMAT_TAGS = {JSON: "json", COLUMNAR_JSON: "columnar", MSGPACK: "msgpack"}
+
+# Bodies smaller than this are not worth the compression overhead
+MIN_COMPRESS_BYTES = 1024
+VARY = "Accept, Accept-Encoding"
+# Columns of the columnar representation when the rows are not projected
+COLUMNS = ("title", "genre", "year", "coverURL", "coverURLs")
+
+
+def _parse_header(value):
+    """Parse an Accept-style header into {token: q}"""
+    weights = {}
+    for part in (value or "").split(','):
+        pieces = [p.strip() for p in part.split(';')]
+        token = pieces[0].lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[token] = q
+    return weights
+
+
+def negotiate_encoding(accept_encoding):
+    """Return 'br', 'gzip' or None for an Accept-Encoding header"""
+    weights = _parse_header(accept_encoding)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def negotiate_format(accept):
+    """Return the media type to respond with for an Accept header"""
+    weights = _parse_header(accept)
+    offered = [JSON, COLUMNAR_JSON] + ([MSGPACK, "application/x-msgpack"] if msgpack is not None else [])
+    best, best_q = JSON, 0.0
+    for media_type in offered:
+        q = weights.get(media_type, 0.0)
+        if q > best_q:
+            best, best_q = media_type, q
+    return MSGPACK if best == "application/x-msgpack" else best
+
+
+def to_columns(movies, fields=None):
+    """
+    Columnar form of a list of movies with genres interned. Projected rows
+    (see MovieQuery.fields) only get columns for the requested fields.
+    """
+    columns = {field: [movie.get(field) for movie in movies] for field in fields or COLUMNS}
+    if 'genre' not in columns:
+        return {"columns": columns}
+    genres = sorted(set(columns['genre']))
+    genre_index = {genre: i for i, genre in enumerate(genres)}
+    columns['genre'] = [genre_index[genre] for genre in columns['genre']]
+    return {"genres": genres, "columns": columns}
+
+
+def serialize(payload, media_type, fields=None):
+    """Encode a {"movies": [...], ...} payload in the requested representation"""
+    if media_type == COLUMNAR_JSON:
+        columnar = {key: value for key, value in payload.items() if key != 'movies'}
+        columnar.update(to_columns(payload['movies'], fields))
+        return json.dumps(columnar, separators=(',', ':')).encode('utf-8')
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload).encode('utf-8')
+
+
+def compress(body, encoding):
+    """Compress a body, returning (body, encoding actually applied)"""
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=5), 'br'
+    return gzip.compress(body, compresslevel=6), 'gzip'
+
+
+def encode(payload, accept, accept_encoding, fields=None):
+    """Serialize and compress a payload for one request: (body, media_type, headers)"""
+    media_type = negotiate_format(accept)
+    body, applied = compress(serialize(payload, media_type, fields), negotiate_encoding(accept_encoding))
+    headers = {"Vary": VARY}
+    if applied:
+        headers["Content-Encoding"] = applied
+    return body, media_type, headers
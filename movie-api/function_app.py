@@ -1,226 +1,449 @@
-import azure.functions as func
-import logging
-from azure.cosmos import CosmosClient
-import os
-import json
-from typing import Optional
-
-app = func.FunctionApp()
-
-@app.route(route="getmovies")
-def get_movies(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Processing GetMovies request')
-
-    try:
-        cosmos_client = CosmosClient.from_connection_string(os.environ["COSMOSDB_CONNECTION_STRING"])
-        database = cosmos_client.get_database_client("moviedb")
-        container = database.get_container_client("movies")
-
-        # Get all documents
-        query = "SELECT * FROM c"
-        documents = list(container.query_items(query=query, enable_cross_partition_query=True))
-        
-        # Extract movies from all letter groups
-        all_movies = []
-        for doc in documents:
-            for key, value in doc.items():
-                if isinstance(value, dict) and 'movies' in value:
-                    all_movies.extend(value['movies'])
-        
-        # Sort by title and remove duplicates (if any)
-        unique_movies = {movie['title']: movie for movie in all_movies}.values()
-        sorted_movies = sorted(unique_movies, key=lambda x: x['title'])
-
-        return func.HttpResponse(
-            json.dumps({
-                "movies": sorted_movies,
-                "total": len(sorted_movies)
-            }),
-            mimetype="application/json"
-        )
-
-    except Exception as e:
-        logging.error(f"Error in GetMovies: {str(e)}")
-        return func.HttpResponse(
-            f"An error occurred while retrieving movies: {str(e)}",
-            status_code=500
-        )
-
-@app.route(route="getmoviesbyyear")
-def get_movies_by_year(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Processing GetMoviesByYear request')
-
-    try:
-        # Get year from query parameter
-        year = req.params.get('year')
-        if not year:
-            return func.HttpResponse(
-                "Please provide a year parameter",
-                status_code=400
-            )
-            
-        try:
-            year = int(year)
-        except ValueError:
-            return func.HttpResponse(
-                "Year must be a valid number",
-                status_code=400
-            )
-
-        # Connect to Cosmos DB
-        cosmos_client = CosmosClient.from_connection_string(os.environ["COSMOSDB_CONNECTION_STRING"])
-        database = cosmos_client.get_database_client("moviedb")
-        container = database.get_container_client("movies")
-
-        # Get the document for the specified year
-        try:
-            doc = container.read_item(
-                item="year_" + str(year),
-                partition_key=year
-            )
-        except:
-            return func.HttpResponse(
-                json.dumps({
-                    "movies": [],
-                    "total": 0,
-                    "message": f"No movies found for year {year}"
-                }),
-                mimetype="application/json"
-            )
-
-        # Extract movies from all letter groups
-        all_movies = []
-        for key, value in doc.items():
-            if isinstance(value, dict) and 'movies' in value:
-                all_movies.extend(value['movies'])
-
-        # Sort by title
-        sorted_movies = sorted(all_movies, key=lambda x: x['title'])
-
-        return func.HttpResponse(
-            json.dumps({
-                "movies": sorted_movies,
-                "total": len(sorted_movies),
-                "year": year
-            }),
-            mimetype="application/json"
-        )
-
-    except Exception as e:
-        logging.error(f"Error in GetMoviesByYear: {str(e)}")
-        return func.HttpResponse(
-            f"An error occurred while retrieving movies: {str(e)}",
-            status_code=500
-        )
-    
-@app.route(route="getmoviesummary")
-def get_movie_summary(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Processing GetMovieSummary request')
-    try:
-        # Get movie title from query parameter
-        title = req.params.get('title')
-        if not title:
-            return func.HttpResponse(
-                "Please provide a movie title parameter",
-                status_code=400
-            )
-            
-        # Connect to Cosmos DB
-        cosmos_client = CosmosClient.from_connection_string(os.environ["COSMOSDB_CONNECTION_STRING"])
-        database = cosmos_client.get_database_client("moviedb")
-        container = database.get_container_client("movies")
-
-        # Find the movie in any year document
-        movie = None
-        query = "SELECT * FROM c"
-        documents = list(container.query_items(query=query, enable_cross_partition_query=True))
-        
-        for doc in documents:
-            for key, value in doc.items():
-                if isinstance(value, dict) and 'movies' in value:
-                    for m in value['movies']:
-                        if m['title'].lower() == title.lower():
-                            movie = m
-                            break
-            if movie:
-                break
-
-        if not movie:
-            return func.HttpResponse(
-                json.dumps({
-                    "error": f"Movie '{title}' not found"
-                }),
-                status_code=404,
-                mimetype="application/json"
-            )
-
-        # Connect to Azure OpenAI
-        openai_endpoint = os.environ["OPENAI_API_ENDPOINT"].rstrip('/')
-        openai_key = os.environ["OPENAI_API_KEY"]
-        deployment_name = os.environ["OPENAI_DEPLOYMENT_NAME"]
-        api_version = os.environ["OPENAI_API_VERSION"]
-
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": openai_key
-        }
-
-        # Prepare the prompt
-        prompt = f"""Write a brief, engaging summary of the movie "{movie['title']}" ({movie['year']}).
-                    This is a {movie['genre']} film.
-                    Keep the summary concise, around 2-3 sentences."""
-
-        # Prepare the API request
-        payload = {
-            "messages": [
-                {"role": "system", "content": "You are a knowledgeable film critic who provides concise, engaging movie summaries."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 150,
-            "temperature": 0.7
-        }
-
-        # Call Azure OpenAI API
-        import requests
-        
-        api_url = f"{openai_endpoint}/openai/deployments/{deployment_name}/chat/completions?api-version={api_version}"
-        
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        if response.status_code != 200:
-            logging.error(f"OpenAI API error: {response.text}")
-            return func.HttpResponse(
-                json.dumps({
-                    "error": "Error generating summary",
-                    "title": movie['title']
-                }),
-                status_code=500,
-                mimetype="application/json"
-            )
-
-        # Extract the generated summary
-        summary = response.json()['choices'][0]['message']['content'].strip()
-
-        # Return just the title and summary
-        return func.HttpResponse(
-            json.dumps({
-                "title": movie['title'],
-                "summary": summary
-            }),
-            mimetype="application/json"
-        )
-
-    except Exception as e:
-        logging.error(f"Error in GetMovieSummary: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({
-                "error": "An error occurred while processing the request"
-            }),
-            status_code=500,
-            mimetype="application/json"
-        )
+import azure.functions as func
+import logging
+import json
+import os
+from typing import Optional
+
+# HTTP streams: the worker hands every route a FastAPI request and relays the
+# returned response as it is produced, so /getmoviesummary?stream=true can send
+# tokens as they arrive. The worker reads these annotations, so this import
+# can't be deferred like the Cosmos DB SDK's.
+from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
+
+from catalog import all_movies_in, catalog_cache, find_in_documents, read_year_documents
+from cosmos_provider import cosmos
+from encoding import encode
+from movie_query import InvalidQuery, MovieQuery, merge_by_title, parse_years, read_years
+from openai_client import OpenAIError, openai_client
+from search import DEFAULT_LIMIT, MAX_LIMIT as MAX_SEARCH_LIMIT, catalog_search
+from startup import start_warmup
+from summaries import MAX_BATCH_SIZE, build_messages, summary_cache
+from telemetry import telemetry
+
+app = func.FunctionApp()
+
+# Import the Cosmos DB and HTTP client libraries in the background while the host finishes starting
+if os.environ.get("WARMUP_ON_START", "false").lower() == "true":
+    start_warmup()
+
+def encoded_response(req: Request, payload: dict, headers: Optional[dict] = None,
+                     fields: Optional[list] = None) -> Response:
+    """Respond with the representation and compression the client asked for"""
+    with telemetry.phase("serialize"):
+        body, mimetype, encoding_headers = encode(
+            payload, req.headers.get('Accept'), req.headers.get('Accept-Encoding'), fields
+        )
+    return Response(body, headers={**encoding_headers, **(headers or {})}, media_type=mimetype)
+
+@app.route(route="getmovies")
+@telemetry.instrument("getmovies")
+async def get_movies(req: Request) -> Response:
+    logging.info('Processing GetMovies request')
+
+    try:
+        try:
+            query = MovieQuery.from_params(req.query_params)
+        except InvalidQuery as e:
+            return Response(str(e), status_code=400)
+
+        if not query.is_empty:
+            # Filter the in-memory catalog when loaded, otherwise push the filters into Cosmos DB
+            if catalog_cache.current() is not None:
+                movies = (await catalog_cache.get()).releases
+                with telemetry.phase("query"):
+                    result = query.apply(movies)
+            else:
+                result = await query.run_in_cosmos(cosmos)
+            telemetry.set(movies=len(result["movies"]))
+            return encoded_response(req, result, {"Cache-Control": catalog_cache.cache_control()}, query.fields)
+
+        snapshot = await catalog_cache.get()
+        # Encoded and compressed once per catalog version, then reused
+        with telemetry.phase("serialize"):
+            body, mimetype, variant_headers = snapshot.variant(
+                req.headers.get('Accept'), req.headers.get('Accept-Encoding')
+            )
+        telemetry.set(movies=len(snapshot.movies))
+        headers = {
+            **variant_headers,
+            "Cache-Control": catalog_cache.cache_control()
+        }
+
+        # Client already has this version of the catalog
+        if snapshot.matches(req.headers.get('If-None-Match'), headers["ETag"]):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+
+        return Response(
+            body,
+            headers=headers,
+            media_type=mimetype
+        )
+
+    except Exception as e:
+        logging.error(f"Error in GetMovies: {str(e)}")
+        return Response(
+            f"An error occurred while retrieving movies: {str(e)}",
+            status_code=500
+        )
+
+@app.route(route="getmoviesbyyear")
+@telemetry.instrument("getmoviesbyyear")
+async def get_movies_by_year(req: Request) -> Response:
+    logging.info('Processing GetMoviesByYear request')
+
+    try:
+        # Get year from query parameter
+        year = req.query_params.get('year')
+        if not year:
+            return Response(
+                "Please provide a year parameter",
+                status_code=400
+            )
+            
+        try:
+            year = int(year)
+        except ValueError:
+            return Response(
+                "Year must be a valid number",
+                status_code=400
+            )
+
+        # Get the document (or split items) for the specified year
+        documents = await read_year_documents(cosmos, year)
+        if not documents:
+            return Response(
+                json.dumps({
+                    "movies": [],
+                    "total": 0,
+                    "message": f"No movies found for year {year}"
+                }),
+                media_type="application/json"
+            )
+
+        # Extract movies from all letter groups and sort by title
+        sorted_movies = sorted(all_movies_in(documents), key=lambda x: x['title'])
+
+        return encoded_response(req, {
+            "movies": sorted_movies,
+            "total": len(sorted_movies),
+            "year": year
+        }, {"Cache-Control": catalog_cache.cache_control()})
+
+    except Exception as e:
+        logging.error(f"Error in GetMoviesByYear: {str(e)}")
+        return Response(
+            f"An error occurred while retrieving movies: {str(e)}",
+            status_code=500
+        )
+    
+@app.route(route="getmoviesbyyears")
+@telemetry.instrument("getmoviesbyyears")
+async def get_movies_by_years(req: Request) -> Response:
+    logging.info('Processing GetMoviesByYears request')
+
+    try:
+        try:
+            years = parse_years(req.query_params)
+        except InvalidQuery as e:
+            return Response(str(e), status_code=400)
+
+        # One point read per year, in parallel, then a merge of the per-year title-sorted lists
+        per_year = await read_years(cosmos, years)
+        with telemetry.phase("merge"):
+            movies = list(merge_by_title(per_year[year] for year in years))
+
+        return encoded_response(req, {
+            "movies": movies,
+            "total": len(movies),
+            "years": years,
+            "missing": [year for year in years if not per_year[year]]
+        }, {"Cache-Control": catalog_cache.cache_control()})
+
+    except Exception as e:
+        logging.error(f"Error in GetMoviesByYears: {str(e)}")
+        return Response(
+            f"An error occurred while retrieving movies: {str(e)}",
+            status_code=500
+        )
+
+@app.route(route="searchmovies")
+@telemetry.instrument("searchmovies")
+async def search_movies(req: Request) -> Response:
+    logging.info('Processing SearchMovies request')
+
+    try:
+        query = req.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                "Please provide a q parameter",
+                status_code=400
+            )
+
+        limit = req.query_params.get('limit') or DEFAULT_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            return Response(
+                "limit must be a valid number",
+                status_code=400
+            )
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return Response(
+                f"limit must be between 1 and {MAX_SEARCH_LIMIT}",
+                status_code=400
+            )
+
+        index = await catalog_search.get()
+        with telemetry.phase("search"):
+            results = index.search(query, limit)
+
+        return Response(
+            json.dumps({
+                "query": query,
+                "movies": results,
+                "total": len(results)
+            }),
+            media_type="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Error in SearchMovies: {str(e)}")
+        return Response(
+            f"An error occurred while searching movies: {str(e)}",
+            status_code=500
+        )
+
+async def generate_summary(movie: dict) -> str:
+    """Ask Azure OpenAI for a short summary of the movie"""
+    return await openai_client.chat(build_messages(movie))
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def summary_events(movie: dict):
+    """
+    Yield the summary for a movie as server-sent events: a "delta" event per
+    upstream token chunk, then a "done" event carrying the full text. Cached
+    summaries are sent as a single "done" event. If the upstream fails before
+    any delta went out, the newest stored summary is sent instead; once deltas
+    have gone out, a failure ends the stream with an "error" event.
+    """
+    deployment_name = openai_client.deployment_name
+    summary, source = await summary_cache.lookup(movie, deployment_name)
+    if summary is None:
+        parts = []
+        try:
+            async for delta in openai_client.stream_chat(build_messages(movie)):
+                parts.append(delta)
+                yield sse_event("delta", {"content": delta})
+        except OpenAIError:
+            # The client already has part of a new summary; a different, stale text can't complete it
+            summary = None if parts else await summary_cache.stale(movie)
+            if summary is None:
+                yield sse_event("error", {"error": "Error generating summary", "title": movie['title']})
+                return
+            source = "stale"
+        else:
+            summary, source = "".join(parts).strip(), "generated"
+            await summary_cache.save(movie, deployment_name, summary)
+
+    yield sse_event("done", {"title": movie['title'], "summary": summary, "cache": source})
+
+async def find_movie(title: str, year: Optional[int] = None) -> Optional[dict]:
+    """Look up a movie by title (and optionally year) using the catalog title index"""
+    snapshot = catalog_cache.current()
+
+    # With a year and no warm catalog, a single point read beats loading everything
+    if year and snapshot is None:
+        return find_in_documents(await read_year_documents(cosmos, year), title)
+
+    return (await catalog_cache.get()).titles.find(title, year)
+
+@app.route(route="getmoviesummary")
+@telemetry.instrument("getmoviesummary")
+async def get_movie_summary(req: Request) -> Response:
+    logging.info('Processing GetMovieSummary request')
+    try:
+        # Get movie title from query parameter
+        title = req.query_params.get('title')
+        if not title:
+            return Response(
+                "Please provide a movie title parameter",
+                status_code=400
+            )
+            
+        # Optional year disambiguates remakes and enables a point read
+        year = req.query_params.get('year') or None
+        if year:
+            try:
+                year = int(year)
+            except ValueError:
+                return Response(
+                    "Year must be a valid number",
+                    status_code=400
+                )
+
+        movie = await find_movie(title, year)
+
+        if not movie:
+            return Response(
+                json.dumps({
+                    "error": f"Movie '{title}' not found"
+                }),
+                status_code=404,
+                media_type="application/json"
+            )
+
+        # Opt-in server-sent events relaying the completion as it is generated
+        if req.query_params.get('stream', '').lower() == 'true':
+            # Each event is sent as soon as it is yielded
+            return StreamingResponse(
+                summary_events(movie),
+                headers={"Cache-Control": "no-cache"},
+                media_type="text/event-stream"
+            )
+
+        try:
+            summary, source = await summary_cache.get_or_create(
+                movie, openai_client.deployment_name, generate_summary
+            )
+        except OpenAIError:
+            # Upstream is failing (or its circuit is open); an older summary beats an error
+            summary, source = await summary_cache.stale(movie), "stale"
+            if summary is None:
+                return Response(
+                    json.dumps({
+                        "error": "Error generating summary",
+                        "title": movie['title']
+                    }),
+                    status_code=503,
+                    media_type="application/json"
+                )
+
+        telemetry.set(summary_source=source)
+
+        # Return just the title and summary
+        return Response(
+            json.dumps({
+                "title": movie['title'],
+                "summary": summary
+            }),
+            headers={"X-Cache": source},
+            media_type="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Error in GetMovieSummary: {str(e)}")
+        return Response(
+            json.dumps({
+                "error": "An error occurred while processing the request"
+            }),
+            status_code=500,
+            media_type="application/json"
+        )
+
+def parse_batch_item(item) -> tuple:
+    """(title, year) from a batch entry: a bare title or {"title": ..., "year": ...}"""
+    if isinstance(item, str):
+        return item, None
+    if not isinstance(item, dict) or not isinstance(item.get('title'), str):
+        raise ValueError("Each movie must be a title or an object with a title")
+    year = item.get('year')
+    return item['title'], int(year) if year not in (None, "") else None
+
+@app.route(route="getmoviesummaries", methods=["POST"])
+@telemetry.instrument("getmoviesummaries")
+async def get_movie_summaries(req: Request) -> Response:
+    logging.info('Processing GetMovieSummaries request')
+    try:
+        try:
+            body = await req.json()
+        except ValueError:
+            return Response(
+                "Request body must be JSON",
+                status_code=400
+            )
+
+        items = body.get('movies') if isinstance(body, dict) else body
+        if not isinstance(items, list) or not items:
+            return Response(
+                "Please provide a list of movies",
+                status_code=400
+            )
+        if len(items) > MAX_BATCH_SIZE:
+            return Response(
+                f"At most {MAX_BATCH_SIZE} movies can be summarized per request",
+                status_code=400
+            )
+
+        # Resolve every entry against one catalog snapshot
+        titles = (await catalog_cache.get()).titles
+        results = []
+        found = []
+        for item in items:
+            try:
+                title, year = parse_batch_item(item)
+            except (TypeError, ValueError):
+                results.append({"status": "invalid", "error": "Expected a title or {\"title\", \"year\"}"})
+                continue
+
+            movie = titles.find(title, year)
+            if movie is None:
+                results.append({"title": title, "status": "not_found"})
+                continue
+
+            result = {"title": movie['title'], "year": movie['year']}
+            results.append(result)
+            found.append((result, movie))
+
+        # Cached summaries come straight back; the rest share a bounded number of upstream calls
+        outcomes = await summary_cache.get_or_create_many(
+            [movie for _, movie in found], openai_client.deployment_name, generate_summary
+        )
+        for (result, movie), outcome in zip(found, outcomes):
+            if isinstance(outcome, BaseException):
+                logging.error(f"Error summarizing {movie['title']}: {str(outcome)}")
+                summary = await summary_cache.stale(movie) if isinstance(outcome, OpenAIError) else None
+                if summary is None:
+                    result.update({"status": "error", "error": "Error generating summary"})
+                    continue
+                outcome = (summary, "stale")
+
+            summary, source = outcome
+            result.update({"status": "ok", "summary": summary, "cache": source})
+
+        return Response(
+            json.dumps({
+                "results": results,
+                "total": len(results)
+            }),
+            media_type="application/json"
+        )
+
+    except Exception as e:
+        logging.error(f"Error in GetMovieSummaries: {str(e)}")
+        return Response(
+            json.dumps({
+                "error": "An error occurred while processing the request"
+            }),
+            status_code=500,
+            media_type="application/json"
+        )
+
+@app.route(route="getcachestats")
+@telemetry.instrument("getcachestats")
+async def get_cache_stats(req: Request) -> Response:
+    logging.info('Processing GetCacheStats request')
+    return Response(
+        json.dumps({
+            "summaries": summary_cache.snapshot_stats(),
+            "catalog": catalog_cache.snapshot_stats(),
+            "openai": {
+                "circuit": openai_client.breaker.state,
+                "consecutive_failures": openai_client.breaker.failures
+            }
+        }),
+        media_type="application/json"
+    )
@@ -0,0 +1,256 @@
+"""
+Filtering, pagination and field projection for /getmovies.
+
+A MovieQuery is parsed from the request parameters:
+- genre:        exact genre match (case-insensitive)
+- year:         a single year, or from / to for an inclusive range
+- prefix:       title prefix (case-insensitive)
+- fields:       comma-separated subset of title,genre,year,coverURL,coverURLs
+- limit:        page size
+- continuation: opaque token returned by the previous page
+
+Filters run over every release, so a remake sharing its title with an older
+movie is matched on its own year rather than hidden behind the newest
+release the way the plain /getmovies list dedupes titles. Results are
+ordered by title and then year, which is also what the continuation token
+records, so a page boundary between two releases of a title neither drops
+nor repeats one.
+
+When the catalog snapshot is already in memory the query runs against it
+without any RU spend. Otherwise the filters are pushed into Cosmos DB: a
+bounded year range is read with parallel point reads of the year documents
+(about 1 RU each), an open-ended one becomes a partition-key filter, and a
+title prefix only projects the matching letter-group subpath of each year
+document.
+
+Optional Environment Variables:
+- YEAR_READ_CONCURRENCY: Max year documents point-read at once (default: 10)
+"""
+import asyncio
+import base64
+import bisect
+import binascii
+import heapq
+import json
+import os
+import re
+
+from catalog import (SNAPSHOT_PARTITION, all_movies_in, normalize_title, read_year_documents, release_key,
+                     resolve_layouts, sort_releases)
+from cosmos_provider import collect
+
+MOVIE_FIELDS = ("title", "genre", "year", "coverURL", "coverURLs")
+MAX_LIMIT = 1000
+# Most year documents one request may point-read
+MAX_YEARS = 100
+
+
+class InvalidQuery(ValueError):
+    """A query parameter could not be parsed"""
+
+
+def letter_group(title):
+    """Letter group seed_data.py stores a title under: a-z, num or etc"""
+    first_char = title[0].lower()
+    if first_char.isalpha():
+        return first_char
+    if first_char.isnumeric():
+        return 'num'
+    return 'etc'
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQuery(f"{name} must be a valid number")
+
+
+def encode_continuation(movie):
+    """Token for the page after the given movie: its (title, year)"""
+    return base64.urlsafe_b64encode(json.dumps(release_key(movie)).encode('utf-8')).decode('ascii')
+
+
+def decode_continuation(token):
+    try:
+        title, year = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        return str(title), int(year)
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise InvalidQuery("Invalid continuation token")
+
+
+def parse_years(params):
+    """Years named by years=1999,2001 or by an inclusive from/to range"""
+    if params.get('years'):
+        try:
+            years = sorted({int(year) for year in params['years'].split(',') if year.strip()})
+        except ValueError:
+            raise InvalidQuery("years must be a comma-separated list of numbers")
+    else:
+        year_from = _int_param(params, 'from')
+        year_to = _int_param(params, 'to')
+        if year_from is None or year_to is None:
+            raise InvalidQuery("Please provide a years list or from and to parameters")
+        if year_from > year_to:
+            raise InvalidQuery("from must not be greater than to")
+        if year_to - year_from >= MAX_YEARS:
+            raise InvalidQuery(f"At most {MAX_YEARS} years can be read at once")
+        years = list(range(year_from, year_to + 1))
+
+    if not years:
+        raise InvalidQuery("Please provide at least one year")
+    if len(years) > MAX_YEARS:
+        raise InvalidQuery(f"At most {MAX_YEARS} years can be read at once")
+    return years
+
+
+async def read_years(provider, years):
+    """
+    Point-read the year documents in parallel, at most YEAR_READ_CONCURRENCY
+    at a time. Returns {year: movies sorted by title}; a year without movies
+    maps to an empty list.
+    """
+    semaphore = asyncio.Semaphore(int(os.environ.get("YEAR_READ_CONCURRENCY", 10)))
+
+    async def read(year):
+        async with semaphore:
+            documents = await read_year_documents(provider, year)
+        return year, sorted(all_movies_in(documents), key=lambda x: x['title'])
+
+    return dict(await asyncio.gather(*(read(year) for year in years)))
+
+
+def merge_by_title(movie_lists):
+    """Merge title-sorted lists into one title-sorted iterator without re-sorting"""
+    return heapq.merge(*movie_lists, key=lambda x: x['title'])
+
+
+class MovieQuery:
+    """Parsed /getmovies filters plus page position"""
+
+    def __init__(self, genre=None, year_from=None, year_to=None, prefix=None,
+                 fields=None, limit=None, after=None):
+        self.genre = genre.casefold() if genre else None
+        self.year_from = year_from
+        self.year_to = year_to
+        self.prefix = normalize_title(prefix) if prefix else None
+        self.fields = fields
+        self.limit = limit
+        self.after = after
+
+    @classmethod
+    def from_params(cls, params):
+        year = _int_param(params, 'year')
+        year_from = _int_param(params, 'from')
+        year_to = _int_param(params, 'to')
+        if year is not None:
+            year_from = year_to = year
+        if year_from is not None and year_to is not None and year_from > year_to:
+            raise InvalidQuery("from must not be greater than to")
+
+        fields = None
+        if params.get('fields'):
+            fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in MOVIE_FIELDS]
+            if unknown:
+                raise InvalidQuery(f"Unknown fields: {', '.join(unknown)}")
+
+        limit = _int_param(params, 'limit')
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise InvalidQuery(f"limit must be between 1 and {MAX_LIMIT}")
+
+        after = None
+        if params.get('continuation'):
+            after = decode_continuation(params['continuation'])
+
+        return cls(
+            genre=params.get('genre'),
+            year_from=year_from,
+            year_to=year_to,
+            prefix=params.get('prefix'),
+            fields=fields,
+            limit=limit,
+            after=after
+        )
+
+    @property
+    def is_empty(self):
+        """True when the request asks for the plain, complete catalog"""
+        return not any([
+            self.genre, self.year_from is not None, self.year_to is not None,
+            self.prefix, self.fields, self.limit, self.after
+        ])
+
+    def matches(self, movie):
+        if self.genre and movie['genre'].casefold() != self.genre:
+            return False
+        if self.year_from is not None and movie['year'] < self.year_from:
+            return False
+        if self.year_to is not None and movie['year'] > self.year_to:
+            return False
+        if self.prefix and not normalize_title(movie['title']).startswith(self.prefix):
+            return False
+        return True
+
+    def project(self, movie):
+        if not self.fields:
+            return movie
+        return {field: movie[field] for field in self.fields if field in movie}
+
+    def apply(self, movies):
+        """Filter movies sorted by (title, year), remakes included, and cut the requested page"""
+        matching = [movie for movie in movies if self.matches(movie)]
+
+        start = 0
+        if self.after is not None:
+            start = bisect.bisect_right(matching, self.after, key=release_key)
+
+        end = len(matching) if self.limit is None else start + self.limit
+        page = matching[start:end]
+        continuation = encode_continuation(page[-1]) if page and end < len(matching) else None
+
+        return {
+            "movies": [self.project(movie) for movie in page],
+            "total": len(matching),
+            "continuation": continuation
+        }
+
+    def cosmos_query(self):
+        """SQL query (and parameters) that only reads what this query can match"""
+        projection = "*"
+        if self.prefix:
+            group = letter_group(self.prefix)
+            # Property names can't be parameterized, so only project known-safe group names
+            if re.fullmatch(r"\w+", group):
+                projection = f'c.id, c.year, c["{group}"]'
+
+        # Never read the (large) catalog snapshot items here
+        conditions = ["c.year != @snapshot_partition"]
+        parameters = [{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}]
+        if self.year_from is not None:
+            conditions.append("c.year >= @year_from")
+            parameters.append({"name": "@year_from", "value": self.year_from})
+        if self.year_to is not None:
+            conditions.append("c.year <= @year_to")
+            parameters.append({"name": "@year_to", "value": self.year_to})
+
+        query = f"SELECT {projection} FROM c WHERE " + " AND ".join(conditions)
+        return query, parameters
+
+    async def run_in_cosmos(self, provider):
+        """Run the query with filters pushed into Cosmos DB"""
+        if self.year_from is not None and self.year_to is not None \
+                and self.year_to - self.year_from < MAX_YEARS:
+            # A bounded range is cheaper as one point read per year than as a cross-partition query
+            per_year = await read_years(provider, range(self.year_from, self.year_to + 1))
+            return self.apply(sort_releases(movie for movies in per_year.values() for movie in movies))
+
+        query, parameters = self.cosmos_query()
+        documents = await provider.run(lambda container: collect(
+            container.query_items(query=query, parameters=parameters)
+        ))
+
+        return self.apply(sort_releases(all_movies_in(resolve_layouts(documents))))
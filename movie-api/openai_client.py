@@ -0,0 +1,280 @@
+"""
+Azure OpenAI chat completions client for the function app.
+
+Keeps one aiohttp session with keep-alive per worker process, so summary
+requests reuse pooled connections and the worker can keep serving other
+requests while waiting on the upstream.
+
+Throttling (429) and transient upstream errors (5xx, timeouts, dropped
+connections) are retried with jittered exponential backoff, waiting at least
+as long as the retry-after header asks. A circuit breaker opens after a run of
+consecutive failures and fails calls immediately until a trial call succeeds,
+so requests don't pile up behind a degraded upstream.
+
+Required Environment Variables:
+- OPENAI_API_ENDPOINT, OPENAI_API_KEY, OPENAI_DEPLOYMENT_NAME, OPENAI_API_VERSION
+
+Optional Environment Variables:
+- OPENAI_POOL_SIZE: Max pooled connections to the endpoint (default: 20)
+- OPENAI_TIMEOUT: Total request timeout in seconds (default: 30)
+- OPENAI_CONNECT_TIMEOUT: Connect timeout in seconds (default: 5)
+- OPENAI_READ_TIMEOUT: Max wait for the next chunk of a response in seconds (default: 20)
+- OPENAI_MAX_RETRIES: Retries after the first attempt (default: 2)
+- OPENAI_BACKOFF_MAX: Max backoff between retries in seconds (default: 8)
+- OPENAI_BREAKER_THRESHOLD: Consecutive failures that open the circuit (default: 5)
+- OPENAI_BREAKER_RESET: Seconds the circuit stays open before a trial call (default: 30)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from telemetry import telemetry
+
+# Upstream statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OpenAIError(Exception):
+    """Azure OpenAI did not return a usable completion"""
+
+
+class CircuitOpenError(OpenAIError):
+    """The circuit breaker is open, so the upstream was not called"""
+
+
+class _RetryableError(OpenAIError):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(headers):
+    """Seconds the upstream asked us to wait, if it said"""
+    for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
+
+
+def _transient_errors():
+    """Failures worth retrying; aiohttp is only imported once a request is made"""
+    import aiohttp
+    return (_RetryableError, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half-open -> closed"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_running):
+            raise CircuitOpenError("Azure OpenAI circuit is open")
+        if state == "half-open":
+            # Let exactly one trial call probe the upstream
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def release(self):
+        """Free the trial slot after a call that says nothing about the upstream (e.g. it was cancelled)"""
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logging.warning(f"Opening Azure OpenAI circuit after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class OpenAIClient:
+    """Thin wrapper around a shared aiohttp session for chat/completions"""
+
+    def __init__(self):
+        self.pool_size = int(os.environ.get("OPENAI_POOL_SIZE", 20))
+        self.timeout = float(os.environ.get("OPENAI_TIMEOUT", 30))
+        self.connect_timeout = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(os.environ.get("OPENAI_READ_TIMEOUT", 20))
+        self.max_retries = int(os.environ.get("OPENAI_MAX_RETRIES", 2))
+        self.backoff_max = float(os.environ.get("OPENAI_BACKOFF_MAX", 8))
+        self.breaker = CircuitBreaker(
+            threshold=int(os.environ.get("OPENAI_BREAKER_THRESHOLD", 5)),
+            reset_timeout=float(os.environ.get("OPENAI_BREAKER_RESET", 30))
+        )
+        self._session = None
+
+    @property
+    def deployment_name(self):
+        return os.environ["OPENAI_DEPLOYMENT_NAME"]
+
+    def _url(self):
+        endpoint = os.environ["OPENAI_API_ENDPOINT"].rstrip('/')
+        api_version = os.environ["OPENAI_API_VERSION"]
+        return f"{endpoint}/openai/deployments/{self.deployment_name}/chat/completions?api-version={api_version}"
+
+    def _get_session(self):
+        # Created lazily because aiohttp sessions must be built inside the running loop
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(
+                    total=self.timeout,
+                    sock_connect=self.connect_timeout,
+                    sock_read=self.read_timeout
+                ),
+                headers={"api-key": os.environ["OPENAI_API_KEY"]}
+            )
+        return self._session
+
+    def _backoff(self, attempt, retry_after):
+        """Full-jitter exponential backoff, never shorter than retry-after"""
+        delay = random.uniform(0, min(self.backoff_max, 0.5 * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _check(self, response):
+        """Raise for a non-200 response, marking the ones worth retrying"""
+        if response.status == 200:
+            return
+        logging.error(f"OpenAI API error: {await response.text()}")
+        if response.status in RETRY_STATUSES:
+            raise _RetryableError(
+                f"OpenAI API returned {response.status}", _retry_after(response.headers)
+            )
+        raise OpenAIError(f"OpenAI API returned {response.status}")
+
+    async def _with_retries(self, call):
+        """
+        Run await call() through the circuit breaker, retrying throttling and
+        transient failures. Client errors (4xx other than 429) are not retried;
+        they still show the upstream is answering, so they close the circuit.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                result = await call()
+            except _transient_errors() as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    if isinstance(e, OpenAIError):
+                        raise OpenAIError(str(e)) from e
+                    raise OpenAIError(f"OpenAI API request failed: {str(e) or type(e).__name__}") from e
+                retry_after = e.retry_after if isinstance(e, _RetryableError) else None
+                delay = self._backoff(attempt, retry_after)
+                telemetry.add(openai_retries=1)
+                logging.warning(f"OpenAI request failed ({str(e) or type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except OpenAIError:
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                # Cancelled, or failed on our side: let the next call probe the upstream instead
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def chat(self, messages, max_tokens=150, temperature=0.7):
+        """Return the text of the first choice for a chat completion"""
+        payload = {
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+
+        async def call():
+            async with self._get_session().post(self._url(), json=payload) as response:
+                await self._check(response)
+                return await response.json()
+
+        with telemetry.phase("openai"):
+            data = await self._with_retries(call)
+
+        usage = data.get('usage') or {}
+        telemetry.add(
+            openai_calls=1,
+            prompt_tokens=usage.get('prompt_tokens', 0),
+            completion_tokens=usage.get('completion_tokens', 0)
+        )
+        return data['choices'][0]['message']['content'].strip()
+
+    async def stream_chat(self, messages, max_tokens=150, temperature=0.7):
+        """Yield content deltas of a chat completion as the upstream produces them"""
+        payload = {
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+
+        async def connect():
+            response = await self._get_session().post(self._url(), json=payload)
+            try:
+                await self._check(response)
+            except BaseException:
+                response.release()
+                raise
+            return response
+
+        # Only establishing the stream is retried; deltas already yielded can't be taken back
+        with telemetry.phase("openai_connect"):
+            response = await self._with_retries(connect)
+        telemetry.add(openai_calls=1)
+        try:
+            async with response:
+                # Server-sent events: one "data: {...}" line per chunk, ending with "data: [DONE]"
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+
+                    chunk = json.loads(data)
+                    # Azure sends a first chunk with prompt filter results and no choices
+                    if not chunk.get('choices'):
+                        continue
+                    delta = chunk['choices'][0].get('delta', {}).get('content')
+                    if delta:
+                        telemetry.add(stream_chunks=1)
+                        yield delta
+        except _transient_errors() as e:
+            raise OpenAIError(f"OpenAI stream interrupted: {str(e) or type(e).__name__}") from e
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+openai_client = OpenAIClient()
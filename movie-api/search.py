@@ -0,0 +1,222 @@
+"""
+In-memory title search for /searchmovies.
+
+Titles are indexed two ways:
+- a sorted list of normalized titles, so prefix matches are a binary search
+- trigram postings (trigram -> ids of titles containing it), so titles with
+  typos or reordered words still share most of their trigrams with the query
+
+Candidates only come from the rarest query trigrams: a title that shares at
+least MIN_SHARED of the query's trigrams must contain one of the rarest
+(n - required + 1) of them, so common trigrams like "the" never have their
+long posting lists walked. Candidates are ranked by exact / prefix / word
+prefix match, then by trigram (Dice) similarity.
+
+The index follows the catalog cache: when a new catalog snapshot is loaded,
+only the movies that were added or removed are re-indexed. That happens on a
+worker thread, in a copy of the index that shares its posting sets until
+they change, and the copy is swapped in once it is ready, so requests keep
+searching the previous index meanwhile.
+"""
+import asyncio
+import bisect
+import math
+
+from catalog import catalog_cache, normalize_title
+from telemetry import telemetry
+
+# Share of the query's trigrams a candidate must contain
+MIN_SHARED = 0.5
+# Lowest Dice similarity still returned as a fuzzy match
+MIN_SIMILARITY = 0.4
+# Shorter queries have too few trigrams to match fuzzily and only match by prefix
+MIN_FUZZY_LENGTH = 3
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def trigrams(text):
+    """Trigrams of a normalized title, padded so word starts and ends count"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Prefix and trigram index over movie titles with incremental updates"""
+
+    def __init__(self):
+        self.movies = {}
+        self.titles = {}
+        self.gram_counts = {}
+        self.postings = {}
+        self.sorted_titles = []
+        self._ids = {}
+        self._next_id = 0
+        # Grams whose posting set is shared with the index this one was copied from
+        self._shared = set()
+
+    def __len__(self):
+        return len(self.movies)
+
+    def copy(self):
+        """Copy that shares posting sets until it changes them, so updating it leaves this index untouched"""
+        other = SearchIndex()
+        other.movies = dict(self.movies)
+        other.titles = dict(self.titles)
+        other.gram_counts = dict(self.gram_counts)
+        other.postings = dict(self.postings)
+        # Replaced rather than modified by update()
+        other.sorted_titles = self.sorted_titles
+        other._ids = dict(self._ids)
+        other._next_id = self._next_id
+        other._shared = set(self.postings)
+        return other
+
+    def _own_posting(self, gram):
+        """The posting set of a gram, copied first if it is still shared"""
+        ids = self.postings.get(gram)
+        if ids is None:
+            ids = self.postings[gram] = set()
+        elif gram in self._shared:
+            ids = self.postings[gram] = set(ids)
+            self._shared.discard(gram)
+        return ids
+
+    def _add(self, key, movie):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[key] = doc_id
+        self.movies[doc_id] = movie
+        title = normalize_title(movie['title'])
+        self.titles[doc_id] = title
+        grams = trigrams(title)
+        self.gram_counts[doc_id] = len(grams)
+        for gram in grams:
+            self._own_posting(gram).add(doc_id)
+
+    def _remove(self, key):
+        doc_id = self._ids.pop(key)
+        for gram in trigrams(self.titles.pop(doc_id)):
+            ids = self._own_posting(gram)
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[gram]
+        del self.gram_counts[doc_id]
+        del self.movies[doc_id]
+
+    def update(self, movies):
+        """Make the index hold exactly these movies, re-indexing only what changed"""
+        current = {(movie['title'], movie['year']): movie for movie in movies}
+
+        removed = [key for key in self._ids if key not in current]
+        for key in removed:
+            self._remove(key)
+
+        added = 0
+        for key, movie in current.items():
+            doc_id = self._ids.get(key)
+            if doc_id is None:
+                self._add(key, movie)
+                added += 1
+            else:
+                # Same title and year; genre or covers may still have changed
+                self.movies[doc_id] = movie
+
+        if added or removed or not self.sorted_titles:
+            self.sorted_titles = sorted((title, doc_id) for doc_id, title in self.titles.items())
+        return added, len(removed)
+
+    def _prefix_matches(self, query, limit):
+        start = bisect.bisect_left(self.sorted_titles, (query,))
+        matches = []
+        for title, doc_id in self.sorted_titles[start:start + limit]:
+            if not title.startswith(query):
+                break
+            matches.append(doc_id)
+        return matches
+
+    def _fuzzy_candidates(self, grams):
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        required = max(1, math.ceil(len(grams) * MIN_SHARED))
+        candidates = set()
+        for ids in postings[:len(grams) - required + 1]:
+            candidates.update(ids)
+        return candidates
+
+    def _score(self, query, gram_postings, doc_id):
+        title = self.titles[doc_id]
+        shared = sum(1 for ids in gram_postings if doc_id in ids)
+        similarity = 2 * shared / (len(gram_postings) + self.gram_counts[doc_id])
+        if title == query:
+            return 3 + similarity
+        if title.startswith(query):
+            return 2 + similarity
+        if f" {query}" in title:
+            return 1 + similarity
+        return similarity
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Best matching movies for a query, each with its relevance score"""
+        query = normalize_title(query)
+        if not query:
+            return []
+
+        grams = trigrams(query)
+        candidates = set(self._prefix_matches(query, limit))
+        if len(query) >= MIN_FUZZY_LENGTH:
+            candidates.update(self._fuzzy_candidates(grams))
+
+        # Posting sets of the query's trigrams, shared by every candidate's score
+        gram_postings = [self.postings.get(gram, ()) for gram in grams]
+        scored = []
+        for doc_id in candidates:
+            score = self._score(query, gram_postings, doc_id)
+            if score >= MIN_SIMILARITY:
+                scored.append((score, doc_id))
+
+        # Among equal scores: shorter titles, then alphabetically, then the newest release
+        scored.sort(key=lambda item: (
+            -item[0], len(self.titles[item[1]]), self.titles[item[1]], -int(self.movies[item[1]]['year'])
+        ))
+        return [
+            dict(self.movies[doc_id], score=round(score, 3))
+            for score, doc_id in scored[:limit]
+        ]
+
+
+class CatalogSearch:
+    """Keeps a SearchIndex in step with the catalog cache"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.index = SearchIndex()
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _updated(self, snapshot):
+        """A copy of the index updated to the snapshot's movies; runs on a worker thread"""
+        # Every release of a title, not just the deduped /getmovies list
+        movies = [movie for matches in snapshot.titles.by_title.values() for movie in matches]
+        index = self.index.copy()
+        index.update(movies)
+        return index
+
+    async def get(self):
+        """Return the index for the current catalog, updating it if the catalog changed"""
+        snapshot = await self.catalog.get()
+        if snapshot is self._snapshot:
+            return self.index
+        if self._snapshot is not None and self._lock.locked():
+            # Another request is already indexing the new catalog; search the previous one meanwhile
+            return self.index
+
+        async with self._lock:
+            if snapshot is not self._snapshot:
+                with telemetry.phase("search_index"):
+                    index = await asyncio.to_thread(self._updated, snapshot)
+                # Swapped in whole, so a search never sees a half-updated index
+                self.index, self._snapshot = index, snapshot
+        return self.index
+
+
+catalog_search = CatalogSearch(catalog_cache)
@@ -0,0 +1,44 @@
+"""
+Cold-start helpers for the function app.
+
+The Cosmos DB SDK and aiohttp are imported on first use, and the Azure
+Monitor telemetry exporter is configured on first export, so a cold worker
+can load function_app.py quickly. With WARMUP_ON_START=true both happen in a
+background thread right after startup instead, so the first request usually
+finds them ready.
+
+Optional Environment Variables:
+- WARMUP_ON_START: Import heavy dependencies in the background at startup (default: false)
+"""
+import importlib
+import logging
+import threading
+import time
+
+from telemetry import telemetry
+
+# Deferred imports, roughly in the order the first request needs them
+HEAVY_MODULES = (
+    "aiohttp",
+    "azure.core.pipeline.transport",
+    "azure.cosmos.aio",
+    "azure.cosmos.exceptions"
+)
+
+
+def _import_modules():
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.warning(f"Warm-up import of {name} failed: {str(e)}")
+    telemetry.warm_up()
+    logging.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+
+def start_warmup():
+    """Import HEAVY_MODULES and set up telemetry on a daemon thread, and return the thread"""
+    thread = threading.Thread(target=_import_modules, name="warmup", daemon=True)
+    thread.start()
+    return thread
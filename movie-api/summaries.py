@@ -0,0 +1,270 @@
+"""
+Two-tier cache for AI-generated movie summaries.
+
+An in-memory LRU sits in front of a persistent Cosmos DB container, so a
+summary is only generated once per (title, year, genre, prompt version,
+deployment). Concurrent requests for the same uncached movie share a single
+upstream call instead of each hitting Azure OpenAI.
+
+Optional Environment Variables:
+- SUMMARY_CACHE_SIZE: Max summaries kept in memory (default: 1024)
+- SUMMARY_CACHE_PERSIST: Set to "false" to skip the Cosmos DB tier (default: true)
+- SUMMARY_BATCH_CONCURRENCY: Max concurrent generations per batch request (default: 5)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from catalog import normalize_title
+from cosmos_provider import collect, cosmos, not_found_error
+
+SYSTEM_PROMPT = "You are a knowledgeable film critic who provides concise, engaging movie summaries."
+
+PROMPT_TEMPLATE = """Write a brief, engaging summary of the movie "{title}" ({year}).
+                    This is a {genre} film.
+                    Keep the summary concise, around 2-3 sentences."""
+
+# Most movies one /getmoviesummaries request may ask for
+MAX_BATCH_SIZE = 50
+
+# Changing either prompt changes the version, which invalidates cached summaries
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + PROMPT_TEMPLATE).encode('utf-8')).hexdigest()[:12]
+
+
+def build_messages(movie):
+    """Chat messages used to generate the summary for a movie"""
+    prompt = PROMPT_TEMPLATE.format(title=movie['title'], year=movie['year'], genre=movie['genre'])
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def summary_key(movie, deployment_name):
+    """Stable cache key for a movie summary"""
+    raw = "|".join([
+        normalize_title(movie['title']),
+        str(movie['year']),
+        movie['genre'].casefold(),
+        PROMPT_VERSION,
+        deployment_name
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class SummaryStore:
+    """Persistent summary storage, one item per cache key (partitioned by /id)"""
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def get(self, key):
+        try:
+            item = await self.provider.run(
+                lambda container: container.read_item(item=key, partition_key=key),
+                self.provider.summary_container_name
+            )
+        except not_found_error():
+            return None
+        return item.get('summary')
+
+    async def find_latest(self, movie):
+        """Newest summary stored for a movie under any prompt version or deployment"""
+        items = await self.provider.run(
+            lambda container: collect(container.query_items(
+                query="SELECT TOP 1 c.summary FROM c WHERE c.title = @title AND c.year = @year "
+                      "ORDER BY c.createdAt DESC",
+                parameters=[
+                    {"name": "@title", "value": movie['title']},
+                    {"name": "@year", "value": movie['year']}
+                ]
+            )),
+            self.provider.summary_container_name
+        )
+        return items[0]['summary'] if items else None
+
+    async def put(self, key, movie, deployment_name, summary):
+        document = {
+            "id": key,
+            "title": movie['title'],
+            "year": movie['year'],
+            "genre": movie['genre'],
+            "promptVersion": PROMPT_VERSION,
+            "deployment": deployment_name,
+            "summary": summary,
+            "createdAt": datetime.now(timezone.utc).isoformat()
+        }
+        await self.provider.run(
+            lambda container: container.upsert_item(document),
+            self.provider.summary_container_name
+        )
+
+
+class SummaryCache:
+    """In-memory LRU over a SummaryStore with single-flight generation"""
+
+    def __init__(self, store, max_size=None, persist=None):
+        self.store = store
+        self.max_size = max_size or int(os.environ.get("SUMMARY_CACHE_SIZE", 1024))
+        self.persist = (
+            persist if persist is not None
+            else os.environ.get("SUMMARY_CACHE_PERSIST", "true").lower() != "false"
+        )
+
+        self.batch_concurrency = int(os.environ.get("SUMMARY_BATCH_CONCURRENCY", 5))
+
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self.stats = {
+            "memory_hits": 0,
+            "store_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "stale": 0
+        }
+
+    def _remember(self, key, summary):
+        self._memory[key] = summary
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def peek(self, key):
+        """Return a summary from memory without touching the store"""
+        summary = self._memory.get(key)
+        if summary is not None:
+            self._memory.move_to_end(key)
+        return summary
+
+    async def get_or_create(self, movie, deployment_name, generate):
+        """
+        Return (summary, source) for a movie, where source is one of
+        "memory", "store", "generated" or "coalesced". await generate(movie)
+        only runs for the first of several concurrent requests for a key.
+        """
+        key = summary_key(movie, deployment_name)
+
+        summary = self.peek(key)
+        if summary is not None:
+            self.stats["memory_hits"] += 1
+            return summary, "memory"
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # shield() so one cancelled waiter does not cancel the shared call
+            return await asyncio.shield(future), "coalesced"
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            summary, source = await self._load_or_generate(key, movie, deployment_name, generate)
+            self._remember(key, summary)
+            future.set_result(summary)
+            return summary, source
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def get_or_create_many(self, movies, deployment_name, generate):
+        """
+        get_or_create() for several movies at once. Summaries already in memory
+        are returned immediately; the rest are read or generated with at most
+        batch_concurrency in flight. Returns a (summary, source) tuple or the
+        raised exception for each movie, in order.
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def one(movie):
+            if self.peek(summary_key(movie, deployment_name)) is not None:
+                return await self.get_or_create(movie, deployment_name, generate)
+            async with semaphore:
+                return await self.get_or_create(movie, deployment_name, generate)
+
+        return await asyncio.gather(*(one(movie) for movie in movies), return_exceptions=True)
+
+    async def _read_store(self, key):
+        if not self.persist:
+            return None
+        try:
+            return await self.store.get(key)
+        except Exception as e:
+            logging.warning(f"Summary store read failed: {str(e)}")
+            return None
+
+    async def _write_store(self, key, movie, deployment_name, summary):
+        if not self.persist:
+            return
+        try:
+            await self.store.put(key, movie, deployment_name, summary)
+        except Exception as e:
+            logging.warning(f"Summary store write failed: {str(e)}")
+
+    async def _load_or_generate(self, key, movie, deployment_name, generate):
+        summary = await self._read_store(key)
+        if summary is not None:
+            self.stats["store_hits"] += 1
+            return summary, "store"
+
+        self.stats["misses"] += 1
+        summary = await generate(movie)
+        await self._write_store(key, movie, deployment_name, summary)
+        return summary, "generated"
+
+    async def lookup(self, movie, deployment_name):
+        """Return (summary, source) from memory or the store, or (None, None) on a miss"""
+        key = summary_key(movie, deployment_name)
+
+        summary = self.peek(key)
+        if summary is not None:
+            self.stats["memory_hits"] += 1
+            return summary, "memory"
+
+        summary = await self._read_store(key)
+        if summary is not None:
+            self.stats["store_hits"] += 1
+            self._remember(key, summary)
+            return summary, "store"
+
+        self.stats["misses"] += 1
+        return None, None
+
+    async def stale(self, movie):
+        """
+        Fallback for when a summary can't be generated: the newest stored
+        summary for the movie from any prompt version or deployment, or None
+        """
+        if not self.persist:
+            return None
+        try:
+            summary = await self.store.find_latest(movie)
+        except Exception as e:
+            logging.warning(f"Stale summary lookup failed: {str(e)}")
+            return None
+        if summary is not None:
+            self.stats["stale"] += 1
+        return summary
+
+    async def save(self, movie, deployment_name, summary):
+        """Cache a summary that was generated outside get_or_create (e.g. streamed)"""
+        key = summary_key(movie, deployment_name)
+        self._remember(key, summary)
+        await self._write_store(key, movie, deployment_name, summary)
+
+    def snapshot_stats(self):
+        return dict(self.stats, size=len(self._memory), prompt_version=PROMPT_VERSION)
+
+
+summary_cache = SummaryCache(SummaryStore(cosmos))
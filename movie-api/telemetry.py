@@ -0,0 +1,280 @@
+"""
+Per-request telemetry for the function app.
+
+Every route is wrapped with telemetry.instrument(), which keeps a
+RequestTelemetry for the invocation in a context variable. Code further
+down (the Cosmos DB provider, the OpenAI client, the catalog and summary
+caches) adds to it without having it passed around:
+- telemetry.phase(name): time a block; durations of the same phase add up
+- telemetry.add(**metrics): add to counters (RU charge, documents, tokens, ...)
+- telemetry.set(**values): record a value (cache outcome, ...)
+
+When the invocation finishes, its route, status, duration, phase durations
+and metrics are handed to the exporter as one flat dict:
+- AzureMonitorExporter, the default when APPLICATIONINSIGHTS_CONNECTION_STRING
+  is set, sends it through Azure Monitor OpenTelemetry as a trace whose
+  attributes Application Insights stores as customDimensions. The Functions
+  host only forwards a log record's message, level and category, so logging
+  through it cannot carry the fields.
+- LoggingExporter logs it as JSON in the message, for local runs.
+- InMemoryExporter keeps them in a list, for tests and benchmarks.
+
+Requests that are not sampled get no RequestTelemetry, and every helper
+returns immediately for them.
+
+Optional Environment Variables:
+- TELEMETRY_SAMPLE_RATE: Share of requests that record telemetry, 0 to 1 (default: 1)
+- TELEMETRY_EXPORTER: "azure_monitor", "logging" or "memory" (default: azure_monitor
+  when APPLICATIONINSIGHTS_CONNECTION_STRING is set, logging otherwise)
+- APPLICATIONINSIGHTS_CONNECTION_STRING: Application Insights resource to export to
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+_current = contextvars.ContextVar("request_telemetry", default=None)
+_NOOP = contextlib.nullcontext()
+# Libraries Azure Monitor OpenTelemetry instruments unless told not to
+INSTRUMENTED_LIBRARIES = (
+    "azure_sdk", "django", "fastapi", "flask", "httpx", "psycopg2", "requests", "urllib", "urllib3"
+)
+
+
+class RequestTelemetry:
+    """Phase durations and metrics collected during one invocation"""
+
+    __slots__ = ("route", "phases", "metrics")
+
+    def __init__(self, route):
+        self.route = route
+        self.phases = {}
+        self.metrics = {}
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add(self, **metrics):
+        for name, value in metrics.items():
+            self.metrics[name] = self.metrics.get(name, 0) + value
+
+    def set(self, **values):
+        self.metrics.update(values)
+
+    def dimensions(self, status_code, seconds):
+        dimensions = {
+            "route": self.route,
+            "status": status_code,
+            "duration_ms": round(seconds * 1000, 3)
+        }
+        for name, phase_seconds in self.phases.items():
+            dimensions[f"{name}_ms"] = round(phase_seconds * 1000, 3)
+        for name, value in self.metrics.items():
+            dimensions[name] = round(value, 3) if isinstance(value, float) else value
+        return dimensions
+
+
+class _Phase:
+    __slots__ = ("record", "name", "started")
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.record.add_phase(self.name, time.perf_counter() - self.started)
+
+
+class LoggingExporter:
+    """Log each request's telemetry as JSON in the log message"""
+
+    def __init__(self, logger_name="telemetry"):
+        self.logger = logging.getLogger(logger_name)
+
+    def export(self, dimensions):
+        self.logger.info(f"Telemetry {json.dumps(dimensions)}")
+
+
+class AzureMonitorExporter:
+    """
+    Send each request's telemetry to Application Insights as a trace with its
+    fields as attributes (customDimensions).
+
+    Importing and configuring Azure Monitor OpenTelemetry takes a few hundred
+    milliseconds, so it happens on the first export (or in warm_up()) rather
+    than while function_app.py is imported. If that fails, telemetry is
+    logged as LoggingExporter does instead.
+    """
+
+    def __init__(self, connection_string, logger_name="telemetry"):
+        self.connection_string = connection_string
+        self.logger = logging.getLogger(logger_name)
+        self._configured = False
+        self._fallback = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Configure the exporter now, e.g. on the warm-up thread"""
+        if self._configured:
+            return
+        with self._lock:
+            if self._configured:
+                return
+            try:
+                from azure.monitor.opentelemetry import configure_azure_monitor
+
+                # Only this logger goes through OpenTelemetry; the host already
+                # records requests and dependencies, so nothing is instrumented
+                configure_azure_monitor(
+                    connection_string=self.connection_string,
+                    logger_name=self.logger.name,
+                    disable_tracing=True,
+                    disable_metrics=True,
+                    enable_live_metrics=False,
+                    instrumentation_options={library: {"enabled": False} for library in INSTRUMENTED_LIBRARIES}
+                )
+                self.logger.setLevel(logging.INFO)
+                # The host would forward the record again as a trace without the attributes
+                self.logger.propagate = False
+            except Exception as e:
+                logging.warning(f"Could not set up Azure Monitor telemetry, logging it instead: {str(e)}")
+                self._fallback = LoggingExporter(self.logger.name)
+            self._configured = True
+
+    def export(self, dimensions):
+        self.warm_up()
+        if self._fallback is not None:
+            self._fallback.export(dimensions)
+            return
+        # Attributes come from the record's extra fields
+        self.logger.info(f"Telemetry {dimensions['route']}", extra=dimensions)
+
+
+class InMemoryExporter:
+    """Keep the most recent max_items requests' telemetry in memory"""
+
+    def __init__(self, max_items=1000):
+        self.items = deque(maxlen=max_items)
+
+    def export(self, dimensions):
+        self.items.append(dimensions)
+
+    def clear(self):
+        self.items.clear()
+
+
+def default_exporter():
+    """The exporter chosen by TELEMETRY_EXPORTER and APPLICATIONINSIGHTS_CONNECTION_STRING"""
+    connection_string = os.environ.get("APPLICATIONINSIGHTS_CONNECTION_STRING")
+    name = os.environ.get("TELEMETRY_EXPORTER") or ("azure_monitor" if connection_string else "logging")
+    if name == "memory":
+        return InMemoryExporter()
+    if name == "azure_monitor":
+        if connection_string:
+            return AzureMonitorExporter(connection_string)
+        logging.warning("APPLICATIONINSIGHTS_CONNECTION_STRING is not set, logging telemetry instead")
+    return LoggingExporter()
+
+
+class Telemetry:
+    """Entry points for instrumenting routes and adding to the current request's telemetry"""
+
+    def __init__(self, exporter=None, sample_rate=None):
+        self.exporter = exporter if exporter is not None else default_exporter()
+        self.sample_rate = (
+            sample_rate if sample_rate is not None
+            else float(os.environ.get("TELEMETRY_SAMPLE_RATE", 1))
+        )
+
+    def instrument(self, route):
+        """Decorator recording telemetry for a route handler's invocations"""
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(req, *args, **kwargs):
+                if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+                    return await handler(req, *args, **kwargs)
+
+                record = RequestTelemetry(route)
+                token = _current.set(record)
+                started = time.perf_counter()
+                status_code = 500
+                streaming = False
+                try:
+                    response = await handler(req, *args, **kwargs)
+                    status_code = response.status_code
+                    if hasattr(response, "body_iterator"):
+                        # Streamed bodies are produced after the handler returns
+                        response.body_iterator = self._stream(
+                            record, response.body_iterator, status_code, started
+                        )
+                        streaming = True
+                    else:
+                        record.add(response_bytes=len(response.body or b""))
+                    return response
+                finally:
+                    _current.reset(token)
+                    if not streaming:
+                        self._export(record, status_code, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    async def _stream(self, record, chunks, status_code, started):
+        """
+        Relay a streamed response body, recording what producing it costs and
+        exporting the request's telemetry once the stream ends
+        """
+        # The body is iterated by the HTTP server's task, outside the handler's context
+        token = _current.set(record)
+        try:
+            async for chunk in chunks:
+                record.add(response_bytes=len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk))
+                yield chunk
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                pass  # Closed from another context, e.g. on client disconnect
+            self._export(record, status_code, time.perf_counter() - started)
+
+    def _export(self, record, status_code, seconds):
+        # Telemetry must never fail the request it describes
+        try:
+            self.exporter.export(record.dimensions(status_code, seconds))
+        except Exception as e:
+            logging.warning(f"Could not export telemetry: {str(e)}")
+
+    def warm_up(self):
+        """Set up the exporter ahead of the first export, if it needs setting up"""
+        if hasattr(self.exporter, "warm_up"):
+            self.exporter.warm_up()
+
+    def current(self):
+        """The current request's RequestTelemetry, or None outside a sampled request"""
+        return _current.get()
+
+    def phase(self, name):
+        """Context manager timing a block as a phase of the current request"""
+        record = _current.get()
+        return _NOOP if record is None else _Phase(record, name)
+
+    def add(self, **metrics):
+        record = _current.get()
+        if record is not None:
+            record.add(**metrics)
+
+    def set(self, **values):
+        record = _current.get()
+        if record is not None:
+            record.set(**values)
+
+
+telemetry = Telemetry()
@@ -0,0 +1,199 @@
+"""
+Catalog Snapshot Builder for Cosmos DB
+
+Builds the precomputed "catalog snapshot" read model the API serves
+/getmovies from: every movie sorted by title, in a compact columnar form
+(parallel arrays, genres interned into a lookup list). The API loads it with
+a handful of point reads instead of querying and flattening every year
+document.
+
+A large catalog does not fit in one 2 MB item, so the snapshot is stored in
+the otherwise unused year 0 partition as:
+- chunk items, catalog_snapshot_{version}_{n}, each holding the columns of a
+  consecutive run of movies and staying under MAX_CHUNK_BYTES
+- a manifest, catalog_snapshot, holding the genres and the ids of the chunks
+
+New chunks are written before the manifest points at them, and the previous
+version's chunks are only deleted afterwards, so the API never finds a
+manifest whose chunks are missing.
+
+Covers are stored by poster file name relative to the manifest's
+posterBase rather than as three full URLs per movie; renditions named the
+way upload_covers.py names them are a single flag.
+
+seed_data.py and upload_covers.py rebuild it after they change data; it can
+also be rebuilt on its own. In a container partitioned by the synthetic key
+(see document_layout.py) the snapshot items carry pk 0, so they stay in a
+partition of their own there too.
+
+Requirements:
+- Azure Cosmos DB connection string set as environment variable: COSMOSDB_CONNECTION_STRING
+- Optional: COSMOS_CONTAINER_NAME to rebuild the snapshot of another movies container
+
+Example usage:
+    python catalog_snapshot.py
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from document_layout import MOVIES_CONTAINER, document_movies, resolve_layouts, uses_synthetic_key, with_synthetic_key
+
+SNAPSHOT_ID = "catalog_snapshot"
+# The container is partitioned by /year; no real movie has year 0
+SNAPSHOT_PARTITION = 0
+# Cosmos DB items are capped at 2 MB; leave headroom for the envelope
+MAX_CHUNK_BYTES = 1_500_000
+# Blob name of a poster rendition next to posters/{stem}.{ext} (see upload_covers.py)
+RENDITION_FORMAT = "{stem}-{name}.webp"
+
+
+def is_snapshot(doc):
+    return doc.get('year') == SNAPSHOT_PARTITION
+
+
+def poster_base(movies):
+    """URL prefix the poster blobs share, taken from the first cover"""
+    for movie in movies:
+        url = movie.get('coverURL')
+        if url and '/' in url:
+            return url.rsplit('/', 1)[0] + '/'
+    return None
+
+
+def rendition_names(movies):
+    """Every rendition name in use, in first-seen order"""
+    names = {}
+    for movie in movies:
+        for name in movie.get('coverURLs') or {}:
+            names.setdefault(name, None)
+    return list(names)
+
+
+def encode_cover(movie, base, names):
+    """
+    (poster, renditions) columns of a movie: the poster's file name under
+    base, and 1 when its renditions are exactly the standard ones derived
+    from that name. Covers stored anywhere else keep their full URLs.
+    """
+    url = movie.get('coverURL')
+    urls = movie.get('coverURLs') or None
+    if not url:
+        return None, urls
+
+    poster = url
+    if base and url.startswith(base) and '/' not in url[len(base):]:
+        poster = url[len(base):]
+    if urls and poster != url and set(urls) == set(names):
+        stem = poster.rsplit('.', 1)[0]
+        if all(urls[name] == base + RENDITION_FORMAT.format(stem=stem, name=name) for name in names):
+            urls = 1
+    return poster, urls
+
+
+def chunk_rows(rows, max_bytes=MAX_CHUNK_BYTES):
+    """Split rows into consecutive runs whose JSON stays under max_bytes"""
+    chunk, size = [], 0
+    for row in rows:
+        row_size = len(json.dumps(row).encode('utf-8'))
+        if chunk and size + row_size > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+
+def build_snapshot(documents, max_chunk_bytes=MAX_CHUNK_BYTES, synthetic=False):
+    """
+    The snapshot items for all movies in the given year documents or split
+    items: the manifest first, then its chunks. With synthetic, the items
+    carry their synthetic partition key.
+    """
+    movies = document_movies(resolve_layouts(doc for doc in documents if not is_snapshot(doc)))
+    movies.sort(key=lambda m: (m['title'], m['year']))
+
+    genres = sorted({movie['genre'] for movie in movies})
+    genre_index = {genre: i for i, genre in enumerate(genres)}
+    base = poster_base(movies)
+    names = rendition_names(movies)
+    rows = [
+        (movie['title'], genre_index[movie['genre']], movie['year'], *encode_cover(movie, base, names))
+        for movie in movies
+    ]
+    version = hashlib.sha256(json.dumps([genres, base, names, rows]).encode('utf-8')).hexdigest()
+
+    chunks = []
+    for index, chunk in enumerate(chunk_rows(rows, max_chunk_bytes)):
+        title, genre, year, poster, renditions = (list(column) for column in zip(*chunk))
+        chunks.append({
+            "id": f"{SNAPSHOT_ID}_{version[:16]}_{index}",
+            "year": SNAPSHOT_PARTITION,
+            "index": index,
+            "columns": {"title": title, "genre": genre, "year": year, "poster": poster, "renditions": renditions}
+        })
+
+    manifest = {
+        "id": SNAPSHOT_ID,
+        "year": SNAPSHOT_PARTITION,
+        "count": len(movies),
+        "genres": genres,
+        "posterBase": base,
+        "renditionNames": names,
+        "renditionFormat": RENDITION_FORMAT,
+        "chunks": [chunk['id'] for chunk in chunks],
+        "version": version,
+        "generatedAt": datetime.now(timezone.utc).isoformat()
+    }
+    items = [manifest] + chunks
+    return [with_synthetic_key(item) for item in items] if synthetic else items
+
+
+def write_snapshot(container):
+    """Rebuild the snapshot from the stored year documents, then remove the previous version's chunks"""
+    try:
+        documents = container.query_items(
+            query="SELECT * FROM c WHERE c.year != @snapshot_partition",
+            parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}],
+            enable_cross_partition_query=True
+        )
+        manifest, *chunks = build_snapshot(documents, synthetic=uses_synthetic_key(container))
+        previous = {item['id'] for item in container.query_items(
+            query="SELECT c.id FROM c",
+            partition_key=SNAPSHOT_PARTITION
+        )}
+
+        # Chunks first, so the manifest never points at chunks that are not there yet
+        size = 0
+        for chunk in chunks:
+            container.upsert_item(chunk)
+            size += len(json.dumps(chunk).encode('utf-8'))
+        container.upsert_item(manifest)
+
+        for doc_id in previous - set(manifest['chunks']) - {SNAPSHOT_ID}:
+            try:
+                container.delete_item(doc_id, partition_key=SNAPSHOT_PARTITION)
+            except CosmosResourceNotFoundError:
+                pass
+
+        print(f"Wrote catalog snapshot: {manifest['count']} movies in {len(chunks)} chunks, {size} bytes")
+        return True
+
+    except Exception as e:
+        print(f"Error writing catalog snapshot: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    connection_string = os.getenv("COSMOSDB_CONNECTION_STRING")
+    if not connection_string:
+        print("Error: COSMOSDB_CONNECTION_STRING environment variable is not set")
+    else:
+        client = CosmosClient.from_connection_string(connection_string)
+        container = client.get_database_client("moviedb").get_container_client(MOVIES_CONTAINER)
+        write_snapshot(container)
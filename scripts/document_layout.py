@@ -0,0 +1,206 @@
+"""
+Document layouts for the movie catalog in Cosmos DB.
+
+The original movies container is partitioned by /year. A year's movies are
+stored in one of three layouts, all inside that year's logical partition:
+- year:   one document, year_{year}, holding every letter group (the original layout)
+- letter: one item per letter group, year_{year}_{group}
+- movie:  one item per movie, movie_{year}_{hash}
+
+Split items keep the letter-group shape of the year document
+({group: {"movies": [...]}}), so every reader that walks letter groups works
+on all three layouts, and a cover update in the movie layout patches (and
+pays request units for) a single small item instead of the whole year.
+
+The year layout splits automatically: a year document larger than the split
+threshold is stored as letter items instead, and a letter item still larger
+than that is stored as movie items.
+
+While a year is being migrated both its year document and split items can
+exist; readers treat the year document as authoritative until it is deleted
+(see resolve_layouts).
+
+A container created by migrate_layout.py --target is partitioned by a
+synthetic key, /pk, instead: year documents (and the catalog snapshot) keep
+their year as key, while split items are keyed "{year}_{group}", so a large
+year is spread over one logical partition per letter group rather than
+making its year a hot partition. Items written to such a container carry
+the key in "pk"; reading a whole year there is a cross-partition query on
+c.year.
+
+Optional Environment Variables:
+- COSMOS_CONTAINER_NAME: Movies container the scripts work on, as for the API (default: movies)
+"""
+import hashlib
+import json
+import os
+
+LAYOUTS = ("year", "letter", "movie")
+DEFAULT_LAYOUT = "year"
+# Cosmos DB items are capped at 2 MB; leave headroom for cover URLs added later
+DEFAULT_SPLIT_BYTES = 1_500_000
+MOVIES_CONTAINER = os.getenv("COSMOS_CONTAINER_NAME", "movies")
+SYNTHETIC_KEY_PATH = "/pk"
+
+
+def letter_group(title):
+    """Get the group for the title (first letter, num, or etc)"""
+    first_char = title[0].lower()
+    if first_char.isalpha():
+        return first_char
+    elif first_char.isnumeric():
+        return 'num'
+    return 'etc'
+
+
+def letter_groups(document):
+    """The {group: {"movies": [...]}} entries of a year document or split item"""
+    return {key: value for key, value in document.items() if isinstance(value, dict) and 'movies' in value}
+
+
+def document_movies(documents):
+    """Every movie in the given documents, duplicates included"""
+    movies = []
+    for document in documents:
+        for group in letter_groups(document).values():
+            movies.extend(group['movies'])
+    return movies
+
+
+def content_hash(document):
+    """Hash of a document's movie data, independent of key order"""
+    body = {key: value for key, value in document.items() if key not in ('id', 'year', 'pk', 'contentHash')}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def item_size(document):
+    return len(json.dumps(document).encode('utf-8'))
+
+
+def uses_synthetic_key(container):
+    """Whether the container is partitioned by the synthetic /pk rather than by /year"""
+    return container.read()['partitionKey']['paths'] == [SYNTHETIC_KEY_PATH]
+
+
+def synthetic_key(document):
+    """/pk value of an item: its year, plus its letter group for split items"""
+    group = document.get('group')
+    return document['year'] if group is None else f"{document['year']}_{group}"
+
+
+def with_synthetic_key(document):
+    document['pk'] = synthetic_key(document)
+    return document
+
+
+def partition_key(document):
+    """Partition key value of a stored item, in either kind of container"""
+    return document.get('pk', document['year'])
+
+
+def year_query(year, synthetic):
+    """query_items arguments reading every item of a year"""
+    query = {"query": "SELECT * FROM c WHERE c.year = @year", "parameters": [{"name": "@year", "value": year}]}
+    if synthetic:
+        query["enable_cross_partition_query"] = True
+    else:
+        query["partition_key"] = year
+    return query
+
+
+def is_year_document(document):
+    return document['id'] == f"year_{document['year']}"
+
+
+def resolve_layouts(documents):
+    """
+    Drop split items of years that still have a year document, so a year
+    that is half-way through a migration is not read twice
+    """
+    documents = list(documents)
+    whole_years = {document['year'] for document in documents if is_year_document(document)}
+    return [
+        document for document in documents
+        if is_year_document(document) or document['year'] not in whole_years
+    ]
+
+
+def group_movies(movies):
+    """Movies by letter group, each group sorted so hashes do not depend on input order"""
+    groups = {}
+    for movie in movies:
+        groups.setdefault(letter_group(movie['title']), []).append(movie)
+    for group in groups.values():
+        group.sort(key=lambda m: (m['title'], m['genre']))
+    return groups
+
+
+def _stamp(document):
+    document["contentHash"] = content_hash(document)
+    return document
+
+
+def build_year_document(year, movies):
+    """Year document with movies grouped by letter, sorted, and stamped with a content hash"""
+    groups = {group: {"movies": group_list} for group, group_list in group_movies(movies).items()}
+    return _stamp({
+        "id": f"year_{year}",
+        "year": year,
+        **groups  # Spread the letter groups directly
+    })
+
+
+def build_letter_item(year, group, movies):
+    """Item holding one letter group of a year"""
+    return _stamp({
+        "id": f"year_{year}_{group}",
+        "year": year,
+        "layout": "letter",
+        "group": group,
+        group: {"movies": movies}
+    })
+
+
+def movie_item_id(year, movie):
+    """Stable id of a movie item (titles can contain characters ids may not)"""
+    digest = hashlib.sha256(f"{movie['title']}\0{movie['genre']}".encode('utf-8')).hexdigest()[:24]
+    return f"movie_{year}_{digest}"
+
+
+def build_movie_item(year, group, movie):
+    """Item holding a single movie, in a one-movie letter group"""
+    return _stamp({
+        "id": movie_item_id(year, movie),
+        "year": year,
+        "layout": "movie",
+        "group": group,
+        group: {"movies": [movie]}
+    })
+
+
+def build_items(year, movies, layout=DEFAULT_LAYOUT, split_bytes=DEFAULT_SPLIT_BYTES, synthetic=False):
+    """
+    The items a year is stored as in the given layout, splitting anything
+    over split_bytes into the next finer layout. With synthetic, the items
+    carry their synthetic partition key.
+    """
+    items = _layout_items(year, movies, layout, split_bytes)
+    return [with_synthetic_key(item) for item in items] if synthetic else items
+
+
+def _layout_items(year, movies, layout, split_bytes):
+    if layout == "year":
+        document = build_year_document(year, movies)
+        if not split_bytes or item_size(document) <= split_bytes:
+            return [document]
+        layout = "letter"
+
+    items = []
+    for group, group_list in sorted(group_movies(movies).items()):
+        if layout == "letter":
+            item = build_letter_item(year, group, group_list)
+            if not split_bytes or item_size(item) <= split_bytes:
+                items.append(item)
+                continue
+        items.extend(build_movie_item(year, group, movie) for movie in group_list)
+    return items
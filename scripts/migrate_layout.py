@@ -0,0 +1,202 @@
+"""
+Document Layout Migration Script for Cosmos DB
+
+Moves the stored movie catalog to another document layout (see
+document_layout.py) without reseeding from CSV: every year is read in
+whatever layout it is stored in, written in the target layout, and only then
+are its old items deleted, so the API can serve the year throughout. Cover
+URLs are carried over, and content hashes are computed the way seed_data.py
+computes them, so the next incremental seed still skips unchanged items.
+
+Years already stored in the target layout are skipped, so an interrupted
+migration can simply be rerun.
+
+A container's partition key cannot change in place, so --target copies the
+catalog into another container instead, created with the synthetic /pk
+partition key if it does not exist yet (see document_layout.py). The source
+container is left untouched, and the target gets its own catalog snapshot.
+Once the copy is done, point the API and the scripts at it with
+COSMOS_CONTAINER_NAME. Rerunning copies the years that changed in the source
+since; nothing should seed the source after the switch.
+
+Requirements:
+- Azure Cosmos DB connection string set as environment variable: COSMOSDB_CONNECTION_STRING
+- Optional: COSMOS_CONTAINER_NAME to migrate from a container other than "movies"
+
+Usage:
+    python migrate_layout.py --layout movie               # Every year to one item per movie
+    python migrate_layout.py --layout letter --years 2019,2020,2021
+    python migrate_layout.py --layout year --dry-run      # Only report what would change
+    python migrate_layout.py --layout movie --target movies_pk  # Copy into a synthetic-key container
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from catalog_snapshot import SNAPSHOT_PARTITION, write_snapshot
+from document_layout import (DEFAULT_SPLIT_BYTES, LAYOUTS, MOVIES_CONTAINER, SYNTHETIC_KEY_PATH, build_items,
+                             document_movies, letter_groups, partition_key, resolve_layouts, uses_synthetic_key,
+                             year_query)
+from seed_data import COVER_FIELDS, DEFAULT_CONCURRENCY, WriteStats, with_throttle_retry
+
+
+def stored_years(container):
+    """Every year with movies in the container"""
+    return sorted(container.query_items(
+        query="SELECT DISTINCT VALUE c.year FROM c WHERE c.year != @snapshot_partition",
+        parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}],
+        enable_cross_partition_query=True
+    ))
+
+
+def migrated_items(year, documents, layout, split_bytes, synthetic=False):
+    """A year's items in the target layout, with the covers of the stored movies"""
+    movies, covers = [], {}
+    for movie in document_movies(resolve_layouts(documents)):
+        # Hash the movie data without covers, as seed_data.py does
+        movies.append({key: value for key, value in movie.items() if key not in COVER_FIELDS})
+        cover = {field: movie[field] for field in COVER_FIELDS if field in movie}
+        if cover:
+            covers[movie['title']] = cover
+
+    items = build_items(year, movies, layout, split_bytes, synthetic)
+    for item in items:
+        for group in letter_groups(item).values():
+            for movie in group['movies']:
+                movie.update(covers.get(movie['title'], {}))
+    return items
+
+
+def target_container(database, name):
+    """The container to copy into, created with the synthetic partition key if it does not exist"""
+    return database.create_container_if_not_exists(id=name, partition_key=PartitionKey(path=SYNTHETIC_KEY_PATH))
+
+
+class LayoutMigration:
+    """
+    Migrates one year at a time: write the new items, then delete the old
+    ones. With a separate target container, the year is read from the source
+    and only the target's items are written and deleted.
+    """
+
+    def __init__(self, container, layout, split_bytes=DEFAULT_SPLIT_BYTES, dry_run=False, target=None):
+        self.container = container
+        self.target = target if target is not None else container
+        self.layout = layout
+        self.split_bytes = split_bytes
+        self.dry_run = dry_run
+        self.synthetic = uses_synthetic_key(container)
+        self.target_synthetic = self.synthetic if self.target is container else uses_synthetic_key(self.target)
+        self.stats = WriteStats()
+
+    def _record(self, headers, _):
+        self.stats.record(headers)
+
+    def migrate_year(self, year):
+        documents = list(self.container.query_items(**year_query(year, self.synthetic)))
+        if self.target is not self.container:
+            documents_in_target = list(self.target.query_items(**year_query(year, self.target_synthetic)))
+        else:
+            documents_in_target = documents
+        stored = {doc['id']: doc.get('contentHash') for doc in documents_in_target}
+        partitions = {doc['id']: partition_key(doc) for doc in documents_in_target}
+        items = []
+        # A year gone from the source since an earlier copy is removed from the target
+        if documents:
+            items = migrated_items(year, documents, self.layout, self.split_bytes, self.target_synthetic)
+        item_ids = {item['id'] for item in items}
+
+        if set(stored) == item_ids and all(stored[item['id']] == item['contentHash'] for item in items):
+            return f"Year {year}: already in the {self.layout} layout"
+        obsolete = [doc_id for doc_id in stored if doc_id not in item_ids]
+        if self.dry_run:
+            return f"Year {year}: would write {len(items)} items and delete {len(obsolete)}"
+
+        for item in items:
+            with_throttle_retry(
+                lambda: self.target.upsert_item(item, response_hook=self._record), self.stats
+            )
+        for doc_id in obsolete:
+            try:
+                with_throttle_retry(
+                    lambda: self.target.delete_item(
+                        doc_id, partition_key=partitions[doc_id], response_hook=self._record
+                    ),
+                    self.stats
+                )
+            except CosmosResourceNotFoundError:
+                pass
+        return f"Year {year}: wrote {len(items)} items, deleted {len(obsolete)}"
+
+
+def migrate(layout, split_bytes=DEFAULT_SPLIT_BYTES, years=None, concurrency=DEFAULT_CONCURRENCY, dry_run=False,
+            target_name=None):
+    """Move the given years (default: all) to the target layout, in place or into target_name"""
+    connection_string = os.getenv("COSMOSDB_CONNECTION_STRING")
+    if not connection_string:
+        print("Error: COSMOSDB_CONNECTION_STRING environment variable is not set")
+        return False
+
+    client = CosmosClient.from_connection_string(connection_string)
+    database = client.get_database_client("moviedb")
+    container = database.get_container_client(MOVIES_CONTAINER)
+    target = None
+    if target_name and target_name != MOVIES_CONTAINER:
+        if not dry_run:
+            target = target_container(database, target_name)
+        else:
+            target = database.get_container_client(target_name)
+            try:
+                target.read()
+            except CosmosResourceNotFoundError:
+                print(f"Would create {target_name} with the synthetic partition key and copy every year into it")
+                return True
+
+    if not years:
+        years = stored_years(container)
+        if target is not None:
+            years = sorted(set(years) | set(stored_years(target)))
+    print(f"Migrating {len(years)} years to the {layout} layout"
+          + (f" in {target_name}" if target is not None else "") + (" (dry run)" if dry_run else ""))
+
+    migration = LayoutMigration(container, layout, split_bytes, dry_run, target)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {year: executor.submit(migration.migrate_year, year) for year in years}
+        for year, future in futures.items():
+            try:
+                print(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"Error migrating year {year}: {str(e)}")
+
+    migration.stats.report()
+    # The catalog snapshot holds the same movies in every layout, so only a new container needs one
+    if target is not None and not dry_run:
+        if failures:
+            print(f"Not writing the catalog snapshot of {target_name} until every year is copied")
+        elif not write_snapshot(target):
+            failures += 1
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the stored movie catalog to another document layout")
+    parser.add_argument('--layout', choices=LAYOUTS, required=True,
+                        help="Target layout: one document per year, one item per letter group, or one per movie")
+    parser.add_argument('--split-bytes', type=int, default=DEFAULT_SPLIT_BYTES,
+                        help="Split year documents (and letter items) larger than this; 0 never splits")
+    parser.add_argument('--years', help="Comma-separated years to migrate (default: all)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Years migrated in parallel")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing")
+    parser.add_argument('--target',
+                        help="Copy into this container, created with the synthetic /pk partition key if missing")
+    args = parser.parse_args()
+
+    years = [int(year) for year in args.years.split(',')] if args.years else None
+    if not migrate(args.layout, args.split_bytes, years, args.concurrency, args.dry_run, args.target):
+        print("Some years failed to migrate; rerun to retry them.")
@@ -0,0 +1,256 @@
+"""
+Summary Precomputation Script for Azure OpenAI
+
+Generates the AI summary of every movie in the catalog ahead of time and
+stores it in the Cosmos DB summaries container the API reads from, so
+/getmoviesummary is a pure read for every seeded title.
+
+Summaries are stored under the same key the API uses (title, year, genre,
+prompt version and deployment), which makes the job idempotent and
+resumable: movies that already have a summary for the current prompt version
+are skipped, so rerunning after a crash or after seeding new movies only
+generates what is missing. Changing the prompt in movie-api/summaries.py
+changes the prompt version, and the next run regenerates every summary.
+
+Requests are spread over a thread pool and held to a tokens-per-minute
+budget. Each call reserves its prompt plus max_tokens up front, and the
+unused part is returned once the response reports its actual usage.
+
+Required Environment Variables:
+- COSMOSDB_CONNECTION_STRING: Cosmos DB connection string
+- OPENAI_API_ENDPOINT, OPENAI_API_KEY, OPENAI_DEPLOYMENT_NAME, OPENAI_API_VERSION
+
+Optional Environment Variables:
+- SUMMARY_TPM: Tokens per minute the job may use (default: 60000)
+- SUMMARY_WORKERS: Number of parallel requests (default: 8)
+- COSMOS_CONTAINER_NAME: Movies container to read the catalog from (default: movies)
+- COSMOS_SUMMARY_CONTAINER_NAME: Container to store summaries in, as for the API (default: summaries)
+
+Example usage:
+    python precompute_summaries.py
+    python precompute_summaries.py --limit 100
+    python precompute_summaries.py --prune  # also delete summaries of older prompt versions
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+from azure.cosmos import CosmosClient
+from requests.adapters import HTTPAdapter
+
+from catalog_snapshot import SNAPSHOT_PARTITION
+from document_layout import MOVIES_CONTAINER, document_movies, resolve_layouts
+
+# Use the API's prompt and cache key so precomputed summaries are the ones it looks up
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+from summaries import PROMPT_VERSION, build_messages, summary_key  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same completion settings as the API's on-demand summaries
+MAX_TOKENS = 150
+TEMPERATURE = 0.7
+MAX_ATTEMPTS = 5
+# Rough prompt size estimate used for the budget reservation
+CHARS_PER_TOKEN = 4
+
+
+class TokenBudget:
+    """Thread-safe tokens-per-minute budget with reserve-then-settle accounting"""
+
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Block until amount tokens are available, then take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return amount
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def settle(self, reserved, used):
+        """Return unused tokens of a reservation, or charge the overrun"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + reserved - used)
+
+
+class SummaryGenerator:
+    """Calls chat/completions with a pooled session under a token budget"""
+
+    def __init__(self, budget, workers):
+        endpoint = os.environ["OPENAI_API_ENDPOINT"].rstrip('/')
+        self.deployment_name = os.environ["OPENAI_DEPLOYMENT_NAME"]
+        self.url = (f"{endpoint}/openai/deployments/{self.deployment_name}/chat/completions"
+                    f"?api-version={os.environ['OPENAI_API_VERSION']}")
+        self.budget = budget
+        self.tokens_used = 0
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers["api-key"] = os.environ["OPENAI_API_KEY"]
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def generate(self, movie):
+        messages = build_messages(movie)
+        estimate = sum(len(m['content']) for m in messages) // CHARS_PER_TOKEN + MAX_TOKENS
+        payload = {"messages": messages, "max_tokens": MAX_TOKENS, "temperature": TEMPERATURE}
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            reserved = self.budget.reserve(estimate)
+            response = self.session.post(self.url, json=payload, timeout=60)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                # Nothing was generated, so give the reservation back before waiting
+                self.budget.settle(reserved, 0)
+                wait = float(response.headers.get('retry-after', 2 ** attempt))
+                logger.warning(f"OpenAI returned {response.status_code} for {movie['title']}, "
+                               f"retrying in {wait:.0f}s")
+                time.sleep(wait)
+                continue
+
+            response.raise_for_status()
+            data = response.json()
+            used = data.get('usage', {}).get('total_tokens', reserved)
+            self.budget.settle(reserved, used)
+            with self.lock:
+                self.tokens_used += used
+            return data['choices'][0]['message']['content'].strip()
+
+        raise RuntimeError(f"Gave up on {movie['title']} after {MAX_ATTEMPTS} attempts")
+
+
+def catalog_movies(movies_container):
+    """Every distinct (title, year, genre) in the year documents or split items"""
+    documents = movies_container.query_items(
+        query="SELECT * FROM c WHERE c.year != @snapshot_partition",
+        parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}],
+        enable_cross_partition_query=True
+    )
+    movies = {}
+    for movie in document_movies(resolve_layouts(documents)):
+        movies.setdefault((movie['title'], movie['year'], movie['genre']), movie)
+    return list(movies.values())
+
+
+def stored_summaries(summaries_container, deployment_name):
+    """{id: promptVersion} of the summaries stored for this deployment"""
+    items = summaries_container.query_items(
+        query="SELECT c.id, c.promptVersion FROM c WHERE c.deployment = @deployment",
+        parameters=[{"name": "@deployment", "value": deployment_name}],
+        enable_cross_partition_query=True
+    )
+    return {item['id']: item.get('promptVersion') for item in items}
+
+
+def store_summary(summaries_container, key, movie, deployment_name, summary):
+    """Upsert a summary in the same shape the API's SummaryStore writes"""
+    summaries_container.upsert_item({
+        "id": key,
+        "title": movie['title'],
+        "year": movie['year'],
+        "genre": movie['genre'],
+        "promptVersion": PROMPT_VERSION,
+        "deployment": deployment_name,
+        "summary": summary,
+        "createdAt": datetime.now(timezone.utc).isoformat()
+    })
+
+
+def prune_stale(summaries_container, stored):
+    """Delete summaries generated with an older prompt version"""
+    removed = 0
+    for key, version in stored.items():
+        if version != PROMPT_VERSION:
+            summaries_container.delete_item(key, partition_key=key)
+            removed += 1
+    logger.info(f"Removed {removed} summaries from older prompt versions")
+
+
+def precompute_summaries(limit=None, prune=False):
+    connection_string = os.getenv("COSMOSDB_CONNECTION_STRING")
+    if not connection_string:
+        logger.error("COSMOSDB_CONNECTION_STRING environment variable is not set")
+        return
+
+    tokens_per_minute = int(os.getenv("SUMMARY_TPM", 60000))
+    workers = int(os.getenv("SUMMARY_WORKERS", 8))
+
+    client = CosmosClient.from_connection_string(connection_string)
+    database = client.get_database_client("moviedb")
+    movies_container = database.get_container_client(MOVIES_CONTAINER)
+    # The container the API reads summaries from, see movie-api/cosmos_provider.py
+    summaries_container = database.get_container_client(os.getenv("COSMOS_SUMMARY_CONTAINER_NAME", "summaries"))
+
+    generator = SummaryGenerator(TokenBudget(tokens_per_minute), workers)
+    stored = stored_summaries(summaries_container, generator.deployment_name)
+
+    # Keys include the prompt version, so anything stored under the current key is up to date
+    pending = []
+    for movie in catalog_movies(movies_container):
+        key = summary_key(movie, generator.deployment_name)
+        if stored.get(key) != PROMPT_VERSION:
+            pending.append((key, movie))
+    if limit is not None:
+        pending = pending[:limit]
+
+    logger.info(f"Prompt version {PROMPT_VERSION}: {len(stored)} summaries stored, "
+                f"{len(pending)} to generate with {workers} workers at {tokens_per_minute} TPM")
+
+    started = time.monotonic()
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(generator.generate, movie): (key, movie) for key, movie in pending}
+        for future in as_completed(futures):
+            key, movie = futures[future]
+            try:
+                store_summary(summaries_container, key, movie, generator.deployment_name, future.result())
+                done += 1
+            except Exception as e:
+                # Left unstored, so the next run picks it up again
+                logger.error(f"Error summarizing {movie['title']} ({movie['year']}): {str(e)}")
+                failed += 1
+
+            if (done + failed) % 100 == 0:
+                logger.info(f"{done + failed}/{len(pending)} movies processed")
+
+    if prune:
+        prune_stale(summaries_container, stored)
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Generated {done} summaries ({failed} failed) in {elapsed:.1f}s, "
+                f"{generator.tokens_used} tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute movie summaries for the whole catalog")
+    parser.add_argument("--limit", type=int, help="Generate at most this many summaries")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete summaries generated with an older prompt version")
+    args = parser.parse_args()
+
+    precompute_summaries(limit=args.limit, prune=args.prune)
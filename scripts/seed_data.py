@@ -2,7 +2,7 @@
 Movie Data Seeding Script for Cosmos DB
 
 Setup:
-1. Place your CSV file in the /scripts/data/ directory
+1. Place your CSV file(s) in the /scripts/data/ directory (plain .csv or gzip'd .csv.gz)
 2. Ensure your CSV has these required columns (case-insensitive):
    - Title  : Movie title (e.g., "The Dark Knight")
    - Genre  : Movie genre (e.g., "Action")
@@ -11,123 +11,137 @@ Setup:
 Requirements:
 - Azure Cosmos DB connection string set as environment variable: COSMOSDB_CONNECTION_STRING
 - CSV file placed in /scripts/data/ directory
+- Optional: COSMOS_CONTAINER_NAME to seed a container other than "movies", e.g. one
+  migrated to the synthetic partition key (see document_layout.py)
+
+Rows are streamed in a single pass into per-year buffers that are written to
+Cosmos DB when they fill up (or, with --sorted, as soon as the year changes),
+so memory stays bounded by --buffer-size rather than by the size of the input.
+A year written over several flushes is merged into what is already stored,
+so the API never sees it truncated, and its stored movies that are missing
+from the input are dropped by its last flush. The catalog snapshot is only
+rebuilt when every write succeeded.
+
+Each year is stored in the --layout chosen (see document_layout.py): one year
+document, one item per letter group, or one item per movie. A year document
+over --split-bytes is split into letter items automatically. Only items
+whose content changed are written, and items left over from a year's
+previous layout are deleted once its last flush has put the new ones in
+place.
+
+Usage:
+    python seed_data.py                        # Incremental: only upsert changed years, delete removed ones
+    python seed_data.py --full-reload          # Delete every document, then upsert everything
+    python seed_data.py --concurrency 16       # Max parallel writes (default: 8)
+    python seed_data.py --input 'imports/*.csv.gz' --sorted --buffer-size 20000
+    python seed_data.py --layout movie         # One item per movie, so cover updates write one movie
 """
 import os
 import csv
-from collections import defaultdict
+import argparse
+import glob
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from azure.cosmos import CosmosClient
-import sys
-from collections import defaultdict
-import string
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+from catalog_snapshot import SNAPSHOT_PARTITION, write_snapshot
+from document_layout import (DEFAULT_LAYOUT, DEFAULT_SPLIT_BYTES, LAYOUTS, MOVIES_CONTAINER, build_items,
+                             document_movies, letter_groups, partition_key, resolve_layouts, uses_synthetic_key,
+                             year_query)
 from pathlib import Path
 
 REQUIRED_COLUMNS = {'Title', 'Genre', 'Year'}
 DATA_DIR = Path(__file__).parent / 'data'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BUFFER_SIZE = 5000
+MAX_THROTTLE_RETRIES = 10
+# Fields upload_covers.py adds to a movie, kept when a year is reseeded
+COVER_FIELDS = ('coverURL', 'coverURLs')
 
-def validate_csv(file_path):
-    """Validate CSV has required columns"""
-    try:
-        with open(file_path, 'r') as f:
-            reader = csv.reader(f)
-            headers = [h.strip() for h in next(reader)]  # Get headers and strip whitespace
-            
-            # Check for required columns (case-insensitive)
-            headers_lower = [h.lower() for h in headers]
-            missing_columns = [col for col in REQUIRED_COLUMNS 
-                             if col.lower() not in headers_lower]
-            
-            if missing_columns:
-                print(f"Error: Missing required columns: {', '.join(missing_columns)}")
-                print(f"Required columns are: {', '.join(REQUIRED_COLUMNS)}")
-                return False, None
-            
-            # Create mapping of actual header names to required names
-            header_mapping = {}
-            for required_col in REQUIRED_COLUMNS:
-                idx = headers_lower.index(required_col.lower())
-                header_mapping[required_col] = headers[idx]
-                
-            return True, header_mapping
-    except FileNotFoundError:
-        print(f"Error: Could not find CSV file at {file_path}")
-        return False, None
-    except Exception as e:
-        print(f"Error reading CSV: {str(e)}")
-        return False, None
+def open_csv(file_path):
+    """Open a plain or gzip'd CSV file for text reading"""
+    if str(file_path).endswith('.gz'):
+        return gzip.open(file_path, 'rt', encoding='utf-8', newline='')
+    return open(file_path, 'r', encoding='utf-8', newline='')
+
+def validate_headers(headers):
+    """Map required columns to their index in the header row, or None if any are missing"""
+    headers = [h.strip() for h in headers]  # Strip whitespace from headers
+    
+    # Check for required columns (case-insensitive)
+    headers_lower = [h.lower() for h in headers]
+    missing_columns = [col for col in REQUIRED_COLUMNS 
+                     if col.lower() not in headers_lower]
+    
+    if missing_columns:
+        print(f"Error: Missing required columns: {', '.join(missing_columns)}")
+        print(f"Required columns are: {', '.join(REQUIRED_COLUMNS)}")
+        return None
+    
+    return {col: headers_lower.index(col.lower()) for col in REQUIRED_COLUMNS}
 
-def find_csv_file():
-    """Find first CSV file in data directory"""
+def find_csv_files(pattern=None):
+    """Find the CSV files to import: a glob pattern, or every .csv/.csv.gz in the data directory"""
     try:
-        DATA_DIR.mkdir(exist_ok=True)  # Create data directory if it doesn't exist
-        csv_files = list(DATA_DIR.glob('*.csv'))
+        if pattern:
+            csv_files = sorted(Path(p) for p in glob.glob(pattern))
+        else:
+            DATA_DIR.mkdir(exist_ok=True)  # Create data directory if it doesn't exist
+            csv_files = sorted(list(DATA_DIR.glob('*.csv')) + list(DATA_DIR.glob('*.csv.gz')))
         
         if not csv_files:
-            print(f"No CSV files found in {DATA_DIR}")
+            print(f"No CSV files found in {pattern or DATA_DIR}")
             print("Please place a CSV file in the data directory with the following columns:")
             print(', '.join(REQUIRED_COLUMNS))
-            return None
-            
-        if len(csv_files) > 1:
-            print(f"Warning: Multiple CSV files found. Using {csv_files[0].name}")
+            return []
             
-        return csv_files[0]
+        print(f"Found {len(csv_files)} CSV file(s): {', '.join(f.name for f in csv_files)}")
+        return csv_files
     except Exception as e:
         print(f"Error accessing data directory: {str(e)}")
-        return None
+        return []
 
-def group_movies_by_year_and_alpha(file_path, header_mapping):
-    """Read CSV and group movies by year and first letter"""
-    # Initialize years dictionary with letter groups for each year
-    years = defaultdict(lambda: defaultdict(lambda: {"movies": []}))
-    
-    print(f"Reading CSV file from: {file_path}")
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            movies = csv.DictReader(f)
-            for movie in movies:
+def stream_movies(csv_files):
+    """Yield validated, normalized movies from every CSV file, one row at a time"""
+    for file_path in csv_files:
+        print(f"Reading CSV file from: {file_path}")
+        read, skipped = 0, 0
+        
+        with open_csv(file_path) as f:
+            reader = csv.reader(f)
+            header_mapping = validate_headers(next(reader, []))
+            if header_mapping is None:
+                print(f"Skipping {file_path}: invalid header row")
+                continue
+            
+            for row in reader:
                 try:
                     # Extract and validate movie data
-                    year = int(movie[header_mapping['Year']])
-                    title = movie[header_mapping['Title']].strip()
-                    genre = movie[header_mapping['Genre']].strip()
+                    year = int(row[header_mapping['Year']])
+                    title = row[header_mapping['Title']].strip()
+                    genre = row[header_mapping['Genre']].strip()
                     
                     if not all([year, title, genre]):  # Skip if any required field is empty
-                        print(f"Skipping movie due to missing data: {movie}")
+                        print(f"Skipping movie due to missing data: {row}")
+                        skipped += 1
                         continue
-                        
-                    # Get the group for the title (first letter, num, or etc)
-                    first_char = title[0].lower()
-                    if first_char.isalpha():
-                        group = first_char
-                    elif first_char.isnumeric():
-                        group = 'num'
-                    else:
-                        group = 'etc'
                     
-                    # Create the movie data
-                    movie_data = {
+                    read += 1
+                    yield {
                         "title": title,
                         "genre": genre.capitalize(),
                         "year": year
                     }
                     
-                    # Add to the appropriate group
-                    years[year][group]["movies"].append(movie_data)
-                    
-                except (ValueError, KeyError) as e:
-                    print(f"Warning: Skipping row due to invalid data: {movie}")
+                except (ValueError, IndexError) as e:
+                    print(f"Warning: Skipping row due to invalid data: {row}")
                     print(f"Error: {str(e)}")
+                    skipped += 1
                     continue
         
-        print(f"Successfully processed CSV. Found {len(years)} unique years")
-        return dict(years)  # Convert defaultdict to regular dict for serialization
-            
-    except Exception as e:
-        print(f"Error processing CSV file: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        return {}
+        print(f"Finished {file_path}: {read} movies read, {skipped} rows skipped")
 
 def clear_database(container):
     """
@@ -136,9 +150,9 @@ def clear_database(container):
     try:
         print("Checking database contents...")
         
-        # Query to check if any documents exist using a simpler query
+        # Only the id and partition key are needed to delete a document
         items = list(container.query_items(
-            query="SELECT * FROM c",
+            query="SELECT c.id, c.year, c.pk FROM c",
             enable_cross_partition_query=True
         ))
         
@@ -155,7 +169,7 @@ def clear_database(container):
                     print(f"Deleting document with id: {item['id']}")
                     container.delete_item(
                         item['id'],
-                        partition_key=item['year']
+                        partition_key=partition_key(item)
                     )
                 except Exception as e:
                     print(f"Error deleting document {item['id']}: {str(e)}")
@@ -174,17 +188,337 @@ def clear_database(container):
         print(f"Traceback: {traceback.format_exc()}")
         return False
 
-def create_cosmos_documents():
+class WriteStats:
+    """Thread-safe counters for documents written and RUs consumed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.request_charge = 0.0
+        self.throttled = 0
+        self.started = time.monotonic()
+
+    def record(self, headers):
+        with self._lock:
+            self.documents += 1
+            self.request_charge += float(headers.get('x-ms-request-charge', 0))
+
+    def record_throttle(self):
+        with self._lock:
+            self.throttled += 1
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        print(f"Wrote {self.documents} documents in {elapsed:.2f}s "
+              f"({self.documents / elapsed:.1f} docs/s, {self.request_charge / elapsed:.1f} RU/s, "
+              f"{self.request_charge:.1f} RU total, {self.throttled} throttled requests)")
+
+
+def with_throttle_retry(operation, stats):
+    """Run a Cosmos DB write, waiting out 429 responses for as long as retry-after asks"""
+    for attempt in range(MAX_THROTTLE_RETRIES):
+        try:
+            return operation()
+        except CosmosHttpResponseError as e:
+            if e.status_code != 429 or attempt == MAX_THROTTLE_RETRIES - 1:
+                raise
+            stats.record_throttle()
+            retry_after_ms = float((e.headers or {}).get('x-ms-retry-after-ms', 1000))
+            time.sleep(retry_after_ms / 1000)
+
+
+def get_stored_hashes(container):
+    """Map of document id to (year, contentHash, partition key) for everything currently stored"""
+    items = container.query_items(
+        query="SELECT c.id, c.year, c.pk, c.contentHash FROM c WHERE c.year != @snapshot_partition",
+        parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}],
+        enable_cross_partition_query=True
+    )
+    return {item['id']: (item['year'], item.get('contentHash'), partition_key(item)) for item in items}
+
+
+def movie_key(movie):
+    """Identity of a movie within its year, as in its movie item id"""
+    return (movie['title'], movie['genre'])
+
+
+class SeedWriter:
+    """
+    Writes buffered years to Cosmos DB on a bounded thread pool.
+
+    A year that arrives in a single flush is laid out as items and each item
+    is compared against its stored content hash and skipped when unchanged.
+    A year split over several flushes (because the buffer filled up) is
+    merged into what is stored on every flush, so readers never see only
+    part of it. Stored movies that no flush of this run contained are only
+    dropped by the year's last flush, and not at all if an earlier flush of
+    the year failed. Items nothing replaces (the year's previous layout, or
+    movies that are gone) are likewise only deleted after the last flush;
+    until then the year's earlier flushes are read back from the items they
+    wrote rather than from whichever layout readers would pick.
+    """
+
+    def __init__(self, container, stored, concurrency=DEFAULT_CONCURRENCY,
+                 layout=DEFAULT_LAYOUT, split_bytes=DEFAULT_SPLIT_BYTES, synthetic=False):
+        self.container = container
+        self.stored = stored
+        self.layout = layout
+        self.split_bytes = split_bytes
+        # Whether the container is partitioned by the synthetic key (see document_layout.py)
+        self.synthetic = synthetic
+        # Ids of the items stored for each year, kept current as items are written and deleted
+        self._year_ids = {}
+        for doc_id, (year, _, _) in stored.items():
+            self._year_ids.setdefault(year, set()).add(doc_id)
+        self.stats = WriteStats()
+        self.failures = 0
+        # Years with a flush that wrote or deleted items, and years with one that found nothing to do
+        self._written_years = set()
+        self._unchanged_years = set()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # Bounds how many flushed buffers can wait in memory for a free worker
+        self._pending = threading.BoundedSemaphore(concurrency * 2)
+        self._lock = threading.Lock()
+        self._year_locks = {}
+        self._covers = {}
+        # Split years: movies flushed so far this run, the futures of those flushes, and which ones failed
+        self._seen = {}
+        self._flushes = {}
+        self._failed_years = set()
+        # Split years: ids of the items the latest flush laid the year out as
+        self._current_ids = {}
+
+    def _year_lock(self, year):
+        with self._lock:
+            return self._year_locks.setdefault(year, threading.Lock())
+
+    def submit(self, year, movies, first, final):
+        """Write one flush of a year; first and final say whether it is the year's first and last"""
+        self._pending.acquire()
+        earlier = self._flushes.pop(year, []) if final else []
+        future = self._executor.submit(self._write, year, movies, first, final, earlier)
+        if not final:
+            self._flushes.setdefault(year, []).append(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._pending.release()
+        try:
+            print(future.result())
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            print(f"Error writing document: {str(e)}")
+
+    def _read_stored(self, year):
+        """
+        Movies stored for a year: those of the items an earlier flush of this
+        run wrote, or else of whichever layout the year is in
+        """
+        items = self.container.query_items(**year_query(year, self.synthetic))
+        current = self._current_ids.get(year)
+        if current is not None:
+            return document_movies(item for item in items if item['id'] in current)
+        return document_movies(resolve_layouts(items))
+
+    def _existing_covers(self, year):
+        """Cover URLs already uploaded for this year, so reseeding does not drop them"""
+        if year not in self._covers:
+            covers = {}
+            if self._year_ids.get(year):
+                for movie in self._read_stored(year):
+                    cover = {field: movie[field] for field in COVER_FIELDS if field in movie}
+                    if cover:
+                        covers[movie['title']] = cover
+            self._covers[year] = covers
+        return self._covers[year]
+
+    def _upsert(self, item):
+        with_throttle_retry(
+            lambda: self.container.upsert_item(
+                item, response_hook=lambda headers, _: self.stats.record(headers)
+            ),
+            self.stats
+        )
+
+    def _merge_stored(self, year, movies, keep=None):
+        """
+        The year's stored movies (only those whose key is in keep, if given)
+        with these movies replacing any stored ones they match
+        """
+        merged = {}
+        if self._year_ids.get(year):
+            for movie in self._read_stored(year):
+                if keep is None or movie_key(movie) in keep:
+                    # Covers are re-applied after hashing, as for movies read from CSV
+                    merged[movie_key(movie)] = {
+                        key: value for key, value in movie.items() if key not in COVER_FIELDS
+                    }
+        merged.update((movie_key(movie), movie) for movie in movies)
+        return list(merged.values())
+
+    def _write(self, year, movies, first, final, earlier):
+        # The pool runs tasks in submission order, so the earlier flushes of the year have already started
+        wait(earlier)
+        try:
+            with self._year_lock(year):
+                return self._write_year(year, movies, first, final)
+        except Exception:
+            with self._lock:
+                self._failed_years.add(year)
+            raise
+
+    def _write_year(self, year, movies, first, final):
+        split = not (first and final)
+        if split:
+            seen = self._seen.setdefault(year, set())
+            seen.update(movie_key(movie) for movie in movies)
+            # The last flush drops movies gone from the input, unless a failed flush may have lost some
+            keep = seen if final and year not in self._failed_years else None
+            movies = self._merge_stored(year, movies, keep)
+
+        items = build_items(year, movies, self.layout, self.split_bytes, self.synthetic)
+        item_ids = {item["id"] for item in items}
+        stored_ids = self._year_ids.setdefault(year, set())
+        # Items of the year's previous layout, or of movies that are gone, that nothing replaces.
+        # Deleted once the year is complete; a failed flush may have left movies only in them.
+        obsolete = set()
+        if final and year not in self._failed_years:
+            obsolete = stored_ids - item_ids
+        items = [
+            item for item in items
+            if self.stored.get(item["id"], (None, None, None))[1] != item["contentHash"]
+        ]
+        if not items and not obsolete:
+            if final:
+                self._finish_year(year)
+            with self._lock:
+                self._unchanged_years.add(year)
+            return f"Unchanged document for year: {year}"
+
+        with self._lock:
+            self._written_years.add(year)
+        covers = self._existing_covers(year)
+        for item in items:
+            for group in letter_groups(item).values():
+                for movie in group['movies']:
+                    if movie['title'] in covers and 'coverURL' not in movie:
+                        movie.update(covers[movie['title']])
+
+        # New items go in before the old ones are deleted, so readers never find the year empty
+        for item in items:
+            self._upsert(item)
+            self.stored[item["id"]] = (year, item["contentHash"], partition_key(item))
+            stored_ids.add(item["id"])
+        if not final:
+            self._current_ids[year] = item_ids
+        for doc_id in obsolete:
+            try:
+                self._delete(doc_id, self.stored[doc_id][2])
+            except CosmosResourceNotFoundError:
+                pass
+            self.stored.pop(doc_id, None)
+            stored_ids.discard(doc_id)
+        if final:
+            self._finish_year(year)
+        return (f"Upserted {len(items)} of {len(item_ids)} items for year: {year}"
+                + (f", deleted {len(obsolete)}" if obsolete else "")
+                + (" (merged)" if split else ""))
+
+    def _finish_year(self, year):
+        self._covers.pop(year, None)
+        self._seen.pop(year, None)
+        self._current_ids.pop(year, None)
+
+    def delete_removed(self, seen_years):
+        """Delete stored years that no longer appear in any input file"""
+        for doc_id, (year, _, partition) in list(self.stored.items()):
+            if year not in seen_years:
+                self._pending.acquire()
+                future = self._executor.submit(self._delete, doc_id, partition)
+                future.add_done_callback(self._done)
+
+    def _delete(self, doc_id, partition):
+        with_throttle_retry(
+            lambda: self.container.delete_item(
+                doc_id, partition_key=partition, response_hook=lambda headers, _: self.stats.record(headers)
+            ),
+            self.stats
+        )
+        return f"Deleted document: {doc_id}"
+
+    def unchanged_years(self):
+        """Years none of whose flushes wrote or failed, counted once however many flushes they took"""
+        with self._lock:
+            return self._unchanged_years - self._written_years - self._failed_years
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        print(f"{len(self.unchanged_years())} years unchanged")
+        self.stats.report()
+        return self.failures == 0
+
+
+class YearBuffers:
+    """Per-year movie buffers that hand full or finished years to a SeedWriter"""
+
+    def __init__(self, writer, buffer_size=DEFAULT_BUFFER_SIZE, sorted_input=False):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.sorted_input = sorted_input
+        self.buffers = {}
+        self.buffered = 0
+        self.seen_years = set()
+        self.flushed_years = set()
+        # Years flushed before they were finished, which still owe their writer a last flush
+        self.open_years = set()
+        self._last_year = None
+
+    def add(self, movie):
+        year = movie['year']
+        
+        # With year-sorted input a year is finished as soon as the next one starts
+        if self.sorted_input and self._last_year is not None and year != self._last_year:
+            self._flush(self._last_year, finished=True)
+        self._last_year = year
+        
+        self.seen_years.add(year)
+        self.buffers.setdefault(year, []).append(movie)
+        self.buffered += 1
+        
+        if self.buffered >= self.buffer_size:
+            # Flush the biggest year; it may get more movies later, so it is not finished
+            largest = max(self.buffers, key=lambda y: len(self.buffers[y]))
+            self._flush(largest, finished=False)
+
+    def _flush(self, year, finished):
+        movies = self.buffers.pop(year, [])
+        # An open year gets its last flush even with nothing left in its buffer
+        if not movies and not (finished and year in self.open_years):
+            return
+        self.buffered -= len(movies)
+        first = year not in self.flushed_years
+        self.flushed_years.add(year)
+        if finished:
+            self.open_years.discard(year)
+        else:
+            self.open_years.add(year)
+        self.writer.submit(year, movies, first, final=finished)
+
+    def finish(self):
+        """Flush every remaining buffer, and finish every open year, once the input is exhausted"""
+        for year in set(self.buffers) | self.open_years:
+            self._flush(year, finished=True)
+
+
+def create_cosmos_documents(full_reload=False, concurrency=DEFAULT_CONCURRENCY,
+                            input_pattern=None, buffer_size=DEFAULT_BUFFER_SIZE, sorted_input=False,
+                            layout=DEFAULT_LAYOUT, split_bytes=DEFAULT_SPLIT_BYTES):
     """Create and seed documents in Cosmos DB"""
     try:
-        # Find CSV file
-        csv_file = find_csv_file()
-        if not csv_file:
-            return
-            
-        # Validate CSV structure
-        is_valid, header_mapping = validate_csv(csv_file)
-        if not is_valid:
+        # Find CSV files
+        csv_files = find_csv_files(input_pattern)
+        if not csv_files:
             return
         
         # Get and verify connection string
@@ -199,33 +533,37 @@ def create_cosmos_documents():
         # Initialize Cosmos client
         client = CosmosClient.from_connection_string(connection_string)
         database = client.get_database_client("moviedb")
-        container = database.get_container_client("movies")
+        container = database.get_container_client(MOVIES_CONTAINER)
+        synthetic = uses_synthetic_key(container)
         
-        print("Successfully connected to Cosmos DB")
+        print(f"Successfully connected to Cosmos DB ({MOVIES_CONTAINER}"
+              + (", synthetic partition key)" if synthetic else ")"))
         
-        # Clear existing data
-        if not clear_database(container):
+        # A full reload clears everything first; otherwise only changed years are written
+        if full_reload and not clear_database(container):
             print("Failed to clear database. Aborting seeding process.")
             return
         
-        # Group movies
-        print("Reading and grouping movies from CSV...")
-        years_data = group_movies_by_year_and_alpha(csv_file, header_mapping)
-        
-        # Create and upload documents
+        # Stream movies from CSV into per-year buffers and write them as they fill up
         print("\nBeginning document upload...")
-        for year, data in years_data.items():
-            document = {
-                "id": f"year_{year}",
-                "year": year,
-                **data  # Spread the letter groups directly
-            }
-            
-            try:
-                container.upsert_item(document)
-                print(f"Added document for year: {year}")
-            except Exception as e:
-                print(f"Error adding document for year {year}: {str(e)}")
+        writer = SeedWriter(container, get_stored_hashes(container), concurrency, layout, split_bytes, synthetic)
+        buffers = YearBuffers(writer, buffer_size, sorted_input)
+        for movie in stream_movies(csv_files):
+            buffers.add(movie)
+        buffers.finish()
+        
+        print(f"Found {len(buffers.seen_years)} unique years")
+        writer.delete_removed(buffers.seen_years)
+        
+        success = writer.close()
+        
+        if not success:
+            # The stored years may be incomplete; keep serving the previous snapshot until a rerun succeeds
+            print("Some documents failed to upload. Not rebuilding the catalog snapshot.")
+            return
+        
+        # Rebuild the read model the API serves /getmovies from
+        write_snapshot(container)
                 
         print("\nSeeding completed successfully!")
         
@@ -237,4 +575,28 @@ def create_cosmos_documents():
         print("Please ensure COSMOSDB_CONNECTION_STRING environment variable is set correctly")
 
 if __name__ == "__main__":
-    create_cosmos_documents()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed the movie catalog in Cosmos DB from CSV")
+    parser.add_argument('--full-reload', action='store_true',
+                        help="Delete all documents before seeding instead of syncing changes")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Max parallel Cosmos DB writes")
+    parser.add_argument('--input', dest='input_pattern',
+                        help="Glob of CSV files to import (default: every .csv/.csv.gz in scripts/data)")
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help="Max movies buffered in memory before a year is written")
+    parser.add_argument('--sorted', dest='sorted_input', action='store_true',
+                        help="Input is sorted by year, so each year is written as soon as it ends")
+    parser.add_argument('--layout', choices=LAYOUTS, default=DEFAULT_LAYOUT,
+                        help="Store each year as one document, one item per letter group, or one item per movie")
+    parser.add_argument('--split-bytes', type=int, default=DEFAULT_SPLIT_BYTES,
+                        help="Split year documents (and letter items) larger than this; 0 never splits")
+    args = parser.parse_args()
+    create_cosmos_documents(
+        full_reload=args.full_reload,
+        concurrency=args.concurrency,
+        input_pattern=args.input_pattern,
+        buffer_size=args.buffer_size,
+        sorted_input=args.sorted_input,
+        layout=args.layout,
+        split_bytes=args.split_bytes
+    )
\ No newline at end of file
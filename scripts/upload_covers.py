@@ -4,11 +4,35 @@ Movie Cover Upload Script using OMDB API
 This script fetches movie poster images from OMDB API and uploads them to Azure Blob Storage,
 then updates the movie records in Cosmos DB with the poster URLs.
 
+Posters are stored under their SHA-256 content hash (posters/<hash>.jpg) with
+long-lived immutable Cache-Control, and identical posters are only uploaded
+once. When Pillow is installed, "thumb" (150px) and "medium" (400px) WebP
+renditions are stored next to the original and written to each movie as
+coverURLs alongside coverURL.
+
+Covers are patched into whichever item holds the movie (see
+document_layout.py), so with the movie layout each cover update writes one
+small movie item rather than the whole year document.
+
 Required Environment Variables:
 - STORAGE_CONNECTION_STRING: Azure Blob Storage connection string
 - COSMOSDB_CONNECTION_STRING: Cosmos DB connection string
 - OMDB_API_KEY: Your API key from http://www.omdbapi.com/apikey.aspx
 
+Optional Environment Variables:
+- OMDB_RATE_LIMIT: Max OMDB lookups per second (default: 5)
+- COVER_WORKERS: Number of parallel lookup/download/upload workers (default: 8)
+- COVER_BATCH_SIZE: Cover fields written to Cosmos DB per patch request (default: 10, the patch limit)
+- COVER_CHECKPOINT_FILE: Journal of finished movies (default: scripts/cover_checkpoint.jsonl)
+- COSMOS_CONTAINER_NAME: Movies container to update (default: movies)
+
+The checkpoint journal records every (title, year) whose lookup finished,
+with the uploaded blob URLs (or null when OMDB has no poster). Rerunning after
+a crash skips those movies without calling OMDB or Blob Storage again and
+only writes any missing cover URLs to Cosmos DB. Movies whose lookup,
+download or upload failed are not journaled, so a rerun retries them. Delete
+the journal to force a full retry.
+
 Example usage:
     export OMDB_API_KEY="your_key_here"
     export STORAGE_CONNECTION_STRING="your_storage_connection"
@@ -17,22 +41,188 @@ Example usage:
 """
 
 import os
+import io
+import hashlib
+import json
+import mimetypes
+import tempfile
 import time
 import logging
+import threading
+from pathlib import Path
 import requests
-from azure.storage.blob import BlobServiceClient
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.core import MatchConditions
 from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+from catalog_snapshot import SNAPSHOT_PARTITION, write_snapshot
+from document_layout import MOVIES_CONTAINER, partition_key, resolve_layouts
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+try:
+    from PIL import Image
+except ImportError:  # Renditions are optional; originals are still uploaded
+    Image = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Posters are streamed to blob storage in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Cosmos DB accepts at most 10 operations per patch request
+MAX_PATCH_OPERATIONS = 10
+MAX_CONFLICT_RETRIES = 3
+DEFAULT_CHECKPOINT_FILE = Path(__file__).parent / 'cover_checkpoint.jsonl'
+# Blob names are content hashes, so the bytes behind a URL never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Rendition name -> max width in pixels
+RENDITION_WIDTHS = {"thumb": 150, "medium": 400}
+RENDITION_FORMAT = "WEBP"
+RENDITION_EXTENSION = "webp"
+RENDITION_CONTENT_TYPE = "image/webp"
+# OMDB's answer for titles it does not know, as opposed to errors worth retrying
+OMDB_NOT_FOUND = "Movie not found!"
+
+class CoverFetchError(Exception):
+    """A poster lookup, download or upload failed in a way a rerun may not repeat"""
+
+class CheckpointJournal:
+    """Append-only JSONL record of movies whose cover lookup already finished"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partial last line from a crash
+                    cover = entry.get('cover')
+                    if cover is None and entry.get('coverURL'):
+                        cover = {"coverURL": entry['coverURL']}  # Journal from before renditions
+                    self.entries[(entry['title'], entry['year'])] = cover
+            logger.info(f"Loaded {len(self.entries)} checkpointed movies from {self.path}")
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, title, year, cover):
+        self.entries[(title, year)] = cover
+        self._file.write(json.dumps({"title": title, "year": year, "cover": cover}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class DocumentCoverWriter:
+    """
+    Buffers cover URLs for one year document (or split item) and writes them
+    with partial document patches, guarded by the document's ETag so a
+    concurrent reseed is never overwritten.
+    """
+
+    def __init__(self, container, doc, batch_size=MAX_PATCH_OPERATIONS):
+        self.container = container
+        self.doc = doc
+        self.batch_size = min(batch_size, MAX_PATCH_OPERATIONS)
+        self.pending = []
+        self.written = 0
+
+    def add(self, title, cover):
+        """Queue the cover fields (coverURL, coverURLs) for a movie"""
+        pending_operations = sum(len(fields) for _, fields in self.pending)
+        if self.pending and pending_operations + len(cover) > self.batch_size:
+            self.flush()
+        self.pending.append((title, cover))
+
+    def _operations(self):
+        """Patch operations for pending covers, located by title in the current document"""
+        paths = {}
+        for key, value in self.doc.items():
+            if isinstance(value, dict) and 'movies' in value:
+                for index, movie in enumerate(value['movies']):
+                    paths[movie['title']] = f"/{key}/movies/{index}"
+        return [
+            {"op": "set", "path": f"{paths[title]}/{field}", "value": value}
+            for title, cover in self.pending if title in paths
+            for field, value in cover.items()
+        ]
+
+    def flush(self):
+        if not self.pending:
+            return
+        for attempt in range(MAX_CONFLICT_RETRIES):
+            operations = self._operations()
+            if not operations:
+                break
+            try:
+                self.doc = self.container.patch_item(
+                    item=self.doc['id'],
+                    partition_key=partition_key(self.doc),
+                    patch_operations=operations,
+                    etag=self.doc['_etag'],
+                    match_condition=MatchConditions.IfNotModified
+                )
+                self.written += len(operations)
+                logger.info(f"Wrote {len(operations)} cover fields to {self.doc['id']}")
+                break
+            except CosmosAccessConditionFailedError:
+                # Document changed underneath us (e.g. reseeded): re-read and relocate titles
+                logger.warning(f"{self.doc['id']} changed concurrently, retrying covers")
+                try:
+                    self.doc = self.container.read_item(item=self.doc['id'], partition_key=partition_key(self.doc))
+                except CosmosResourceNotFoundError:
+                    self._drop_deleted()
+                    break
+            except CosmosResourceNotFoundError:
+                self._drop_deleted()
+                break
+        else:
+            logger.error(f"Gave up writing {len(self.pending)} covers to {self.doc['id']}")
+        self.pending = []
+
+    def _drop_deleted(self):
+        # Deleted by a reseed or layout migration; its covers are journaled, so a rerun writes them to the new items
+        logger.warning(f"{self.doc['id']} was deleted, dropping {len(self.pending)} pending covers")
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 class MoviePosterUploader:
-    def __init__(self, omdb_key, storage_conn_str):
+    def __init__(self, omdb_key, storage_conn_str, rate_limit=5, workers=8):
         self.api_key = omdb_key
         self.base_url = "http://www.omdbapi.com/"
+        self.rate_limiter = TokenBucket(rate_limit)
         
         # Set up blob storage
         self.blob_service = BlobServiceClient.from_connection_string(storage_conn_str)
@@ -45,54 +235,135 @@ class MoviePosterUploader:
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504]
         )
-        self.session.mount('http://', HTTPAdapter(max_retries=retries))
-        self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        # One pooled connection per worker so parallel downloads don't queue on the pool
+        adapter = HTTPAdapter(max_retries=retries, pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def get_movie_poster(self, title, year=None):
-        """Get movie poster URL from OMDB API"""
-        try:
-            params = {
-                "apikey": self.api_key,
-                "t": title
-            }
-            if year:
-                params["y"] = str(year)
+        """
+        Get movie poster URL from OMDB API, or None when OMDB has no poster.
+        Raises CoverFetchError when the lookup itself failed.
+        """
+        params = {
+            "apikey": self.api_key,
+            "t": title
+        }
+        if year:
+            params["y"] = str(year)
 
+        try:
+            # Stay within the OMDB quota across all workers
+            self.rate_limiter.acquire()
             response = self.session.get(self.base_url, params=params)
             response.raise_for_status()
             data = response.json()
+        except Exception as e:
+            raise CoverFetchError(f"OMDB lookup failed: {str(e)}") from e
 
-            if data.get("Response") == "True" and data.get("Poster") != "N/A":
+        if data.get("Response") == "True":
+            if data.get("Poster") not in (None, "", "N/A"):
                 return data["Poster"]
-            else:
-                logger.warning(f"No poster found for {title} ({year})")
-                return None
+        elif data.get("Error") != OMDB_NOT_FOUND:
+            # e.g. "Request limit reached!"
+            raise CoverFetchError(f"OMDB lookup failed: {data.get('Error')}")
 
-        except Exception as e:
-            logger.error(f"Error getting poster for {title}: {str(e)}")
-            return None
+        logger.warning(f"No poster found for {title} ({year})")
+        return None
+
+    def _upload_if_missing(self, blob_name, data, content_type):
+        """Upload immutable content unless a blob with that (content-addressed) name exists"""
+        blob_client = self.container.get_blob_client(blob_name)
+        if blob_client.exists():
+            return blob_client.url, False
+
+        blob_client.upload_blob(
+            data,
+            overwrite=True,
+            content_settings=ContentSettings(content_type=content_type, cache_control=IMMUTABLE_CACHE_CONTROL)
+        )
+        return blob_client.url, True
+
+    def _upload_renditions(self, digest, spool):
+        """Resize the poster into each rendition and upload the ones not stored yet"""
+        urls = {}
+        rendition_names = {name: f"posters/{digest}-{name}.{RENDITION_EXTENSION}" for name in RENDITION_WIDTHS}
+        missing = {name: blob for name, blob in rendition_names.items()
+                   if not self.container.get_blob_client(blob).exists()}
+
+        for name, blob_name in rendition_names.items():
+            urls[name] = self.container.get_blob_client(blob_name).url
+
+        if not missing:
+            return urls
+        if Image is None:
+            logger.warning("Pillow is not installed; skipping poster renditions")
+            return {}
+
+        spool.seek(0)
+        with Image.open(spool) as image:
+            image = image.convert("RGB")
+            for name, blob_name in missing.items():
+                rendition = image.copy()
+                width = RENDITION_WIDTHS[name]
+                rendition.thumbnail((width, width * 2))
+                buffer = io.BytesIO()
+                rendition.save(buffer, format=RENDITION_FORMAT, quality=80)
+                buffer.seek(0)
+                self._upload_if_missing(blob_name, buffer, RENDITION_CONTENT_TYPE)
+        return urls
 
     def upload_poster_to_blob(self, poster_url, title, year):
-        """Download poster and upload to blob storage"""
+        """
+        Store a poster under its content hash, plus resized renditions.
+        Returns the fields to write on the movie: coverURL and coverURLs, or
+        None when the poster URL no longer exists. Raises CoverFetchError
+        when the download or upload failed.
+        """
         try:
-            # Download poster
-            response = self.session.get(poster_url)
-            if response.status_code != 200:
-                return None
+            # Stream the download into a spooled file (spills to disk past 1 MB) while hashing it
+            sha256 = hashlib.sha256()
+            with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+                with self.session.get(poster_url, stream=True) as response:
+                    if response.status_code in (404, 410):
+                        logger.warning(f"Poster for {title} ({year}) is gone: {poster_url}")
+                        return None
+                    response.raise_for_status()
+                    content_type = response.headers.get('Content-Type', 'image/jpeg')
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        sha256.update(chunk)
+                        spool.write(chunk)
 
-            # Create safe blob name
-            safe_title = "".join(x for x in title if x.isalnum() or x in (' ', '-', '_'))
-            blob_name = f"{safe_title}-{year}.jpg"
+                # Identical posters share one blob, so reruns and duplicates skip the upload
+                digest = sha256.hexdigest()
+                extension = mimetypes.guess_extension(content_type) or '.jpg'
+                spool.seek(0)
+                original_url, uploaded = self._upload_if_missing(
+                    f"posters/{digest}{extension}", spool, content_type
+                )
+                if not uploaded:
+                    logger.info(f"Poster for {title} ({year}) already stored")
 
-            # Upload to blob storage
-            blob_client = self.container.get_blob_client(blob_name)
-            blob_client.upload_blob(response.content, overwrite=True)
+                renditions = self._upload_renditions(digest, spool)
 
-            return blob_client.url
+            fields = {"coverURL": original_url}
+            if renditions:
+                fields["coverURLs"] = renditions
+            return fields
 
         except Exception as e:
-            logger.error(f"Error uploading poster for {title}: {str(e)}")
+            raise CoverFetchError(f"Uploading poster failed: {str(e)}") from e
+
+    def process_movie(self, movie):
+        """
+        Look up, download and upload the poster for one movie, returning its
+        cover fields (None if it has no poster)
+        """
+        logger.info(f"Processing {movie['title']} ({movie['year']})")
+        poster_url = self.get_movie_poster(movie['title'], movie['year'])
+        if not poster_url:
             return None
+        return self.upload_poster_to_blob(poster_url, movie['title'], movie['year'])
 
 def main():
 
@@ -106,49 +377,81 @@ def main():
             logger.error("Missing one or more required environment variables.")
             return
 
-        uploader = MoviePosterUploader(omdb_api_key, storage_conn_str)
+        rate_limit = float(os.getenv('OMDB_RATE_LIMIT', 5))
+        workers = int(os.getenv('COVER_WORKERS', 8))
+        batch_size = int(os.getenv('COVER_BATCH_SIZE', MAX_PATCH_OPERATIONS))
+        journal = CheckpointJournal(os.getenv('COVER_CHECKPOINT_FILE', DEFAULT_CHECKPOINT_FILE))
+
+        uploader = MoviePosterUploader(omdb_api_key, storage_conn_str, rate_limit, workers)
         cosmos_client = CosmosClient.from_connection_string(cosmos_conn_str)
         database = cosmos_client.get_database_client("moviedb")
-        container = database.get_container_client("movies")
+        container = database.get_container_client(MOVIES_CONTAINER)
 
-        # Get all documents
-        documents = list(container.query_items(
-            query="SELECT * FROM c",
+        # Get all documents; a year half-way through a layout migration is read from its year document
+        documents = resolve_layouts(container.query_items(
+            query="SELECT * FROM c WHERE c.year != @snapshot_partition",
+            parameters=[{"name": "@snapshot_partition", "value": SNAPSHOT_PARTITION}],
             enable_cross_partition_query=True
         ))
 
-        # Process each document
-        for doc in documents:
-            modified = False
-            
-            # Process each letter group
-            for key, value in doc.items():
-                if isinstance(value, dict) and 'movies' in value:
-                    # Process each movie
-                    for movie in value['movies']:
-                        if 'coverURL' not in movie:  # Skip if already has cover
-                            logger.info(f"Processing {movie['title']} ({movie['year']})")
-                            
-                            # Add delay to avoid rate limiting
-                            time.sleep(.3)
-                            
-                            # Get and upload poster
-                            poster_url = uploader.get_movie_poster(movie['title'], movie['year'])
-                            if poster_url:
-                                cover_url = uploader.upload_poster_to_blob(
-                                    poster_url, 
-                                    movie['title'], 
-                                    movie['year']
-                                )
-                                if cover_url:
-                                    movie['coverURL'] = cover_url
-                                    modified = True
-                                    logger.info(f"Added cover for {movie['title']}")
-            
-            # Update document if modified
-            if modified:
-                container.replace_item(item=doc['id'], body=doc)
+        # Queue every movie without a cover, remembering which document it belongs to
+        writers = {doc['id']: DocumentCoverWriter(container, doc, batch_size) for doc in documents}
+        pending = defaultdict(int)
+        started = time.monotonic()
+        resumed = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for doc in documents:
+                for key, value in doc.items():
+                    if isinstance(value, dict) and 'movies' in value:
+                        for movie in value['movies']:
+                            if 'coverURL' in movie:  # Skip if already has cover
+                                continue
+                            checkpoint = (movie['title'], movie['year'])
+                            if checkpoint in journal:
+                                # Finished in an earlier run; only the Cosmos DB write may be missing
+                                if journal.get(checkpoint):
+                                    writers[doc['id']].add(movie['title'], journal.get(checkpoint))
+                                    resumed += 1
+                                continue
+                            futures[executor.submit(uploader.process_movie, movie)] = (doc, movie)
+                            pending[doc['id']] += 1
+
+            logger.info(f"Fetching covers for {len(futures)} movies with {workers} workers "
+                        f"({resumed} restored from checkpoint)")
+
+            for future in as_completed(futures):
+                doc, movie = futures[future]
+                try:
+                    cover = future.result()
+                except Exception as e:
+                    # Not journaled, so the next run retries it
+                    failed += 1
+                    logger.error(f"Error fetching cover for {movie['title']} ({movie['year']}): {str(e)}")
+                else:
+                    journal.record(movie['title'], movie['year'], cover)
+                    if cover:
+                        writers[doc['id']].add(movie['title'], cover)
+                        logger.info(f"Added cover for {movie['title']}")
+
+                # Write whatever is left for the document once all of its movies are done
+                pending[doc['id']] -= 1
+                if pending[doc['id']] == 0:
+                    writers[doc['id']].flush()
+
+        # Documents that only had checkpointed covers to write
+        for writer in writers.values():
+            writer.flush()
+        journal.close()
+
+        # Covers changed, so rebuild the catalog read model the API serves
+        if any(writer.written for writer in writers.values()):
+            write_snapshot(container)
 
+        logger.info(f"Processed {len(futures)} movies in {time.monotonic() - started:.1f}s")
+        if failed:
+            logger.warning(f"{failed} movies failed and will be retried on the next run")
         logger.info("Movie cover upload process completed")
 
     except Exception as e:
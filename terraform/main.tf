@@ -85,6 +85,37 @@ resource "azurerm_cosmosdb_sql_container" "movies" {
   }
 }
 
+# Cosmos DB Container partitioned by the synthetic key (year, or year and letter group
+# for split items), filled by scripts/migrate_layout.py --target movies_pk
+resource "azurerm_cosmosdb_sql_container" "movies_pk" {
+  name                = "movies_pk"
+  resource_group_name = azurerm_resource_group.main.name
+  account_name        = azurerm_cosmosdb_account.main.name
+  database_name       = azurerm_cosmosdb_sql_database.main.name
+  partition_key_paths = ["/pk"]
+
+  indexing_policy {
+    indexing_mode = "consistent"
+
+    included_path {
+      path = "/*"
+    }
+
+    included_path {
+      path = "/year/?"
+    }
+  }
+}
+
+# Cosmos DB Container for cached AI summaries
+resource "azurerm_cosmosdb_sql_container" "summaries" {
+  name                = "summaries"
+  resource_group_name = azurerm_resource_group.main.name
+  account_name        = azurerm_cosmosdb_account.main.name
+  database_name       = azurerm_cosmosdb_sql_database.main.name
+  partition_key_paths = ["/id"]
+}
+
 # App Service Plan for Functions
 resource "azurerm_service_plan" "main" {
   name                = "${var.project_name}-${var.environment}-asp"
@@ -130,6 +161,33 @@ module "openai" {
   ]
 }
 
+# Application Insights for the function app's logs and request telemetry
+resource "azurerm_log_analytics_workspace" "main" {
+  name                = "${var.project_name}-${var.environment}-logs"
+  location            = azurerm_resource_group.main.location
+  resource_group_name = azurerm_resource_group.main.name
+  sku                 = "PerGB2018"
+  retention_in_days   = 30
+
+  tags = {
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+resource "azurerm_application_insights" "main" {
+  name                = "${var.project_name}-${var.environment}-appi"
+  location            = azurerm_resource_group.main.location
+  resource_group_name = azurerm_resource_group.main.name
+  workspace_id        = azurerm_log_analytics_workspace.main.id
+  application_type    = "other"
+
+  tags = {
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
 # Function App
 resource "azurerm_linux_function_app" "main" {
   name                       = "${var.project_name}-${var.environment}-func"
@@ -143,17 +201,22 @@ resource "azurerm_linux_function_app" "main" {
     application_stack {
       python_version = "3.11"
     }
+    # Sets APPLICATIONINSIGHTS_CONNECTION_STRING, which telemetry.py also exports to
+    application_insights_connection_string = azurerm_application_insights.main.connection_string
   }
 
   app_settings = {
     FUNCTIONS_WORKER_RUNTIME       = "python"
     COSMOSDB_CONNECTION_STRING     = azurerm_cosmosdb_account.main.primary_sql_connection_string
+    COSMOS_CONTAINER_NAME          = var.movies_container
     STORAGE_CONNECTION_STRING      = azurerm_storage_account.main.primary_connection_string
     OPENAI_API_ENDPOINT           = module.openai.openai_endpoint
     OPENAI_API_KEY                = module.openai.openai_primary_key
     OPENAI_DEPLOYMENT_NAME        = "gpt-35-turbo-16k"  # This matches the name in our module deployment
     OPENAI_API_VERSION           = "2024-08-01-preview"
     EnableWorkerIndexing          = "true"
+    PYTHON_ENABLE_INIT_INDEXING   = "1"  # Required by HTTP streams (azurefunctions-extensions-http-fastapi)
+    WARMUP_ON_START               = "true"
     SCM_DO_BUILD_DURING_DEPLOYMENT = "true"
   }
 
@@ -284,6 +347,58 @@ resource "azurerm_api_management_api_operation" "get_movies_by_year" {
   }
 }
 
+resource "azurerm_api_management_api_operation" "get_movies_by_years" {
+  operation_id        = "get-movies-by-years"
+  api_name           = azurerm_api_management_api.movies.name
+  api_management_name = azurerm_api_management.main.name
+  resource_group_name = azurerm_resource_group.main.name
+  display_name       = "Get Movies By Years"
+  method             = "GET"
+  url_template       = "/getmoviesbyyears"
+  description        = "Get movies from a range or list of years, sorted by title"
+
+  request {
+    query_parameter {
+      name          = "from"
+      type          = "integer"
+      required      = false
+      description   = "First year of the range"
+    }
+    query_parameter {
+      name          = "to"
+      type          = "integer"
+      required      = false
+      description   = "Last year of the range"
+    }
+    query_parameter {
+      name          = "years"
+      type          = "string"
+      required      = false
+      description   = "Comma-separated years, instead of from and to"
+    }
+  }
+}
+
+resource "azurerm_api_management_api_operation" "search_movies" {
+  operation_id        = "search-movies"
+  api_name           = azurerm_api_management_api.movies.name
+  api_management_name = azurerm_api_management.main.name
+  resource_group_name = azurerm_resource_group.main.name
+  display_name       = "Search Movies"
+  method             = "GET"
+  url_template       = "/searchmovies"
+  description        = "Search movies by title, tolerating typos"
+
+  request {
+    query_parameter {
+      name          = "q"
+      type          = "string"
+      required      = true
+      description   = "Search text"
+    }
+  }
+}
+
 resource "azurerm_api_management_api_operation" "get_movie_summary" {
   operation_id        = "get-movie-summary"
   api_name           = azurerm_api_management_api.movies.name
@@ -302,4 +417,26 @@ resource "azurerm_api_management_api_operation" "get_movie_summary" {
       description   = "Movie title"
     }
   }
-}
\ No newline at end of file
+}
+
+resource "azurerm_api_management_api_operation" "get_movie_summaries" {
+  operation_id        = "get-movie-summaries"
+  api_name           = azurerm_api_management_api.movies.name
+  api_management_name = azurerm_api_management.main.name
+  resource_group_name = azurerm_resource_group.main.name
+  display_name       = "Get Movie Summaries"
+  method             = "POST"
+  url_template       = "/getmoviesummaries"
+  description        = "Get AI-generated summaries for a list of movies"
+}
+
+resource "azurerm_api_management_api_operation" "get_cache_stats" {
+  operation_id        = "get-cache-stats"
+  api_name           = azurerm_api_management_api.movies.name
+  api_management_name = azurerm_api_management.main.name
+  resource_group_name = azurerm_resource_group.main.name
+  display_name       = "Get Cache Stats"
+  method             = "GET"
+  url_template       = "/getcachestats"
+  description        = "Get summary cache hit/miss counters"
+}
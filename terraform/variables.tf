@@ -14,4 +14,15 @@ variable "environment" {
   description = "Environment (dev, staging, prod)"
   type        = string
   default     = "dev"
+}
+
+variable "movies_container" {
+  description = "Movies container the API reads: movies (partitioned by /year) or movies_pk (synthetic /pk key)"
+  type        = string
+  default     = "movies"
+
+  validation {
+    condition     = contains(["movies", "movies_pk"], var.movies_container)
+    error_message = "movies_container must be movies or movies_pk."
+  }
 }
\ No newline at end of file
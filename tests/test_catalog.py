@@ -0,0 +1,129 @@
+"""
+Unit tests for reading a year's documents in either document layout.
+
+Run with: python -m pytest tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError  # noqa: E402
+
+from catalog import SNAPSHOT_PARTITION, YearLayouts, read_year_documents  # noqa: E402
+
+
+class Container:
+    """Records the calls made; only the partition key narrows a query"""
+
+    def __init__(self, documents, key="year"):
+        self.documents = documents
+        self.key = key
+        self.calls = []
+
+    async def read_item(self, item, partition_key):
+        self.calls.append("read")
+        for doc in self.documents:
+            if doc['id'] == item and doc[self.key] == partition_key:
+                return doc
+        raise CosmosResourceNotFoundError(message="Not found")
+
+    def query_items(self, query, parameters, partition_key=None):
+        self.calls.append("query" if partition_key is not None else "cross-partition query")
+        year = parameters[0]['value']
+
+        async def items():
+            for doc in self.documents:
+                if doc['year'] == year and (partition_key is None or doc[self.key] == partition_key):
+                    yield doc
+        return items()
+
+
+class Provider:
+    def __init__(self, container):
+        self.container = container
+
+    async def partition_key_path(self):
+        return "/" + self.container.key
+
+    async def run(self, operation):
+        return await operation(self.container)
+
+
+def movie(title, year):
+    return {"title": title, "genre": "Drama", "year": year}
+
+
+def read(container, year, layouts):
+    return asyncio.run(read_year_documents(Provider(container), year, layouts))
+
+
+def test_year_document_is_point_read():
+    container = Container([{"id": "year_1999", "year": 1999, "m": {"movies": [movie("Magnolia", 1999)]}}])
+    layouts = YearLayouts()
+
+    assert [doc['id'] for doc in read(container, 1999, layouts)] == ["year_1999"]
+    assert container.calls == ["read"]
+
+
+def test_split_year_is_queried_directly_after_the_first_read():
+    container = Container([
+        {"id": "year_2001_a", "year": 2001, "layout": "letter", "a": {"movies": [movie("Amelie", 2001)]}},
+        {"id": "year_2001_m", "year": 2001, "layout": "letter", "m": {"movies": [movie("Memento", 2001)]}}
+    ])
+    layouts = YearLayouts()
+
+    assert len(read(container, 2001, layouts)) == 2
+    assert container.calls == ["read", "query"]
+    container.calls.clear()
+    assert len(read(container, 2001, layouts)) == 2
+    assert container.calls == ["query"]
+
+
+def test_year_merged_back_into_one_document_is_point_read_again():
+    container = Container([{"id": "year_2001_a", "year": 2001, "layout": "letter", "a": {"movies": []}}])
+    layouts = YearLayouts()
+    read(container, 2001, layouts)
+
+    container.documents.append({"id": "year_2001", "year": 2001, "a": {"movies": []}})
+    assert [doc['id'] for doc in read(container, 2001, layouts)] == ["year_2001"]
+    container.calls.clear()
+    read(container, 2001, layouts)
+    assert container.calls == ["read"]
+
+
+def test_empty_year_needs_only_the_point_read_until_max_age():
+    container = Container([])
+    layouts = YearLayouts(max_age=60)
+
+    assert read(container, 1890, layouts) == []
+    container.calls.clear()
+    assert read(container, 1890, layouts) == []
+    assert container.calls == ["read"]
+
+    layouts.max_age = 0
+    container.calls.clear()
+    read(container, 1890, layouts)
+    assert container.calls == ["read", "query"]
+
+
+def test_snapshot_partition_is_never_read_as_a_year():
+    container = Container([{"id": "catalog_snapshot", "year": SNAPSHOT_PARTITION, "chunks": []}])
+    assert read(container, SNAPSHOT_PARTITION, YearLayouts()) == []
+    assert container.calls == []
+
+
+def test_split_year_under_the_synthetic_key_is_read_across_its_partitions():
+    container = Container([
+        {"id": "year_2001_a", "year": 2001, "pk": "2001_a", "group": "a", "a": {"movies": [movie("Amelie", 2001)]}},
+        {"id": "year_2001_m", "year": 2001, "pk": "2001_m", "group": "m", "m": {"movies": [movie("Memento", 2001)]}},
+        {"id": "year_2002", "year": 2002, "pk": 2002, "s": {"movies": [movie("Signs", 2002)]}}
+    ], key="pk")
+    layouts = YearLayouts()
+
+    assert sorted(doc['id'] for doc in read(container, 2001, layouts)) == ["year_2001_a", "year_2001_m"]
+    assert container.calls == ["read", "cross-partition query"]
+    container.calls.clear()
+    assert [doc['id'] for doc in read(container, 2002, layouts)] == ["year_2002"]
+    assert container.calls == ["read"]
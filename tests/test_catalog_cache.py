@@ -0,0 +1,158 @@
+"""
+Unit tests for the catalog cache's stale-while-revalidate refreshes.
+
+Run with: python -m pytest tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError  # noqa: E402
+
+from catalog import CatalogCache  # noqa: E402
+
+
+class ClientConnection:
+    def __init__(self):
+        self.last_response_headers = {}
+
+
+class Container:
+    """Year documents without a catalog snapshot, and a change feed that reports every write"""
+
+    def __init__(self, documents, change_feed=True):
+        self.documents = documents
+        self.change_feed = change_feed
+        self.version = 0
+        self.client_connection = ClientConnection()
+
+    def write(self, document):
+        self.documents = [doc for doc in self.documents if doc['id'] != document['id']] + [document]
+        self.version += 1
+
+    async def read_item(self, item, partition_key):
+        raise CosmosResourceNotFoundError(message="Not found")
+
+    def query_items(self, query, parameters):
+        async def items():
+            for doc in self.documents:
+                yield doc
+        return items()
+
+    def query_items_change_feed(self, is_start_from_beginning=True, continuation=None):
+        if not self.change_feed:
+            raise CosmosHttpResponseError(message="Change feed unavailable")
+        since = int(continuation) if continuation is not None else self.version
+        self.client_connection.last_response_headers = {'etag': str(self.version)}
+
+        async def changes():
+            for _ in range(since, self.version):
+                yield {}
+        return changes()
+
+
+class Provider:
+    def __init__(self, container):
+        self.container = container
+
+    async def run(self, operation):
+        return await operation(self.container)
+
+
+def year_document(year, *titles):
+    return {"id": f"year_{year}", "year": year,
+            "m": {"movies": [{"title": title, "genre": "Drama", "year": year} for title in titles]}}
+
+
+def titles(snapshot):
+    return [movie['title'] for movie in snapshot.movies]
+
+
+def poll_due(cache):
+    cache._last_poll -= cache.change_feed_interval
+
+
+def test_change_is_served_stale_then_picked_up_in_the_background():
+    container = Container([year_document(1999, "Magnolia")])
+    cache = CatalogCache(Provider(container), ttl=300, change_feed_interval=30, max_stale=3600)
+
+    async def scenario():
+        assert titles(await cache.get()) == ["Magnolia"]
+        container.write(year_document(1999, "Magnolia", "Matrix"))
+        poll_due(cache)
+        # The old catalog is served at once while the refresh polls the feed and reloads
+        assert titles(await cache.get()) == ["Magnolia"]
+        await cache.wait_for_refresh()
+        assert titles(await cache.get()) == ["Magnolia", "Matrix"]
+
+    asyncio.run(scenario())
+    assert cache.stats == {"loads": 2, "stale_served": 1, "refreshes": 1, "refresh_failures": 0}
+
+
+def test_poll_without_changes_keeps_the_catalog():
+    container = Container([year_document(1999, "Magnolia")])
+    cache = CatalogCache(Provider(container), ttl=300, change_feed_interval=30, max_stale=3600)
+
+    async def scenario():
+        first = await cache.get()
+        poll_due(cache)
+        assert await cache.get() is first
+        await cache.wait_for_refresh()
+        assert await cache.get() is first
+
+    asyncio.run(scenario())
+    assert cache.stats == {"loads": 1, "stale_served": 1, "refreshes": 0, "refresh_failures": 0}
+
+
+def test_unavailable_change_feed_does_not_keep_the_catalog_stale():
+    container = Container([year_document(1999, "Magnolia")], change_feed=False)
+    cache = CatalogCache(Provider(container), ttl=300, change_feed_interval=30, max_stale=3600)
+
+    async def scenario():
+        await cache.get()
+        poll_due(cache)
+        await cache.get()
+        await cache.wait_for_refresh()
+        # The failed retry restarts the poll interval, so these are fresh hits
+        for _ in range(5):
+            await cache.get()
+
+    asyncio.run(scenario())
+    assert cache.stats["stale_served"] == 1
+    assert cache.stats["refreshes"] == 0
+
+
+def test_change_feed_recovers_after_a_failed_start():
+    container = Container([year_document(1999, "Magnolia")], change_feed=False)
+    cache = CatalogCache(Provider(container), ttl=300, change_feed_interval=30, max_stale=3600)
+
+    async def scenario():
+        await cache.get()
+        container.change_feed = True
+        poll_due(cache)
+        await cache.get()
+        await cache.wait_for_refresh()
+        container.write(year_document(2001, "Memento"))
+        poll_due(cache)
+        await cache.get()
+        await cache.wait_for_refresh()
+        assert titles(await cache.get()) == ["Magnolia", "Memento"]
+
+    asyncio.run(scenario())
+    assert cache.stats["refreshes"] == 1
+
+
+def test_catalog_past_its_max_staleness_is_reloaded_before_responding():
+    container = Container([year_document(1999, "Magnolia")])
+    cache = CatalogCache(Provider(container), ttl=300, change_feed_interval=30, max_stale=60)
+
+    async def scenario():
+        first = await cache.get()
+        container.write(year_document(2001, "Memento"))
+        first.loaded_at -= 400
+        assert titles(await cache.get()) == ["Magnolia", "Memento"]
+
+    asyncio.run(scenario())
+    assert cache.stats == {"loads": 2, "stale_served": 0, "refreshes": 0, "refresh_failures": 0}
@@ -0,0 +1,59 @@
+"""
+Unit tests for content negotiation and the columnar representation.
+
+Run with: python -m pytest tests
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from encoding import COLUMNAR_JSON, JSON, encode, negotiate_format, to_columns  # noqa: E402
+from movie_query import MovieQuery  # noqa: E402
+
+MOVIES = [
+    {"title": "Alien", "genre": "Horror", "year": 1979, "coverURL": "https://covers/alien.jpg"},
+    {"title": "Amelie", "genre": "Comedy", "year": 2001},
+    {"title": "Arrival", "genre": "Horror", "year": 2016}
+]
+
+
+def columnar(payload, fields=None):
+    body, media_type, _ = encode(payload, COLUMNAR_JSON, None, fields)
+    assert media_type == COLUMNAR_JSON
+    return json.loads(body)
+
+
+def test_columns_intern_genres():
+    assert to_columns(MOVIES) == {
+        "genres": ["Comedy", "Horror"],
+        "columns": {
+            "title": ["Alien", "Amelie", "Arrival"],
+            "genre": [1, 0, 1],
+            "year": [1979, 2001, 2016],
+            "coverURL": ["https://covers/alien.jpg", None, None],
+            "coverURLs": [None, None, None]
+        }
+    }
+
+
+def test_projected_rows_only_get_the_requested_columns():
+    query = MovieQuery.from_params({"fields": "title"})
+    body = columnar(query.apply(MOVIES), query.fields)
+
+    assert body == {"total": 3, "continuation": None, "columns": {"title": ["Alien", "Amelie", "Arrival"]}}
+
+
+def test_projected_genres_are_still_interned():
+    query = MovieQuery.from_params({"fields": "year,genre", "limit": "2"})
+    body = columnar(query.apply(MOVIES), query.fields)
+
+    assert body['genres'] == ["Comedy", "Horror"]
+    assert body['columns'] == {"year": [1979, 2001], "genre": [1, 0]}
+
+
+def test_format_negotiation_falls_back_to_json():
+    assert negotiate_format("application/vnd.movies.columnar+json") == COLUMNAR_JSON
+    assert negotiate_format("text/html, */*;q=0.8") == JSON
+    assert negotiate_format(None) == JSON
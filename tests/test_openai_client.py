@@ -0,0 +1,153 @@
+"""
+Unit tests for the Azure OpenAI client's circuit breaker.
+
+Run with: python -m pytest tests
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from openai_client import CircuitBreaker, CircuitOpenError, OpenAIClient, OpenAIError, _RetryableError  # noqa: E402
+
+RESET_TIMEOUT = 0.05
+
+
+def make_client(threshold=2):
+    client = OpenAIClient()
+    client.max_retries = 0
+    client.breaker = CircuitBreaker(threshold=threshold, reset_timeout=RESET_TIMEOUT)
+    return client
+
+
+async def succeed():
+    return "ok"
+
+
+async def fail():
+    raise _RetryableError("OpenAI API returned 503")
+
+
+async def open_circuit(client):
+    for _ in range(client.breaker.threshold):
+        with pytest.raises(OpenAIError):
+            await client._with_retries(fail)
+    assert client.breaker.state == "open"
+
+
+def test_opens_after_threshold_and_fails_fast():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+
+        calls = []
+
+        async def counted():
+            calls.append(1)
+            return "ok"
+
+        with pytest.raises(CircuitOpenError):
+            await client._with_retries(counted)
+        assert calls == []
+
+    asyncio.run(run())
+
+
+def test_successful_trial_closes_circuit():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+        await asyncio.sleep(RESET_TIMEOUT)
+
+        assert client.breaker.state == "half-open"
+        assert await client._with_retries(succeed) == "ok"
+        assert client.breaker.state == "closed"
+        assert client.breaker.failures == 0
+
+    asyncio.run(run())
+
+
+def test_failed_trial_reopens_circuit():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+        await asyncio.sleep(RESET_TIMEOUT)
+
+        with pytest.raises(OpenAIError):
+            await client._with_retries(fail)
+        assert client.breaker.state == "open"
+
+    asyncio.run(run())
+
+
+def test_only_one_trial_at_a_time():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+        await asyncio.sleep(RESET_TIMEOUT)
+
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        trial = asyncio.create_task(client._with_retries(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await client._with_retries(succeed)
+
+        release.set()
+        assert await trial == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_cancelled_trial_releases_slot():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+        await asyncio.sleep(RESET_TIMEOUT)
+
+        trial = asyncio.create_task(client._with_retries(lambda: asyncio.sleep(3600)))
+        await asyncio.sleep(0)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        assert await client._with_retries(succeed) == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_unexpected_error_in_trial_releases_slot():
+    async def run():
+        client = make_client()
+        await open_circuit(client)
+        await asyncio.sleep(RESET_TIMEOUT)
+
+        async def broken():
+            raise KeyError("choices")
+
+        with pytest.raises(KeyError):
+            await client._with_retries(broken)
+
+        assert client.breaker.state == "half-open"
+        assert await client._with_retries(succeed) == "ok"
+        assert client.breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_open_circuit_half_opens_after_reset_timeout():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=RESET_TIMEOUT)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.state == "half-open"
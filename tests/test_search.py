@@ -0,0 +1,85 @@
+"""
+Unit tests for the /searchmovies title index.
+
+Run with: python -m pytest tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from search import CatalogSearch, SearchIndex  # noqa: E402
+
+
+def movie(title, year=2000):
+    return {"title": title, "year": year, "genre": "Drama"}
+
+
+def titles(results):
+    return [result['title'] for result in results]
+
+
+class FakeTitles:
+    def __init__(self, movies):
+        self.by_title = {}
+        for m in movies:
+            self.by_title.setdefault(m['title'], []).append(m)
+
+
+class FakeSnapshot:
+    def __init__(self, movies):
+        self.titles = FakeTitles(movies)
+
+
+class FakeCatalog:
+    def __init__(self, movies):
+        self.snapshot = FakeSnapshot(movies)
+
+    async def get(self):
+        return self.snapshot
+
+
+def test_updating_a_copy_leaves_the_original_untouched():
+    index = SearchIndex()
+    index.update([movie("The Matrix"), movie("Alien")])
+
+    other = index.copy()
+    other.update([movie("The Matrix"), movie("The Matrix Reloaded", 2003)])
+
+    assert titles(index.search("alien")) == ["Alien"]
+    assert titles(index.search("matrix")) == ["The Matrix"]
+    assert titles(other.search("alien")) == []
+    assert titles(other.search("matrix")) == ["The Matrix", "The Matrix Reloaded"]
+
+
+def test_copy_matches_a_full_rebuild():
+    index = SearchIndex()
+    index.update([movie("Heat"), movie("Heathers"), movie("The Thing")])
+    movies = [movie("Heat"), movie("The Heat", 2013), movie("The Thing")]
+
+    other = index.copy()
+    other.update(movies)
+    rebuilt = SearchIndex()
+    rebuilt.update(movies)
+
+    assert other.postings.keys() == rebuilt.postings.keys()
+    for query in ("heat", "thing", "hea"):
+        assert titles(other.search(query)) == titles(rebuilt.search(query))
+
+
+def test_catalog_search_swaps_in_a_new_index():
+    async def run():
+        catalog = FakeCatalog([movie("Alien")])
+        search = CatalogSearch(catalog)
+        first = await search.get()
+        assert titles(first.search("alien")) == ["Alien"]
+        assert await search.get() is first
+
+        catalog.snapshot = FakeSnapshot([movie("Alien"), movie("Aliens", 1986)])
+        second = await search.get()
+        assert second is not first
+        assert titles(first.search("aliens")) == ["Alien"]
+        assert titles(second.search("aliens"))[0] == "Aliens"
+
+    asyncio.run(run())
@@ -0,0 +1,157 @@
+"""
+Unit tests for incremental seeding: merging years written over several
+flushes, skipping unchanged items and deleting obsolete ones.
+
+Run with: python -m pytest tests
+"""
+import copy
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError  # noqa: E402
+
+from document_layout import build_items, document_movies, resolve_layouts  # noqa: E402
+from seed_data import SeedWriter, YearBuffers, get_stored_hashes  # noqa: E402
+
+
+class Container:
+    """A /year-partitioned container that records every write and delete"""
+
+    def __init__(self):
+        self.items = {}
+        self.writes = []
+        self._lock = threading.Lock()
+
+    def query_items(self, query, parameters, partition_key=None, enable_cross_partition_query=None):
+        with self._lock:
+            items = [copy.deepcopy(item) for (_, year), item in self.items.items()
+                     if partition_key is None or year == partition_key]
+        if query.startswith("SELECT c.id"):
+            return [{"id": item['id'], "year": item['year'], "contentHash": item.get('contentHash')}
+                    for item in items]
+        return items
+
+    def upsert_item(self, body, response_hook=None):
+        with self._lock:
+            self.items[(body['id'], body['year'])] = copy.deepcopy(body)
+            self.writes.append(("upsert", body['id']))
+
+    def delete_item(self, item, partition_key, response_hook=None):
+        with self._lock:
+            if (item, partition_key) not in self.items:
+                raise CosmosResourceNotFoundError(message="Not found")
+            del self.items[(item, partition_key)]
+            self.writes.append(("delete", item))
+
+    def store(self, items):
+        for item in items:
+            self.upsert_item(item)
+        self.writes.clear()
+
+    def movies(self, year):
+        documents = [item for (_, stored_year), item in self.items.items() if stored_year == year]
+        movies = document_movies(resolve_layouts(documents))
+        return sorted((movie['title'], movie.get('coverURL')) for movie in movies)
+
+
+def movie(title, year=2000):
+    return {"title": title, "genre": "Drama", "year": year}
+
+
+def seed(container, movies, layout="year", buffer_size=1000, split_bytes=0):
+    writer = SeedWriter(container, get_stored_hashes(container), 2, layout, split_bytes)
+    buffers = YearBuffers(writer, buffer_size)
+    for m in movies:
+        buffers.add(m)
+    buffers.finish()
+    writer.delete_removed(buffers.seen_years)
+    assert writer.close()
+    return writer
+
+
+def test_unchanged_items_are_not_written_again():
+    container = Container()
+    movies = [movie("Alien", 1979), movie("Amelie", 2001), movie("Memento", 2001)]
+    seed(container, movies)
+    container.writes.clear()
+
+    writer = seed(container, movies)
+    assert container.writes == []
+    assert writer.unchanged_years() == {1979, 2001}
+
+    seed(container, movies + [movie("Magnolia", 1999)])
+    assert container.writes == [("upsert", "year_1999")]
+
+
+def test_year_over_several_flushes_is_merged_and_counted_once_unchanged():
+    container = Container()
+    stored = [movie(title) for title in ("Alpha", "Bravo", "Charlie", "Delta")]
+    container.store(build_items(2000, stored))
+    container.items[("year_2000", 2000)]['a']['movies'][0]['coverURL'] = "https://covers/alpha.jpg"
+
+    # A buffer of two flushes the year three times; Delta is no longer in the input
+    movies = [movie(title) for title in ("Alpha", "Bravo", "Charlie", "Echo", "Foxtrot")]
+    seed(container, movies, buffer_size=2)
+
+    assert container.movies(2000) == [
+        ("Alpha", "https://covers/alpha.jpg"), ("Bravo", None), ("Charlie", None), ("Echo", None), ("Foxtrot", None)
+    ]
+
+    container.writes.clear()
+    writer = seed(container, movies, buffer_size=2)
+    assert container.writes == []
+    assert writer.unchanged_years() == {2000}
+
+
+def test_earlier_flushes_keep_every_stored_movie_until_the_last_one():
+    container = Container()
+    container.store(build_items(2000, [movie(title) for title in ("Alpha", "Bravo", "Delta")]))
+    writer = SeedWriter(container, get_stored_hashes(container), 1)
+
+    writer.submit(2000, [movie("Alpha"), movie("Echo")], first=True, final=False)
+    # One worker runs flushes in order, so this waits for the first one
+    writer._executor.submit(lambda: None).result()
+    assert container.movies(2000) == [("Alpha", None), ("Bravo", None), ("Delta", None), ("Echo", None)]
+
+    writer.submit(2000, [movie("Bravo")], first=False, final=True)
+    assert writer.close()
+    assert container.movies(2000) == [("Alpha", None), ("Bravo", None), ("Echo", None)]
+
+
+def test_previous_layout_is_deleted_only_after_the_last_flush():
+    container = Container()
+    container.store(build_items(2000, [movie(title) for title in ("Alpha", "Bravo", "Charlie")]))
+
+    # Too big for one year document, so the year moves to letter items
+    seed(container, [movie(title) for title in ("Alpha", "Bravo", "Charlie", "Delta")], buffer_size=2,
+         split_bytes=300)
+
+    assert container.writes[-1] == ("delete", "year_2000")
+    assert sorted(doc_id for doc_id, _ in container.items) == [f"year_2000_{group}" for group in "abcd"]
+    assert container.movies(2000) == [("Alpha", None), ("Bravo", None), ("Charlie", None), ("Delta", None)]
+
+
+def test_layout_change_deletes_the_items_it_replaces():
+    container = Container()
+    movies = [movie("Alien", 1979), movie("Aliens", 1979), movie("Blade Runner", 1979)]
+    seed(container, movies, layout="movie")
+    movie_items = sorted(doc_id for doc_id, _ in container.items)
+    container.writes.clear()
+
+    seed(container, movies, layout="letter")
+
+    assert sorted(doc_id for doc_id, _ in container.items) == ["year_1979_a", "year_1979_b"]
+    assert sorted(doc_id for action, doc_id in container.writes if action == "delete") == movie_items
+
+
+def test_years_missing_from_the_input_are_deleted():
+    container = Container()
+    seed(container, [movie("Alien", 1979), movie("Amelie", 2001)])
+    container.writes.clear()
+
+    seed(container, [movie("Amelie", 2001)])
+
+    assert container.writes == [("delete", "year_1979")]
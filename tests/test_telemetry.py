@@ -0,0 +1,83 @@
+"""
+Unit tests for per-request telemetry and the choice of exporter.
+
+Run with: python -m pytest tests
+"""
+import asyncio
+import logging
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'movie-api'))
+
+from telemetry import (INSTRUMENTED_LIBRARIES, AzureMonitorExporter, InMemoryExporter, LoggingExporter,  # noqa: E402
+                       Telemetry, default_exporter)
+
+
+class Response:
+    status_code = 200
+    body = b"{}"
+
+
+def test_instrument_exports_phases_and_metrics():
+    telemetry = Telemetry(exporter=InMemoryExporter(), sample_rate=1)
+
+    @telemetry.instrument("getmovies")
+    async def handler(req):
+        with telemetry.phase("cosmos"):
+            telemetry.add(cosmos_ru=2.5)
+        telemetry.set(catalog_cache="hit")
+        return Response()
+
+    asyncio.run(handler(None))
+
+    [dimensions] = telemetry.exporter.items
+    assert dimensions["route"] == "getmovies"
+    assert dimensions["status"] == 200
+    assert dimensions["cosmos_ru"] == 2.5
+    assert dimensions["catalog_cache"] == "hit"
+    assert dimensions["response_bytes"] == 2
+    assert "cosmos_ms" in dimensions
+
+
+def test_default_exporter_logs_without_a_connection_string(monkeypatch):
+    monkeypatch.delenv("APPLICATIONINSIGHTS_CONNECTION_STRING", raising=False)
+    monkeypatch.delenv("TELEMETRY_EXPORTER", raising=False)
+    assert isinstance(default_exporter(), LoggingExporter)
+
+    monkeypatch.setenv("TELEMETRY_EXPORTER", "memory")
+    assert isinstance(default_exporter(), InMemoryExporter)
+
+
+def test_logging_exporter_puts_the_fields_in_the_message(caplog):
+    with caplog.at_level(logging.INFO, logger="telemetry"):
+        LoggingExporter().export({"route": "getmovies", "status": 200})
+    assert caplog.messages == ['Telemetry {"route": "getmovies", "status": 200}']
+
+
+def test_azure_monitor_is_configured_on_first_export_without_instrumentations(monkeypatch):
+    calls = []
+    module = types.ModuleType("azure.monitor.opentelemetry")
+    module.configure_azure_monitor = lambda **options: calls.append(options)
+    monkeypatch.setitem(sys.modules, "azure.monitor.opentelemetry", module)
+
+    exporter = AzureMonitorExporter("InstrumentationKey=test", logger_name="telemetry-test")
+    assert calls == []
+
+    exporter.export({"route": "getmovies"})
+    exporter.export({"route": "getmovies"})
+    [options] = calls
+    assert options["logger_name"] == "telemetry-test"
+    assert options["disable_tracing"] and options["disable_metrics"]
+    assert set(options["instrumentation_options"]) == set(INSTRUMENTED_LIBRARIES)
+    assert not any(option["enabled"] for option in options["instrumentation_options"].values())
+
+
+def test_azure_monitor_falls_back_to_logging_when_it_cannot_be_set_up(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "azure.monitor.opentelemetry", None)
+    exporter = AzureMonitorExporter("InstrumentationKey=test", logger_name="telemetry-fallback")
+
+    with caplog.at_level(logging.INFO, logger="telemetry-fallback"):
+        exporter.export({"route": "getmovies"})
+    assert caplog.messages[-1] == 'Telemetry {"route": "getmovies"}'